@@ -0,0 +1,41 @@
+# Admission control for bursts of new connections.
+#
+# When an event starts, thousands of players connect within seconds. The
+# accept loops take a token from a TokenBucket for every connection, so
+# handshakes are admitted at a steady rate (with some burst allowance)
+# while the rest wait in the kernel's listen backlog; players already in a
+# game keep being served in the meantime. Handshakes themselves run on a
+# fixed number of workers (threads mode) or are counted against a limit
+# (selectors mode), so a flood of half-open handshakes cannot tie up the
+# server either.
+import time
+
+
+class TokenBucket:
+    # Not thread-safe: each accept loop owns its bucket
+
+    def __init__(self, rate, burst):
+        # rate tokens per second, at most burst saved up; a rate of 0
+        # never runs out
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        # Seconds until a token is available; 0 if one is now
+        if not self.rate:
+            return 0.0
+        self.refill(time.monotonic())
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        # Use up one token; call after delay() returned 0
+        if self.rate:
+            self.tokens -= 1
@@ -0,0 +1,31 @@
+# Helpers shared by the benchmarks: a free local port, a sink for an
+# in-process server's log queue, a generated question file and percentiles.
+import socket
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def drain_log_queue(server):
+    # Run in a daemon thread so an in-process server's log never fills up
+    while True:
+        server.log_queue.get()
+
+
+def write_questions(path, rounds, question_bytes=40):
+    # A question file of `rounds` questions whose text is about
+    # question_bytes long; A is always the right answer
+    with open(path, "w") as f:
+        for i in range(rounds):
+            text = f"Question {i}: " + "x" * max(0, question_bytes - 14)
+            f.write(f"{text}\nA - one\nB - two\nC - three\nAnswer: A\n")
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
@@ -0,0 +1,147 @@
+# Room lock hold time per ANSWER, by lobby size.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_answer_ingest --players 100,1000,10000
+#
+# Every player of an in-process room answers one question through
+# GameRoom.receive_answer, with the room lock swapped for a TimedLock that
+# keeps every hold time. "legacy" reproduces the old record_answer, which
+# scanned the answered_players list, re-normalized the correct answer and
+# formatted and logged its messages while holding the lock, so its hold
+# time grew with the number of players who had already answered.
+import argparse
+import random
+import threading
+import time
+
+from benchmarks._common import percentile
+from metrics import TimedLock
+from quiz_engine import QuizServer
+
+
+class Samples:
+    # Stands in for a metrics histogram and keeps the raw observations
+    def __init__(self):
+        self.values = []
+
+    def observe(self, value):
+        self.values.append(value)
+
+
+class NullConnection:
+    def __init__(self, username):
+        self.username = username
+        self.caps = set()
+        self.rtt = None
+        self.written_at = None
+
+    def send(self, data):
+        return True
+
+
+def legacy_record_answer(room, username, answer):
+    with room.lock:
+        if username in room.legacy_answered:
+            return
+
+        room.log(f"Player {username} submitted answer: {answer}")
+
+        room.legacy_answered.append(username)
+        room.server.answers_total.inc()
+        room.outstanding.discard(username)
+        if not room.outstanding:
+            room.round_done.notify_all()
+
+        correct_answer = room.questions[room.active_question_idx]["Answer"][-1].strip().upper()
+        answer = answer.strip().upper()
+
+        if answer == correct_answer:
+            room.legacy_correct.append(username)
+            n_players = len(room.players)
+            position = len(room.legacy_correct)
+            points_awarded = n_players if position == 1 else 1
+            room.legacy_scores[username] = points_awarded
+            if position <= 3:
+                suffix = "st" if position == 1 else "nd" if position == 2 else "rd"
+                msg = (
+                    f"RESULT:CORRECT:Congratulations! "
+                    f"You are the {position}{suffix} person to answer correctly. "
+                    f"Points earned: {points_awarded}"
+                )
+                room.log(f"{username} answered correctly ({position}{suffix}) +{points_awarded} pts")
+            else:
+                msg = f"RESULT:CORRECT:Congratulations! Points earned: {points_awarded}"
+                room.log(f"{username} answered correctly +{points_awarded} pts")
+            room.legacy_results[username] = msg
+        else:
+            msg = f"RESULT:WRONG:Wrong Answer! Correct answer: {correct_answer}."
+            room.legacy_results[username] = msg
+            room.log(f"{username} answered incorrectly.")
+
+        room.answers_by_player[username].append({
+            "question_index": room.active_question_idx,
+            "answer": answer,
+            "correct": answer == correct_answer,
+        })
+
+
+def make_room(players):
+    # The default room of an unstarted server, with players seated and the
+    # first question open
+    server = QuizServer()
+    room = server.room()
+    wait, hold = Samples(), Samples()
+    room.lock = TimedLock(wait, hold)
+    room.round_done = threading.Condition(room.lock)
+
+    for name in players:
+        room.players[name] = NullConnection(name)
+        room.answers_by_player[name] = []
+        room.player_scores[name] = 0
+
+    room.questions = [{"question": "Q", "A": "a", "B": "b", "C": "c", "Answer": "Answer: B"}]
+    room.active_question_idx = 0
+    room.round_answer = "B"
+    room.outstanding = set(players)
+    room.round_started = time.monotonic()
+    room.round_open = True
+    room.game_running = True
+
+    room.legacy_answered = []
+    room.legacy_correct = []
+    room.legacy_results = {}
+    room.legacy_scores = {}
+    return room, hold
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", default="100,1000,10000", help="comma-separated lobby sizes")
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    us = 1e6
+    print(f"{'players':>8} {'variant':>8} {'hold p50 us':>12} {'hold p99 us':>12} {'hold max us':>12} "
+          f"{'call mean us':>13}")
+    for n in (int(x) for x in args.players.split(",")):
+        rng = random.Random(args.seed)
+        players = [f"player{i}" for i in range(n)]
+        answers = [(name, rng.choice("ABC")) for name in players]
+
+        for variant in ("legacy", "sets"):
+            room, hold = make_room(players)
+            record = room.receive_answer if variant == "sets" else (
+                lambda name, answer, room=room: legacy_record_answer(room, name, answer))
+
+            start = time.perf_counter()
+            for name, answer in answers:
+                record(name, answer)
+            elapsed = time.perf_counter() - start
+
+            print(f"{n:>8} {variant:>8} {percentile(hold.values, 50) * us:12.2f} "
+                  f"{percentile(hold.values, 99) * us:12.2f} {max(hold.values) * us:12.2f} "
+                  f"{elapsed / n * us:13.2f}")
+
+
+if __name__ == "__main__":
+    main()
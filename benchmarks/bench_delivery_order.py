@@ -0,0 +1,201 @@
+# Does the fastest player win when the question reaches players at
+# different times? Answers ranked by arrival at the server against answers
+# ranked by time since each player's own question was written.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_delivery_order --players 1000 --rounds 20
+#
+# An in-process server hosts a game for N raw-socket players, which run in
+# a separate load process. The question is written to the players one after
+# another, in join order. Every round each player answers correctly after a
+# random reaction time (uniform over --reaction seconds) from the moment its
+# question arrives, so the rightful winner is the player that reacted
+# fastest. The load process reports every reaction time; the benchmark
+# reads the room's correct answers of every round, which carry both their
+# arrival order and the ranking key the server uses, and each connection's
+# written_at.
+#
+# It reports the spread of question write times across players and, for
+# both rankings, how often the fastest player came first, the winner's
+# median rank among all reaction times (1 is the fastest) and where in the
+# write order the winner was on average (50% when the order does not
+# matter). The load process reads its sockets one after another on one
+# thread, roughly in write order, so late players still see their question
+# a little later than the server wrote it; real players each have their own
+# machine and do not.
+import argparse
+import heapq
+import json
+import os
+import random
+import selectors
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks._common import drain_log_queue, free_port, write_questions
+from question_bank import compiled_path
+from quiz_engine import DEFAULT_ROOM, QuizServer
+
+MARKER = b"QUESTION:"
+
+# Seconds after a round starts at which its question writes are read
+WRITE_WAIT = 0.03
+
+
+def play(port, players, reaction, seed):
+    # Load process role: answer every question after a random reaction
+    # time, then print each round's reaction times as JSON
+    rng = random.Random(seed)
+    sel = selectors.DefaultSelector()
+    for i in range(players):
+        s = socket.create_connection(("127.0.0.1", port))
+        s.sendall(f"p{i}\nCAPS:scoredelta\n".encode())
+        s.setblocking(False)
+        sel.register(s, selectors.EVENT_READ, [f"p{i}", b""])
+    due = []                        # (time.monotonic() to answer, sequence, socket)
+    seq = 0
+    reactions = []                  # per round: username -> reaction time
+    open_socks = players
+    while open_socks:
+        timeout = max(0.0, due[0][0] - time.monotonic()) if due else 30
+        for key, _ in sel.select(timeout=timeout):
+            try:
+                data = key.fileobj.recv(1 << 16)
+            except BlockingIOError:
+                continue
+            if not data:
+                sel.unregister(key.fileobj)
+                key.fileobj.close()
+                open_socks -= 1
+                continue
+            now = time.monotonic()
+            name, tail = key.data
+            window = tail + data
+            questions = window.count(MARKER) - tail.count(MARKER)
+            key.data[1] = data[-8:]
+            for _ in range(questions):
+                seen = sum(1 for r in reactions if name in r)
+                if seen == len(reactions):
+                    reactions.append({})
+                delay = rng.uniform(*reaction)
+                reactions[seen][name] = delay
+                seq += 1
+                heapq.heappush(due, (now + delay, seq, key.fileobj))
+        now = time.monotonic()
+        while due and due[0][0] <= now:
+            _, _, sock = heapq.heappop(due)
+            try:
+                sock.sendall(b"ANSWER:A\n")
+            except OSError:
+                pass
+    print(json.dumps(reactions), flush=True)
+
+
+def watch_rounds(room, rounds, stop):
+    # Keep each round's list of correct answers, which the room replaces
+    # when the next round starts, and the question write times once the
+    # broadcast is over (well before the quickest reaction)
+    current = None
+    while not stop.is_set():
+        correct = room.round_correct
+        if correct is not current and room.round_started is not None:
+            current = correct
+            rounds.append({"started": room.round_started, "correct": correct, "written": None})
+        if rounds and rounds[-1]["written"] is None and time.monotonic() - rounds[-1]["started"] > WRITE_WAIT:
+            started = rounds[-1]["started"]
+            rounds[-1]["written"] = [
+                c.written_at for c in list(room.players.values())
+                if c.written_at is not None and c.written_at >= started
+            ]
+        time.sleep(0.001)
+
+
+def run(args, question_file):
+    port = free_port()
+    server = QuizServer("127.0.0.1", port, "selectors")
+    threading.Thread(target=drain_log_queue, args=(server,), daemon=True).start()
+    server.start_server()
+    time.sleep(0.3)
+
+    load = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_delivery_order", "--play", str(port),
+         "--players", str(args.players), "--reaction", args.reaction, "--seed", str(args.seed)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    room = server.room(DEFAULT_ROOM)
+    while len(room.players) < args.players:
+        time.sleep(0.05)
+    time.sleep(0.5)
+    # Write order of every broadcast: the room's join order
+    order = {name: i for i, name in enumerate(room.players)}
+
+    rounds = []
+    stop = threading.Event()
+    watcher = threading.Thread(target=watch_rounds, args=(room, rounds, stop))
+    watcher.start()
+    server.start_game(args.rounds, question_file)
+    room.game_thread.join()
+    stop.set()
+    watcher.join()
+    server.shutdown()
+    reactions = json.loads(load.communicate(timeout=60)[0])
+
+    spreads = []
+    reaction_ranks = {"arrival": [], "question": []}
+    positions = {"arrival": [], "question": []}
+    for state, reacted in zip(rounds, reactions):
+        if state["written"]:
+            spreads.append(max(state["written"]) - min(state["written"]))
+        correct = state["correct"]
+        if not correct:
+            continue
+        by_reaction = sorted(reacted, key=reacted.get)
+        winners = {"arrival": min(correct, key=lambda e: e[1])[2], "question": min(correct)[2]}
+        for mode, winner in winners.items():
+            reaction_ranks[mode].append(by_reaction.index(winner) + 1)
+            positions[mode].append(order[winner] / args.players)
+    return spreads, reaction_ranks, positions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--reaction", default="0.05,0.15", help="reaction time range, seconds")
+    parser.add_argument("--question-bytes", type=int, default=200, help="length of each question text")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--play", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.play:
+        play(args.play, args.players, tuple(float(x) for x in args.reaction.split(",")), args.seed)
+        return
+
+    fd, question_file = tempfile.mkstemp(suffix=".txt")
+    os.close(fd)
+    try:
+        write_questions(question_file, args.rounds, args.question_bytes)
+        spreads, reaction_ranks, positions = run(args, question_file)
+        ms = 1000
+        print(f"{args.players} players, {args.rounds} rounds, reactions {args.reaction} s")
+        print(f"question write spread: mean {statistics.mean(spreads) * ms:.2f} ms, "
+              f"max {max(spreads) * ms:.2f} ms")
+        print(f"{'ranked by':<22} {'fastest first':>14} {'winner reaction rank':>21} {'winner position':>16}")
+        for mode, label in (("arrival", "arrival at server"), ("question", "time since question")):
+            ranks = reaction_ranks[mode]
+            fastest = sum(1 for rank in ranks if rank == 1)
+            print(f"{label:<22} {fastest:>8d}/{len(ranks):<5d} {statistics.median(ranks):21.0f} "
+                  f"{statistics.mean(positions[mode]) * 100:15.0f}%")
+    finally:
+        for path in (question_file, compiled_path(question_file)):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
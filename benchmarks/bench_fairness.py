@@ -0,0 +1,173 @@
+# Answer ordering fairness with mixed-latency players.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_fairness --bots 20 --rounds 20 --latencies 0,25,50,90
+#
+# An in-process server hosts a game for bots on one asyncio loop. Each bot
+# is given a one-way network latency (spread over --latencies, in ms) that
+# every line it receives and sends is held back by, plus a little jitter,
+# so its heartbeat round trip, the question's way out and the answer's way
+# back all pay for it. Every round each bot takes a random reaction time
+# (uniform over --reaction seconds) between seeing the question and
+# sending its answer, and every answer is correct, so the rightful winner
+# of a round is the bot that reacted fastest.
+#
+# The game is played twice: without latency compensation ("arrival",
+# max_compensation 0; in a room this small every question is written at
+# practically the same moment, so answers rank by arrival) and with the
+# server's RTT compensation ("compensated"). For each mode the benchmark
+# reports how often the fastest bot was ranked first, how far first place
+# typically was from the fastest reaction, and the share of rounds each
+# latency group won, which should follow its share of fastest reactions.
+import argparse
+import asyncio
+import collections
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks._common import drain_log_queue, free_port, write_questions
+from question_bank import compiled_path
+from quiz_engine import DEFAULT_ROOM, MAX_COMPENSATION, QuizServer
+
+
+class Bot:
+
+    def __init__(self, name, latency, jitter, reaction, rng):
+        self.name = name
+        self.latency = latency      # one-way, seconds
+        self.jitter = jitter
+        self.reaction = reaction    # (low, high) seconds
+        self.rng = rng
+        self.writer = None
+        self.recv_at = 0.0          # keeps delayed lines in order
+        self.send_at = 0.0
+        self.reactions = []         # reaction time of every round
+        self.firsts = set()         # rounds this bot was ranked first in
+        self.done = asyncio.Event()
+
+    def delay(self, last):
+        # Loop time at which a line sent or received now gets through; the
+        # loop runs callbacks due at the same time in any order, so lines
+        # are kept strictly apart
+        loop = asyncio.get_running_loop()
+        return max(last + 1e-6, loop.time() + self.latency + self.rng.uniform(0, self.jitter))
+
+    async def run(self, port):
+        reader, self.writer = await asyncio.open_connection("127.0.0.1", port)
+        self.writer.write(f"{self.name}\nCAPS:heartbeat\n".encode())
+        loop = asyncio.get_running_loop()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            self.recv_at = self.delay(self.recv_at)
+            loop.call_at(self.recv_at, self.deliver, line.decode().strip())
+        # Lines still on their way are delivered first
+        loop.call_at(self.delay(self.recv_at), self.done.set)
+
+    def send(self, line):
+        self.send_at = self.delay(self.send_at)
+        asyncio.get_running_loop().call_at(self.send_at, self.writer.write, (line + "\n").encode())
+
+    def deliver(self, line):
+        # A line reaching the simulated player
+        if line.startswith("PING:"):
+            self.send("PONG:" + line[5:])
+        elif line.startswith("QUESTION:"):
+            reaction = self.rng.uniform(*self.reaction)
+            self.reactions.append(reaction)
+            asyncio.get_running_loop().call_later(reaction, self.send, "ANSWER:A")
+        elif line.startswith("RESULT:CORRECT:") and "the 1st person" in line:
+            self.firsts.add(len(self.reactions) - 1)
+        elif line == "GAMEOVER":
+            self.done.set()
+
+
+async def play(server, port, bots, rounds, question_file):
+    tasks = [asyncio.ensure_future(bot.run(port)) for bot in bots]
+    room = server.room(DEFAULT_ROOM)
+    while len(room.players) < len(bots):
+        await asyncio.sleep(0.05)
+    # Let a few heartbeats measure every bot's round trip
+    await asyncio.sleep(2.0)
+    rtts = {c.username: c.rtt for c in server.fanout.open_connections() if c.username}
+
+    server.start_game(rounds, question_file)
+    await asyncio.wait_for(asyncio.gather(*(bot.done.wait() for bot in bots)), 30 + rounds * 5)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return rtts
+
+
+def run(mode, args, question_file):
+    latencies = [float(ms) / 1000 for ms in args.latencies.split(",")]
+    reaction = tuple(float(x) for x in args.reaction.split(","))
+    rng = random.Random(args.seed)
+    bots = [Bot(f"bot{i}", latencies[i % len(latencies)], args.jitter, reaction,
+                random.Random(rng.random())) for i in range(args.bots)]
+
+    port = free_port()
+    server = QuizServer("127.0.0.1", port, "selectors", idle_timeout=1.5,
+                        max_compensation=MAX_COMPENSATION if mode == "compensated" else 0)
+    threading.Thread(target=drain_log_queue, args=(server,), daemon=True).start()
+    server.start_server()
+    time.sleep(0.3)
+    try:
+        rtts = asyncio.run(play(server, port, bots, args.rounds, question_file))
+    finally:
+        server.shutdown()
+
+    fastest_won = 0
+    margins = []
+    wins = collections.Counter()
+    fastest = collections.Counter()
+    for r in range(args.rounds):
+        quickest = min(bots, key=lambda b: b.reactions[r])
+        fastest[quickest.latency] += 1
+        winner = next((b for b in bots if r in b.firsts), None)
+        if winner is None:
+            continue
+        wins[winner.latency] += 1
+        fastest_won += winner is quickest
+        margins.append(winner.reactions[r] - quickest.reactions[r])
+    return latencies, rtts, bots, fastest_won, margins, wins, fastest
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bots", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--latencies", default="0,25,50,90", help="one-way latencies in ms, spread over the bots")
+    parser.add_argument("--jitter", type=float, default=0.005, help="extra random delay per line, seconds")
+    parser.add_argument("--reaction", default="0.3,0.9", help="reaction time range, seconds")
+    parser.add_argument("--seed", type=int, default=5)
+    args = parser.parse_args()
+
+    fd, question_file = tempfile.mkstemp(suffix=".txt")
+    os.close(fd)
+    ms = 1000
+    try:
+        write_questions(question_file, args.rounds)
+        print(f"{args.bots} bots, {args.rounds} rounds, one-way latencies {args.latencies} ms")
+        for mode in ("arrival", "compensated"):
+            latencies, rtts, bots, fastest_won, margins, wins, fastest = run(mode, args, question_file)
+            print(f"\n{mode}: fastest bot ranked first in {fastest_won}/{args.rounds} rounds, "
+                  f"first place {statistics.mean(margins) * ms:.0f} ms slower than the fastest on average")
+            print(f"  {'latency':>8} {'est. RTT':>9} {'fastest':>8} {'won':>5}")
+            for latency in latencies:
+                estimates = [rtts[b.name] for b in bots if b.latency == latency and rtts.get(b.name) is not None]
+                rtt = f"{statistics.mean(estimates) * ms:.0f}" if estimates else "-"
+                print(f"  {latency * ms:8.0f} {rtt:>9} {fastest[latency]:8d} {wins[latency]:5d}")
+    finally:
+        for path in (question_file, compiled_path(question_file)):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
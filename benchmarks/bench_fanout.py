@@ -0,0 +1,156 @@
+# Question delivery time to the last of N players with stalled clients.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_fanout --players 500 --stalled 5
+#
+# N reading clients and S clients that never read are connected over
+# loopback. Both kinds first receive several MB of filler so the stalled
+# clients' socket buffers are full. Then a QUESTION line is broadcast R
+# times and the time until the last reading client has it is recorded.
+#
+# "blocking" is the old approach: sendall() to each socket in turn (stalled
+# sockets get a 1 s timeout so the benchmark terminates at all).
+# "fanout" uses outbound.FanOut with per-connection queues.
+import argparse
+import selectors
+import socket
+import statistics
+import threading
+import time
+
+from outbound import FanOut
+
+FILLER = b"SCOREBOARD:" + b"x" * 65524 + b"\n"
+QUESTION = b"QUESTION:What does CPU stand for?:A:B:C\n"
+
+
+def connect_pairs(count, small_buffers=False):
+    # Returns (server_side, client_side) socket pairs over loopback TCP.
+    # Small buffers make a non-reading client stall after ~100 KB instead
+    # of the several MB loopback autotuning would otherwise allow.
+    listener = socket.create_server(("127.0.0.1", 0), backlog=max(count, 1))
+    port = listener.getsockname()[1]
+    pairs = []
+    for _ in range(count):
+        client = socket.socket()
+        if small_buffers:
+            client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16384)
+        client.connect(("127.0.0.1", port))
+        server_side, _ = listener.accept()
+        if small_buffers:
+            server_side.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 16384)
+        pairs.append((server_side, client))
+    listener.close()
+    return pairs
+
+
+class Readers:
+    # Drains every reading client and timestamps each QUESTION line
+    def __init__(self, clients):
+        self.sel = selectors.DefaultSelector()
+        for c in clients:
+            c.setblocking(False)
+            self.sel.register(c, selectors.EVENT_READ, [b""])
+        self.arrivals = []
+        self.lock = threading.Lock()
+        self.running = True
+        threading.Thread(target=self.loop, daemon=True).start()
+
+    def loop(self):
+        while self.running:
+            for key, _ in self.sel.select(timeout=0.1):
+                try:
+                    data = key.fileobj.recv(262144)
+                except BlockingIOError:
+                    continue
+                buf = key.data[0] + data
+                n = buf.count(QUESTION)
+                if n:
+                    now = time.perf_counter()
+                    with self.lock:
+                        self.arrivals.extend([now] * n)
+                    buf = buf[buf.rfind(QUESTION) + len(QUESTION):]
+                key.data[0] = buf[-len(QUESTION):]
+
+    def wait_for(self, count, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if len(self.arrivals) >= count:
+                    last = max(self.arrivals)
+                    self.arrivals.clear()
+                    return last
+            time.sleep(0.0005)
+        raise RuntimeError("question was not delivered to every player")
+
+
+def run(mode, n_players, n_stalled, rounds, max_queue_kib):
+    # Stalled clients go first so a sequential sender hits them early
+    stalled = connect_pairs(n_stalled, small_buffers=True)
+    playing = connect_pairs(n_players)
+    pairs = stalled + playing
+    readers = Readers([c for _, c in playing])
+    server_socks = [s for s, _ in pairs]
+    # The blocking sender gives up on a stalled client after a second; the
+    # fan-out needs sockets without a timeout (see outbound.py)
+    for s, _ in stalled:
+        s.settimeout(1.0 if mode == "blocking" else None)
+
+    fanout = None
+    if mode == "fanout":
+        fanout = FanOut(max_queue_kib * 1024)
+        fanout.start()
+        conns = [fanout.connect(s, None) for s in server_socks]
+
+    def broadcast(data):
+        if fanout:
+            fanout.broadcast(conns, data)
+            return
+        for s in server_socks:
+            try:
+                s.sendall(data)
+            except OSError:
+                pass
+
+    # Fill the stalled clients' buffers
+    for _ in range(8):
+        broadcast(FILLER)
+    time.sleep(0.5)
+
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        broadcast(QUESTION)
+        last = readers.wait_for(n_players)
+        times.append((last - start) * 1000)
+
+    readers.running = False
+    stats = fanout.stats() if fanout else None
+    if fanout:
+        fanout.stop()
+    for s, c in pairs:
+        s.close()
+        c.close()
+    return times, stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, default=500)
+    parser.add_argument("--stalled", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--max-queue-kib", type=int, default=1024)
+    args = parser.parse_args()
+
+    print(f"{args.players} players, {args.stalled} stalled, {args.rounds} rounds")
+    for mode in ("blocking", "fanout"):
+        times, stats = run(mode, args.players, args.stalled, args.rounds, args.max_queue_kib)
+        line = (f"{mode:<9} last player gets question: mean {statistics.mean(times):8.2f} ms  "
+                f"max {max(times):8.2f} ms")
+        if stats:
+            line += f"  (evicted {stats['evictions']}, deferred {stats['bytes_deferred']} bytes)"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# Inbound message framing: parser cost and pipelined-client correctness.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_framing --bots 200 --pipeline 50
+#
+# Part one feeds a LineFramer a stream of ANSWER messages cut into random
+# chunk sizes (including splits inside multibyte characters) and reports
+# messages per second and allocations per message. It then compares the
+# old client receive loop (decode every 1 KiB read, concatenate, split)
+# with the LineFramer on one SCOREBOARD line of a large lobby; the old loop
+# rescans and copies the whole partial line on every read, and fails
+# outright when a read ends inside a multibyte character. Part two starts a
+# headless server; every bot writes all of its answers in a single send and
+# the benchmark checks that the server replied to each one. No game is
+# running, so each answer gets an ERROR:GAME_NOT_STARTED reply.
+import argparse
+import random
+import selectors
+import socket
+import threading
+import time
+import tracemalloc
+
+from benchmarks._common import drain_log_queue
+from framing import LineFramer
+from quiz_engine import GameRoom, QuizServer
+
+
+def random_chunks(data, rng):
+    chunks = []
+    i = 0
+    while i < len(data):
+        n = rng.randint(1, 2048)
+        chunks.append(data[i:i + n])
+        i += n
+    return chunks
+
+
+def bench_parser(n_messages):
+    rng = random.Random(1)
+    stream = "".join(f"ANSWER:{rng.choice('ABC')} “ok”\n" for _ in range(n_messages)).encode()
+    chunks = random_chunks(stream, rng)
+
+    framer = LineFramer()
+    start = time.perf_counter()
+    count = 0
+    for chunk in chunks:
+        count += len(framer.feed(chunk))
+    elapsed = time.perf_counter() - start
+    assert count == n_messages
+
+    # Peak extra memory while parsing; the framer only ever holds one
+    # partial line plus the messages returned by the current feed()
+    framer = LineFramer()
+    tracemalloc.start()
+    for chunk in chunks:
+        framer.feed(chunk)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print(f"parser: {n_messages / elapsed:,.0f} messages/s, "
+          f"peak {peak / 1024:.1f} KiB while parsing {n_messages} messages")
+
+
+def legacy_client_receive(chunks):
+    # The old client.py listen_worker loop
+    recv_buf = ""
+    messages = []
+    for chunk in chunks:
+        recv_buf += chunk.decode()
+        while "\n" in recv_buf:
+            message, recv_buf = recv_buf.split("\n", 1)
+            messages.append(message.strip())
+    return messages
+
+
+def bench_scoreboard_line(n_players):
+    names = ",".join(f"{i + 1}. player{i}" for i in range(n_players))
+    scores = ",".join(str(n_players - i) for i in range(n_players))
+    line = f"SCOREBOARD:{names}:{scores}\n".encode()
+    chunks = [line[i:i + 1024] for i in range(0, len(line), 1024)]
+
+    start = time.perf_counter()
+    legacy = legacy_client_receive(chunks)
+    legacy_ms = (time.perf_counter() - start) * 1000
+
+    framer = LineFramer(len(line))
+    start = time.perf_counter()
+    framed = [m for chunk in chunks for m in framer.feed(chunk)]
+    framer_ms = (time.perf_counter() - start) * 1000
+    assert framed == legacy
+
+    # The same line with a multibyte name cut by a read boundary
+    split_line = line[:1023] + "é".encode() + line[1024:]
+    split_chunks = [split_line[i:i + 1024] for i in range(0, len(split_line), 1024)]
+    try:
+        legacy_client_receive(split_chunks)
+        legacy_utf8 = "ok"
+    except UnicodeDecodeError:
+        legacy_utf8 = "UnicodeDecodeError"
+    framer = LineFramer(len(split_line))
+    assert len([m for chunk in split_chunks for m in framer.feed(chunk)]) == 1
+
+    print(f"scoreboard line ({n_players} players, {len(line) / 1024:.0f} KiB in 1 KiB reads): "
+          f"legacy {legacy_ms:.1f} ms, framer {framer_ms:.2f} ms; "
+          f"split character: legacy {legacy_utf8}, framer ok")
+
+
+def bench_pipelined(n_bots, pipeline, io_mode):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+
+    server = QuizServer("127.0.0.1", port, io_mode)
+    GameRoom.broadcast_scoreboard = lambda self: None
+    threading.Thread(target=drain_log_queue, args=(server,), daemon=True).start()
+    server.start_server()
+    time.sleep(0.3)
+
+    sel = selectors.DefaultSelector()
+    replies = {}
+    # Username and every answer go out in a single write
+    payload = b"ANSWER:A\n" * pipeline
+    for i in range(n_bots):
+        c = socket.create_connection(("127.0.0.1", port))
+        c.sendall(f"bot{i}\n".encode() + payload)
+        c.setblocking(False)
+        sel.register(c, selectors.EVENT_READ)
+        replies[c] = 0
+
+    start = time.perf_counter()
+    expected = n_bots * pipeline
+    received = 0
+    deadline = time.monotonic() + 30
+    while received < expected and time.monotonic() < deadline:
+        for key, _ in sel.select(timeout=1.0):
+            data = key.fileobj.recv(65536)
+            n = data.count(b"ERROR:GAME_NOT_STARTED")
+            replies[key.fileobj] += n
+            received += n
+    elapsed = time.perf_counter() - start
+
+    server.shutdown()
+    for c in replies:
+        c.close()
+    sel.close()
+
+    print(f"pipelined ({io_mode}): {n_bots} bots x {pipeline} answers, "
+          f"{received}/{expected} handled, {expected - received} dropped, "
+          f"{received / elapsed:,.0f} answers/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--bots", type=int, default=200)
+    parser.add_argument("--pipeline", type=int, default=50)
+    args = parser.parse_args()
+
+    bench_parser(args.messages)
+    for n_players in (1000, 10000, 50000):
+        bench_scoreboard_line(n_players)
+    for io_mode in ("threads", "selectors"):
+        bench_pipelined(args.bots, args.pipeline, io_mode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# Fan-out work of one large game, single process vs gateway processes.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_gateways --players 2000 --rounds 10 --gateways 1,2,4
+#
+# An in-process server hosts one game for N raw-socket players, which run
+# in a separate load process and announce CAPS:scoredelta; each answers
+# every question as soon as it arrives. Every round then sends each player
+# the question, its result, a scoreboard delta and its rank. The game is
+# played in selectors mode, where this process does all the socket work,
+# and in gateways mode with each --gateways count.
+#
+# For each run the benchmark reports wall time per round and the CPU time
+# per round of the coordinator (this process; the load is elsewhere) and
+# of the busiest gateway (Linux /proc). On a host with a core for every
+# process, a round cannot go faster than its busiest process allows, so
+# "capacity" (messages delivered per second of that process's CPU) is the
+# fan-out throughput the topology can reach; on a host with fewer cores
+# than processes the wall times show the processes sharing them instead.
+import argparse
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks._common import drain_log_queue, free_port, write_questions
+from question_bank import compiled_path
+from quiz_engine import DEFAULT_ROOM, QuizServer
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def process_cpu(pid):
+    # User plus system CPU seconds of a process, Linux only
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rpartition(")")[2].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def play(port, players):
+    # Load process role: connect the players, answer every question and
+    # print the number of lines received once the game is over
+    sel = selectors.DefaultSelector()
+    for i in range(players):
+        s = socket.create_connection(("127.0.0.1", port))
+        s.sendall(f"p{i}\nCAPS:scoredelta\n".encode())
+        s.setblocking(False)
+        sel.register(s, selectors.EVENT_READ, [b""])
+    lines = 0
+    open_socks = players
+    while open_socks:
+        for key, _ in sel.select(timeout=30):
+            try:
+                data = key.fileobj.recv(1 << 16)
+            except BlockingIOError:
+                continue
+            if not data:
+                sel.unregister(key.fileobj)
+                key.fileobj.close()
+                open_socks -= 1
+                continue
+            buf = key.data[0] + data
+            *received, key.data[0] = buf.split(b"\n")
+            lines += len(received)
+            for line in received:
+                if line.startswith(b"QUESTION:"):
+                    key.fileobj.sendall(b"ANSWER:A\n")
+    print(lines, flush=True)
+
+
+def run(mode, gateways, args, question_file):
+    port = free_port()
+    server = QuizServer("127.0.0.1", port, mode, gateways=gateways)
+    threading.Thread(target=drain_log_queue, args=(server,), daemon=True).start()
+    server.start_server()
+    time.sleep(0.5 if mode == "gateways" else 0.3)
+
+    load = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_gateways", "--play", str(port), "--players", str(args.players)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    room = server.room(DEFAULT_ROOM)
+    while len(room.players) < args.players:
+        time.sleep(0.05)
+    time.sleep(1.0)
+
+    gateway_pids = [p.pid for p in server.fanout.procs] if mode == "gateways" else []
+    cpu_before = [process_cpu(pid) for pid in gateway_pids]
+    coordinator_before = time.process_time()
+    start = time.monotonic()
+    server.start_game(args.rounds, question_file)
+    room.game_thread.join()
+    elapsed = time.monotonic() - start
+    coordinator = time.process_time() - coordinator_before
+    busiest = max((process_cpu(pid) - before for pid, before in zip(gateway_pids, cpu_before)), default=0.0)
+
+    server.shutdown()
+    lines = int(load.communicate(timeout=60)[0])
+    return elapsed, coordinator, busiest, lines
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--gateways", default="1,2,4", help="gateway counts to compare")
+    parser.add_argument("--play", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.play:
+        play(args.play, args.players)
+        return
+
+    fd, question_file = tempfile.mkstemp(suffix=".txt")
+    os.close(fd)
+    ms = 1000
+    try:
+        write_questions(question_file, args.rounds)
+        print(f"{args.players} players, {args.rounds} rounds, {os.cpu_count()} CPU(s)")
+        print(f"{'topology':<12} {'wall ms/round':>13} {'coordinator cpu':>16} {'busiest gateway':>16} "
+              f"{'capacity msg/s':>15}")
+        runs = [("selectors", 0)] + [("gateways", int(n)) for n in args.gateways.split(",")]
+        for mode, gateways in runs:
+            elapsed, coordinator, busiest, lines = run(mode, gateways, args, question_file)
+            name = f"{gateways} gateway{'s' if gateways > 1 else ''}" if gateways else "1 process"
+            per_round = lines / args.rounds
+            capacity = per_round / (max(coordinator, busiest) / args.rounds)
+            print(f"{name:<12} {elapsed / args.rounds * ms:13.1f} {coordinator / args.rounds * ms:16.1f} "
+                  f"{busiest / args.rounds * ms:16.1f} {capacity:15.0f}")
+    finally:
+        for path in (question_file, compiled_path(question_file)):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# Compare the thread-per-client and selectors server I/O models.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_io_modes --clients 1000 --answers 20
+#
+# For each mode a server process is started, N idle clients connect and
+# complete the username handshake, and the server's resident memory and
+# thread count are sampled before and after. Every client then sends
+# ANSWER messages in lock-step (send, wait for the reply, repeat) and the
+# total number of answers handled per second is reported. No game is
+# running, so each answer takes the ERROR:GAME_NOT_STARTED path through
+# receive_answer, which exercises the same lock and reply as a real one.
+import argparse
+import selectors
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks._common import free_port
+
+
+def read_proc_status(pid):
+    # Return (resident KiB, thread count) for a process, Linux only
+    rss_kib = threads = 0
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss_kib = int(line.split()[1])
+            elif line.startswith("Threads:"):
+                threads = int(line.split()[1])
+    return rss_kib, threads
+
+
+def serve(mode, port):
+    # Child process role: run the real engine accept loop, headless
+    from quiz_engine import GameRoom, QuizServer
+
+    server = QuizServer("127.0.0.1", port, mode)
+
+    # Scoreboard fan-out on every join would dominate the measurement
+    GameRoom.broadcast_scoreboard = lambda self: None
+
+    def drain_log_queue():
+        while True:
+            server.log_queue.get()
+
+    threading.Thread(target=drain_log_queue, daemon=True).start()
+    server.server_loop()
+
+
+def connect_clients(port, count):
+    clients = []
+    for i in range(count):
+        c = socket.create_connection(("127.0.0.1", port))
+        c.sendall(f"bench{i}\n".encode())
+        clients.append(c)
+
+    # Wait for every handshake to be acknowledged
+    for c in clients:
+        buf = b""
+        while b"Welcome" not in buf:
+            chunk = c.recv(4096)
+            if not chunk:
+                raise RuntimeError("server closed a benchmark connection")
+            buf += chunk
+    return clients
+
+
+def run_answers(clients, answers_per_client):
+    # Every client keeps exactly one answer in flight until it has sent
+    # answers_per_client of them; replies are read through one selector
+    sel = selectors.DefaultSelector()
+    remaining = {}
+    for c in clients:
+        c.setblocking(False)
+        sel.register(c, selectors.EVENT_READ)
+        remaining[c] = answers_per_client
+
+    start = time.perf_counter()
+    for c in clients:
+        c.sendall(b"ANSWER:A\n")
+
+    pending = len(clients)
+    while pending:
+        for key, _ in sel.select():
+            c = key.fileobj
+            data = c.recv(4096)
+            # One reply per answer; replies never coalesce because the
+            # next answer is only sent after this one is read
+            if not data:
+                raise RuntimeError("server closed a benchmark connection")
+            remaining[c] -= 1
+            if remaining[c]:
+                c.sendall(b"ANSWER:A\n")
+            else:
+                pending -= 1
+    elapsed = time.perf_counter() - start
+    sel.close()
+    return len(clients) * answers_per_client / elapsed
+
+
+def bench_mode(mode, n_clients, answers_per_client):
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_io_modes", "--serve", mode, "--port", str(port)],
+    )
+    try:
+        # Wait for the server to start listening
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port)).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError("server did not start")
+                time.sleep(0.05)
+        time.sleep(0.2)
+
+        base_rss, _ = read_proc_status(proc.pid)
+        clients = connect_clients(port, n_clients)
+        time.sleep(0.5)
+        rss, threads = read_proc_status(proc.pid)
+
+        throughput = run_answers(clients, answers_per_client)
+        for c in clients:
+            c.close()
+
+        return {
+            "mode": mode,
+            "kib_per_conn": (rss - base_rss) / n_clients,
+            "threads": threads,
+            "answers_per_sec": throughput,
+        }
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--answers", type=int, default=20)
+    parser.add_argument("--serve", choices=("threads", "selectors"))
+    parser.add_argument("--port", type=int)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    print(f"{args.clients} clients, {args.answers} answers each")
+    print(f"{'mode':<10} {'KiB/conn':>10} {'threads':>8} {'answers/s':>12}")
+    for mode in ("threads", "selectors"):
+        r = bench_mode(mode, args.clients, args.answers)
+        print(f"{r['mode']:<10} {r['kib_per_conn']:>10.1f} {r['threads']:>8} {r['answers_per_sec']:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
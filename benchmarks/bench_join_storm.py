@@ -0,0 +1,208 @@
+# Responsiveness to existing players during a join storm.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_join_storm --burst 5000 --io-mode threads
+#
+# An in-process server has a few probe players in room "live". Each probe
+# sends a line every --probe-interval seconds and times the server's echo
+# of it, which goes through the same reader, room lookup and outbound path
+# as an answer. After a second of quiet, --burst connections hit the
+# default lobby at once, from several connector threads, each sending a
+# username and CAPS:scoredelta; a selector thread reads everything the
+# server sends them. The storm is over once every connection was welcomed
+# or closed by the server.
+#
+# It runs three times: "unthrottled" (Python's default backlog of 128, no
+# handshake rate limit, a handshake worker per pending connection),
+# "admission" (the server defaults) and "silent" (the server defaults, with
+# --silent connections that never send a username opened just before the
+# storm; more of them than there are handshake workers must not hold the
+# storm up until the handshake timeout). For each it reports how long the
+# burst took to absorb, how many joined or were turned away, and the probe
+# echo round trip before and during the storm.
+import argparse
+import os
+import selectors
+import socket
+import threading
+import time
+
+from benchmarks._common import drain_log_queue, free_port, percentile
+from quiz_engine import QuizServer
+
+
+class Probe:
+
+    def __init__(self, port, name, interval):
+        self.sock = socket.create_connection(("127.0.0.1", port))
+        self.sock.sendall(f"{name}@live\nCAPS:scoredelta\n".encode())
+        self.name = name
+        self.interval = interval
+        self.samples = []           # (time sent, round trip)
+        self.stop = threading.Event()
+
+    def run(self):
+        buf = b""
+        seq = 0
+        while not self.stop.is_set():
+            seq += 1
+            marker = f"echo-{self.name}-{seq}".encode()
+            sent = time.monotonic()
+            self.sock.sendall(marker + b"\n")
+            while marker not in buf:
+                buf += self.sock.recv(65536)
+            self.samples.append((sent, time.monotonic() - sent))
+            buf = buf[buf.index(marker) + len(marker):]
+            self.stop.wait(self.interval)
+
+
+class Storm:
+
+    def __init__(self, port, count, connectors):
+        self.port = port
+        self.count = count
+        self.connectors = connectors
+        self.sel = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+        self.welcomed = 0
+        self.closed = 0
+        self.failed = 0             # connect() errors
+        self.socks = []
+
+    def connect(self, first, last):
+        for i in range(first, last):
+            try:
+                sock = socket.create_connection(("127.0.0.1", self.port), timeout=30)
+                sock.sendall(f"b{i}\nCAPS:scoredelta\n".encode())
+            except OSError:
+                with self.lock:
+                    self.failed += 1
+                continue
+            sock.setblocking(False)
+            with self.lock:
+                self.socks.append(sock)
+                self.sel.register(sock, selectors.EVENT_READ, [b""])
+
+    def read(self, until):
+        while time.monotonic() < until and self.welcomed + self.closed + self.failed < self.count:
+            with self.lock:
+                empty = not self.sel.get_map()
+            if empty:
+                time.sleep(0.01)
+                continue
+            for key, _ in self.sel.select(timeout=0.1):
+                try:
+                    data = key.fileobj.recv(65536)
+                except (BlockingIOError, InterruptedError):
+                    continue
+                except OSError:
+                    data = b""
+                seen = key.data
+                if not data:
+                    with self.lock:
+                        self.sel.unregister(key.fileobj)
+                    if seen[0] is not None:
+                        self.closed += 1
+                    continue
+                if seen[0] is not None:
+                    if b"Welcome, " in seen[0] + data:
+                        seen[0] = None
+                        self.welcomed += 1
+                    else:
+                        seen[0] = data[-8:]
+
+    def run(self, timeout):
+        start = time.monotonic()
+        per = -(-self.count // self.connectors)
+        threads = [threading.Thread(target=self.connect, args=(i * per, min(self.count, (i + 1) * per)))
+                   for i in range(self.connectors)]
+        for t in threads:
+            t.start()
+        self.read(start + timeout)
+        elapsed = time.monotonic() - start
+        for t in threads:
+            t.join()
+        return elapsed
+
+    def close(self):
+        for sock in self.socks:
+            sock.close()
+        self.sel.close()
+
+
+def run(config, args):
+    baseline_threads = threading.active_count()
+    port = free_port()
+    if config == "unthrottled":
+        server = QuizServer("127.0.0.1", port, args.io_mode, listen_backlog=128, handshake_rate=0,
+                            handshake_workers=args.burst, max_pending_handshakes=args.burst)
+    else:
+        server = QuizServer("127.0.0.1", port, args.io_mode, max_lobby=args.max_lobby)
+    threading.Thread(target=drain_log_queue, args=(server,), daemon=True).start()
+    server.start_server()
+    time.sleep(0.3)
+
+    probes = [Probe(port, f"probe{i}", args.probe_interval) for i in range(args.probes)]
+    threads = [threading.Thread(target=p.run, daemon=True) for p in probes]
+    for t in threads:
+        t.start()
+    time.sleep(1.0)
+
+    silent = []
+    if config == "silent":
+        silent = [socket.create_connection(("127.0.0.1", port)) for _ in range(args.silent)]
+    storm = Storm(port, args.burst, args.connectors)
+    storm_start = time.monotonic()
+    elapsed = storm.run(args.timeout)
+    storm_end = storm_start + elapsed
+    time.sleep(0.5)
+
+    for p in probes:
+        p.stop.set()
+    for t in threads:
+        t.join(5)
+    server.shutdown()
+    storm.close()
+    for sock in silent:
+        sock.close()
+    for p in probes:
+        p.sock.close()
+    # Let the server's reader threads wind down before the next run
+    deadline = time.monotonic() + 30
+    while threading.active_count() > baseline_threads + 2 and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+    samples = [s for p in probes for s in p.samples]
+    before = [rtt for sent, rtt in samples if sent < storm_start]
+    during = [rtt for sent, rtt in samples if storm_start <= sent <= storm_end]
+    return elapsed, storm, before, during
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--burst", type=int, default=5000, help="connections in the storm")
+    parser.add_argument("--io-mode", choices=("threads", "selectors"), default="threads")
+    parser.add_argument("--connectors", type=int, default=8, help="threads opening the storm's connections")
+    parser.add_argument("--probes", type=int, default=4)
+    parser.add_argument("--probe-interval", type=float, default=0.02)
+    parser.add_argument("--silent", type=int, default=64,
+                        help="silent config: connections that never send a username")
+    parser.add_argument("--max-lobby", type=int, default=0, help="admission config: lobby limit (0 = none)")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    ms = 1000
+    print(f"{args.burst}-connection storm, {args.io_mode} mode, {args.probes} probe players, "
+          f"{os.cpu_count()} CPU(s)")
+    print(f"{'config':<12} {'absorbed s':>10} {'joined':>7} {'refused':>8} {'errors':>7}  "
+          f"{'probe rtt ms: before p50':>24} {'during p50':>11} {'p99':>8} {'max':>8}")
+    for config in ("unthrottled", "admission", "silent"):
+        elapsed, storm, before, during = run(config, args)
+        during = during or [float("nan")]
+        print(f"{config:<12} {elapsed:10.2f} {storm.welcomed:7d} {storm.closed:8d} {storm.failed:7d}  "
+              f"{percentile(before, 50) * ms:24.2f} {percentile(during, 50) * ms:11.2f} "
+              f"{percentile(during, 99) * ms:8.2f} {max(during) * ms:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
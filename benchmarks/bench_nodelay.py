@@ -0,0 +1,140 @@
+# Question delivery latency and skew with and without TCP_NODELAY.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_nodelay --players 500 --rounds 10
+#
+# An in-process server hosts a game for N raw-socket players, which announce
+# CAPS:scoredelta as current clients do and answer every question as soon
+# as it arrives. FanOut.connect sets TCP_NODELAY on every client socket; the
+# "nagle" run clears it again, as before that change. For every player and
+# round the time from the server starting the round (GameRoom.round_started)
+# to the QUESTION line arriving is recorded; skew is the spread between the
+# first and the last player of a round. The first round is excluded, since
+# nothing is in flight before it for Nagle's algorithm to wait on.
+import argparse
+import os
+import selectors
+import socket
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks._common import drain_log_queue, free_port, percentile, write_questions
+from outbound import FanOut
+from question_bank import compiled_path
+from quiz_engine import DEFAULT_ROOM, QuizServer
+
+MARKER = b"QUESTION:"
+
+
+def connect_with_nagle(connect):
+    # FanOut.connect, with Nagle's algorithm switched back on afterwards
+    def wrapper(self, sock, addr):
+        conn = connect(self, sock, addr)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 0)
+        return conn
+    return wrapper
+
+
+class Player:
+    def __init__(self, sock):
+        self.sock = sock
+        self.tail = b""             # end of the previous read, for markers split across reads
+        self.seen = 0               # questions received so far
+        self.arrivals = []          # time.monotonic() of each
+
+    def feed(self, data):
+        # Count the questions in a received chunk
+        window = self.tail + data
+        self.seen += window.count(MARKER) - self.tail.count(MARKER)
+        self.tail = data[-8:]
+
+
+def run(players, rounds, question_file):
+    port = free_port()
+    server = QuizServer("127.0.0.1", port, "selectors")
+    threading.Thread(target=drain_log_queue, args=(server,), daemon=True).start()
+    server.start_server()
+    time.sleep(0.3)
+
+    sel = selectors.DefaultSelector()
+    clients = []
+    for i in range(players):
+        c = socket.create_connection(("127.0.0.1", port))
+        # Top-N scoreboards keep the filling lobby from flooding players
+        # that do not read until the game starts
+        c.sendall(f"p{i}\nCAPS:scoredelta\n".encode())
+        c.setblocking(False)
+        player = Player(c)
+        sel.register(c, selectors.EVENT_READ, player)
+        clients.append(player)
+    room = server.room(DEFAULT_ROOM)
+    while len(room.players) < players:
+        time.sleep(0.01)
+
+    server.start_game(rounds, question_file)
+
+    latencies = []
+    skews = []
+    for r in range(rounds):
+        waiting = players
+        while waiting:
+            for key, _ in sel.select(timeout=5):
+                now = time.monotonic()
+                player = key.data
+                try:
+                    data = key.fileobj.recv(1 << 16)
+                except BlockingIOError:
+                    continue
+                if not data:
+                    raise RuntimeError("server closed the connection")
+                before = player.seen
+                player.feed(data)
+                if before <= r < player.seen:
+                    player.arrivals.append(now)
+                    waiting -= 1
+        started = room.round_started
+        arrivals = [p.arrivals[r] for p in clients]
+        if r:
+            latencies.extend(t - started for t in arrivals)
+            skews.append(max(arrivals) - min(arrivals))
+        for p in clients:
+            p.sock.sendall(b"ANSWER:A\n")
+
+    server.shutdown()
+    for p in clients:
+        p.sock.close()
+    sel.close()
+    return latencies, skews
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--question-bytes", type=int, default=200, help="length of each question text")
+    args = parser.parse_args()
+
+    fd, question_file = tempfile.mkstemp(suffix=".txt")
+    os.close(fd)
+    connect = FanOut.connect
+    try:
+        write_questions(question_file, args.rounds, args.question_bytes)
+        ms = 1000
+        print(f"{args.players} players, {args.rounds - 1} rounds, {args.question_bytes}-byte questions")
+        print(f"{'socket':<9} {'latency p50':>12} {'p99':>9} {'max':>9} {'skew mean':>10} {'max':>9}  (ms)")
+        for mode in ("nagle", "nodelay"):
+            FanOut.connect = connect_with_nagle(connect) if mode == "nagle" else connect
+            latencies, skews = run(args.players, args.rounds, question_file)
+            print(f"{mode:<9} {percentile(latencies, 50) * ms:12.2f} {percentile(latencies, 99) * ms:9.2f} "
+                  f"{max(latencies) * ms:9.2f} {statistics.mean(skews) * ms:10.2f} {max(skews) * ms:9.2f}")
+    finally:
+        FanOut.connect = connect
+        for path in (question_file, compiled_path(question_file)):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
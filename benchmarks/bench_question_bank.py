@@ -0,0 +1,90 @@
+# Game-start cost of loading questions: re-parsing the text bank versus the
+# compiled, memory-mapped bank.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_question_bank --bank-size 300000 --questions 20
+#
+# "text" reproduces the old load_questions: read every line of the file and
+# build the requested dicts. "compile" is the one-off cost of writing the
+# .sqb file. "mapped (cold)" opens the compiled bank in a fresh process-level
+# cache; "mapped (warm)" is every later game start with the bank cached.
+# Peak memory is the tracemalloc high-water mark for each step.
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import question_bank
+from quiz_engine import load_question_file
+
+
+def text_load(file_path, question_count):
+    with open(file_path, encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    total = len(lines) // 5
+    questions = []
+    for q in range(question_count):
+        index = (q % total) * 5
+        questions.append({
+            "question": lines[index],
+            "A": lines[index + 1],
+            "B": lines[index + 2],
+            "C": lines[index + 3],
+            "Answer": lines[index + 4],
+        })
+    return questions
+
+
+def write_bank(path, size):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(size):
+            f.write(f"Question number {i}: which option is the right one this time?\n")
+            f.write(f"A - first option for {i}\nB - second option for {i}\nC - third option for {i}\n")
+            f.write(f"Answer: {'ABC'[i % 3]}\n")
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = (time.perf_counter() - start) * 1000
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bank-size", type=int, default=300000)
+    parser.add_argument("--questions", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bank.txt")
+        write_bank(path, args.bank_size)
+        size_mib = os.path.getsize(path) / 2**20
+        print(f"{args.bank_size} questions ({size_mib:.1f} MiB), loading {args.questions}")
+
+        rows = []
+        expected, ms, peak = measure(lambda: text_load(path, args.questions))
+        rows.append(("text", ms, peak))
+        _, ms, peak = measure(lambda: question_bank.compile_bank(path))
+        rows.append(("compile", ms, peak))
+        question_bank._cache.clear()
+        got, ms, peak = measure(lambda: load_question_file(path, args.questions))
+        rows.append(("mapped (cold)", ms, peak))
+        got, ms, peak = measure(lambda: load_question_file(path, args.questions))
+        rows.append(("mapped (warm)", ms, peak))
+        assert got == expected
+
+        for name, ms, peak in rows:
+            print(f"{name:<14} {ms:9.2f} ms   peak {peak / 2**20:8.2f} MiB")
+
+        for bank in question_bank._cache.values():
+            bank.close()
+        question_bank._cache.clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Latency from the last outstanding answer to the RESULT reply.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_round_latency --players 50 --questions 20
+#
+# An in-process headless server hosts a game for N scripted players. In every
+# round all players but one answer right away; once those are ingested the
+# last player answers and the time until its RESULT line arrives is recorded.
+# With the old 100 ms polling loop this was ~50 ms on average and up to
+# 100 ms; with signalled round completion it is bounded by socket latency.
+import argparse
+import socket
+import statistics
+import threading
+import time
+
+from benchmarks._common import drain_log_queue, free_port
+from quiz_engine import QuizServer
+
+
+class LineReader:
+    def __init__(self, sock):
+        self.sock = sock
+        self.buf = b""
+
+    def read_until(self, prefix):
+        while True:
+            while b"\n" in self.buf:
+                line, self.buf = self.buf.split(b"\n", 1)
+                if line.startswith(prefix):
+                    return line
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise RuntimeError("server closed the connection")
+            self.buf += chunk
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--io-mode", default="selectors")
+    args = parser.parse_args()
+
+    port = free_port()
+    server = QuizServer("127.0.0.1", port, args.io_mode)
+    threading.Thread(target=drain_log_queue, args=(server,), daemon=True).start()
+    server.start_server()
+    time.sleep(0.3)
+
+    readers = []
+    for i in range(args.players):
+        c = socket.create_connection(("127.0.0.1", port))
+        c.sendall(f"p{i}\n".encode())
+        r = LineReader(c)
+        r.read_until(b"Welcome")
+        readers.append(r)
+
+    server.start_game(args.questions, "quiz_qa.txt")
+
+    latencies = []
+    for _ in range(args.questions):
+        for r in readers:
+            r.read_until(b"QUESTION:")
+        for r in readers[:-1]:
+            r.sock.sendall(b"ANSWER:A\n")
+        # Let the early answers be ingested so the last one closes the round
+        time.sleep(0.05)
+
+        last = readers[-1]
+        start = time.perf_counter()
+        last.sock.sendall(b"ANSWER:A\n")
+        last.read_until(b"RESULT:")
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    server.shutdown()
+    for r in readers:
+        r.sock.close()
+
+    latencies.sort()
+    print(f"{args.players} players, {args.questions} rounds ({args.io_mode} mode)")
+    print(f"last answer -> RESULT  mean {statistics.mean(latencies):.3f} ms  "
+          f"p50 {latencies[len(latencies) // 2]:.3f} ms  max {latencies[-1]:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
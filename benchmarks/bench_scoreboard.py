@@ -0,0 +1,122 @@
+# Per-round scoreboard cost: full re-sorts versus the incremental Leaderboard.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_scoreboard --players 10000 --rounds 20
+#
+# "legacy" reproduces the old round end: refresh_scoreboard,
+# broadcast_scoreboard and send_scoreboard_to_client each sorted all
+# players, recomputed ranks and (for the two senders) serialized the line.
+# "leaderboard" applies the round's points incrementally and then asks for
+# the ranked rows (GUI) and the encoded frame (network) once each.
+#
+# The second table compares bytes sent per round to the whole lobby: the
+# full SCOREBOARD line to every player versus one shared top-N SCOREDELTA
+# plus a MYRANK line for each player whose standing changed.
+import argparse
+import random
+import time
+
+from leaderboard import Leaderboard, delta_message, rank_message, top_view
+
+
+def legacy_scoreboard(players, scores):
+    sorted_users = sorted(
+        ((u, scores.get(u, 0)) for u in players),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    usernames_list = []
+    scores_list = []
+    current_rank = 0
+    prev_score = None
+    for idx, (u, score) in enumerate(sorted_users, start=1):
+        if prev_score is None or score < prev_score:
+            current_rank = idx
+            prev_score = score
+        usernames_list.append(f"{current_rank}. {u}")
+        scores_list.append(str(score))
+    return f"SCOREBOARD:{','.join(usernames_list)}:{','.join(scores_list)}\n".encode()
+
+
+def make_rounds(players, rounds, correct_rate, rng):
+    result = []
+    for _ in range(rounds):
+        correct = [u for u in players if rng.random() < correct_rate]
+        rng.shuffle(correct)
+        points = {u: 1 for u in correct}
+        if correct:
+            points[correct[0]] = len(players)
+        result.append(points)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    players = [f"player{i}" for i in range(args.players)]
+
+    print(f"{args.players} players, {args.rounds} rounds")
+    print(f"{'correct %':>9} {'legacy ms/round':>16} {'leaderboard ms/round':>21}")
+    for correct_rate in (0.01, 0.1, 0.5):
+        rounds = make_rounds(players, args.rounds, correct_rate, rng)
+
+        scores = {u: 0 for u in players}
+        start = time.perf_counter()
+        for points in rounds:
+            for u, p in points.items():
+                scores[u] += p
+            legacy_frame = legacy_scoreboard(players, scores)  # refresh_scoreboard
+            legacy_scoreboard(players, scores)                 # broadcast_scoreboard
+            legacy_scoreboard(players, scores)                 # send_scoreboard_to_client
+        legacy_ms = (time.perf_counter() - start) * 1000 / args.rounds
+
+        board = Leaderboard()
+        for u in players:
+            board.add(u)
+        start = time.perf_counter()
+        for points in rounds:
+            board.add_points(points)
+            board.ranked()
+            frame = board.message().encode(1)
+            board.message().encode(1)
+        board_ms = (time.perf_counter() - start) * 1000 / args.rounds
+
+        assert frame == legacy_frame
+        print(f"{correct_rate * 100:>9.0f} {legacy_ms:>16.2f} {board_ms:>21.2f}")
+
+    print()
+    print(f"bytes per round to the whole lobby (top {args.top}, 10% correct)")
+    print(f"{'players':>8} {'full SCOREBOARD':>16} {'delta + MYRANK':>15}")
+    for n_players in sorted({100, 1000, args.players}):
+        names = players[:n_players]
+        rounds = make_rounds(names, args.rounds, 0.1, rng)
+        board = Leaderboard()
+        for u in names:
+            board.add(u)
+        view = top_view(board.ranked(), args.top)
+        sent_rank = {}
+        full_bytes = delta_bytes = 0
+        for points in rounds:
+            board.add_points(points)
+            ranked = board.ranked()
+            full_bytes += len(board.message().encode(1)) * n_players
+
+            new_view = top_view(ranked, args.top)
+            delta = delta_message(view, new_view, n_players, n_players)
+            view = new_view
+            if delta is not None:
+                delta_bytes += len(delta.encode(1)) * n_players
+            for rank, u, score in ranked:
+                if sent_rank.get(u) != (rank, score):
+                    sent_rank[u] = (rank, score)
+                    delta_bytes += len(rank_message(rank, score, n_players).encode(1))
+        print(f"{n_players:>8} {full_bytes // args.rounds:>16,} {delta_bytes // args.rounds:>15,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# Startup cost of the headless engine versus the Tk front-end.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_startup
+#
+# Each variant is imported in a fresh interpreter, which reports its wall
+# time to import and its resident memory afterwards. The GUI variant also
+# creates the Tk root window, so it needs a display.
+import subprocess
+import sys
+
+VARIANTS = {
+    "headless": "import quiz_engine; quiz_engine.QuizServer()",
+    "gui": "import tkinter, quiz_engine, server_gui; tkinter.Tk()",
+}
+
+PROBE = """
+import time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+rss = 0
+with open("/proc/self/status") as f:
+    for line in f:
+        if line.startswith("VmRSS:"):
+            rss = int(line.split()[1])
+print(f"{{elapsed * 1000:.1f}} {{rss}}")
+"""
+
+
+def measure(code, repeats):
+    times = []
+    rss = 0
+    for _ in range(repeats):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE.format(code=code)],
+            capture_output=True, text=True,
+        )
+        if out.returncode != 0:
+            return None
+        ms, rss = out.stdout.split()
+        times.append(float(ms))
+    return min(times), int(rss)
+
+
+def main():
+    print(f"{'variant':<10} {'startup ms':>11} {'RSS KiB':>9}")
+    for name, code in VARIANTS.items():
+        result = measure(code, 5)
+        if result is None:
+            print(f"{name:<10} {'unavailable (no display?)':>21}")
+            continue
+        print(f"{name:<10} {result[0]:>11.1f} {result[1]:>9}")
+
+
+if __name__ == "__main__":
+    main()
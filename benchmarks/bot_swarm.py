@@ -0,0 +1,290 @@
+# Load generator: thousands of simulated players from one process.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bot_swarm --spawn-server --bots 2000 --questions 10
+#   python -m benchmarks.bot_swarm --host 10.0.0.5 --port 5004 --bots 500 \
+#       --delay uniform:0.2:2 --correct-rate 0.6 --churn 0.02
+#
+# Each bot is a squid_client.SquidClient session: it joins, waits for a
+# question, answers after a delay drawn from --delay, and follows results,
+# scoreboards (SCOREBOARD:, or top-N deltas with --scoredelta) and the end
+# of the game, as text lines or, with --v2, protocol v2 frames. With
+# --file pointing at the server's question bank, bots answer correctly with
+# probability --correct-rate; otherwise they guess. --churn is the chance
+# that a bot drops its connection on any given question.
+#
+# --spawn-server runs a headless server that starts the game once every bot
+# has joined; otherwise the game must be started on the target server.
+#
+# Reported: connect rate (handshakes per second), question fan-out skew
+# (first to last bot receiving each QUESTION), answer round-trip (ANSWER
+# sent to RESULT received) and per-round time (first QUESTION received to
+# last RESULT received).
+import argparse
+import asyncio
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks._common import percentile
+from question_bank import open_bank
+from squid_client import (Disconnected, GameOver, JoinRejected, MyRank, Question, Result,
+                          Scoreboard, SquidClient)
+
+DELAY_KINDS = ("fixed", "uniform", "exp", "normal")
+
+
+def parse_delay(spec):
+    # "fixed:S", "uniform:LO:HI", "exp:MEAN" or "normal:MEAN:STDDEV" (seconds)
+    # -> function of a random.Random returning a delay
+    kind, *params = spec.split(":")
+    try:
+        params = [float(p) for p in params]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"bad delay {spec!r}")
+    arity = {"fixed": 1, "uniform": 2, "exp": 1, "normal": 2}
+    if kind not in arity or len(params) != arity[kind]:
+        raise argparse.ArgumentTypeError(f"delay must be one of {', '.join(DELAY_KINDS)} with its parameters")
+    if kind == "fixed":
+        return lambda rng: params[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(*params)
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1.0 / params[0]) if params[0] > 0 else 0.0
+    return lambda rng: max(0.0, rng.gauss(*params))
+
+
+class Stats:
+
+    def __init__(self):
+        self.connect_start = None
+        self.welcomed = []            # monotonic time of each Welcome
+        self.rejected = 0
+        self.question_at = {}         # round -> [receive times]
+        self.result_at = {}           # round -> [receive times]
+        self.rtts = []                # seconds from ANSWER to RESULT
+        self.answers = 0
+        self.correct = 0
+        self.dropped = 0              # churned connections
+        self.lost = 0                 # connections closed by the server before GAMEOVER
+        self.gameovers = 0
+        self.scoreboard_updates = 0
+
+
+class Bot:
+
+    def __init__(self, name, args, stats, answer_key, rng):
+        self.name = name
+        self.args = args
+        self.stats = stats
+        self.answer_key = answer_key
+        self.rng = rng
+        self.round = -1
+        self.answer_sent = None
+
+    def choose(self, question):
+        correct = self.answer_key.get(question)
+        if correct is None:
+            return self.rng.choice("ABC")
+        if self.rng.random() < self.args.correct_rate:
+            return correct
+        return self.rng.choice([c for c in "ABC" if c != correct])
+
+    async def answer(self, client, question, round_no):
+        await asyncio.sleep(self.args.delay(self.rng))
+        if self.round != round_no or not client.connected:
+            return
+        try:
+            await client.submit_answer(self.choose(question))
+        except ConnectionError:
+            return
+        self.answer_sent = time.monotonic()
+        self.stats.answers += 1
+
+    async def run(self, handshakes):
+        stats = self.stats
+        caps = [cap for cap in ("scoredelta", "v2") if getattr(self.args, cap)]
+        client = SquidClient(self.args.host, self.args.port, self.name, self.args.room, caps)
+
+        # Handshakes in flight are bounded so the swarm does not overflow the
+        # server's listen backlog
+        async with handshakes:
+            try:
+                await client.connect(self.args.timeout)
+            except (OSError, JoinRejected, asyncio.TimeoutError):
+                stats.rejected += 1
+                return
+        stats.welcomed.append(time.monotonic())
+
+        pending = set()
+        try:
+            async for event in client.events():
+                if isinstance(event, Question):
+                    self.round += 1
+                    stats.question_at.setdefault(self.round, []).append(event.at)
+                    if self.rng.random() < self.args.churn:
+                        stats.dropped += 1
+                        return
+                    task = asyncio.ensure_future(self.answer(client, event.text, self.round))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+                elif isinstance(event, Result):
+                    stats.result_at.setdefault(self.round, []).append(event.at)
+                    if self.answer_sent is not None:
+                        stats.rtts.append(event.at - self.answer_sent)
+                        self.answer_sent = None
+                    if event.correct:
+                        stats.correct += 1
+                elif isinstance(event, (Scoreboard, MyRank)):
+                    stats.scoreboard_updates += 1
+                elif isinstance(event, GameOver):
+                    stats.gameovers += 1
+                    return
+                elif isinstance(event, Disconnected):
+                    stats.lost += 1
+                    return
+        finally:
+            for task in pending:
+                task.cancel()
+            await client.close()
+
+
+async def swarm(args, answer_key):
+    stats = Stats()
+    rng = random.Random(args.seed)
+    stats.connect_start = time.monotonic()
+
+    handshakes = asyncio.Semaphore(args.connect_concurrency)
+    tasks = []
+    interval = 1.0 / args.connect_rate if args.connect_rate else 0.0
+    for i in range(args.bots):
+        bot = Bot(f"{args.prefix}{i}", args, stats, answer_key, random.Random(rng.random()))
+        tasks.append(asyncio.ensure_future(bot.run(handshakes)))
+        if interval:
+            await asyncio.sleep(interval)
+        elif i % 100 == 99:
+            # Let earlier handshakes progress instead of queueing every connect
+            await asyncio.sleep(0)
+
+    await asyncio.wait(tasks, timeout=args.timeout)
+    return stats
+
+
+def report(args, stats):
+    ms = 1000.0
+    print(f"{args.bots} bots -> {args.host}:{args.port}")
+
+    if stats.welcomed:
+        elapsed = max(stats.welcomed) - stats.connect_start
+        rate = len(stats.welcomed) / elapsed if elapsed > 0 else float("inf")
+        print(f"connect      {len(stats.welcomed)} joined, {stats.rejected} rejected, "
+              f"{rate:,.0f} handshakes/s")
+    else:
+        print(f"connect      no bot joined ({stats.rejected} rejected)")
+
+    rounds = sorted(stats.question_at)
+    skews = {}
+    durations = {}
+    for r in rounds:
+        q = stats.question_at[r]
+        skews[r] = max(q) - min(q)
+        results = stats.result_at.get(r)
+        if results:
+            durations[r] = max(results) - min(q)
+
+    print(f"rounds       {len(rounds)}, {stats.answers} answers, {stats.correct} correct, "
+          f"{stats.dropped} churned, {stats.lost} lost, {stats.gameovers} saw GAMEOVER")
+    for label, values in (("fan-out skew", list(skews.values())), ("answer rtt", stats.rtts),
+                          ("round time", list(durations.values()))):
+        if values:
+            print(f"{label:<12} p50 {percentile(values, 50) * ms:8.1f} ms  p90 {percentile(values, 90) * ms:8.1f} ms  "
+                  f"p99 {percentile(values, 99) * ms:8.1f} ms  max {max(values) * ms:8.1f} ms")
+    if args.per_round:
+        for r in rounds:
+            skew = skews[r]
+            duration = durations.get(r, float("nan"))
+            print(f"  round {r + 1:3d}  {len(stats.question_at[r]):6d} questions  skew {skew * ms:8.1f} ms  "
+                  f"time {duration * ms:8.1f} ms")
+    print(f"scoreboard   {stats.scoreboard_updates} updates received")
+
+
+def spawn_server(args):
+    # Headless server on a free local port that starts once every bot is in
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        args.port = s.getsockname()[1]
+    args.host = "127.0.0.1"
+    cmd = [
+        sys.executable, "server.py", "--headless",
+        "--port", str(args.port), "--io-mode", args.io_mode,
+        "--questions", str(args.questions), "--file", args.file or "quiz_qa.txt",
+        "--min-players", str(args.bots), "--lobby-wait", "0.5", "--games", "1",
+        "--question-time", str(args.question_time),
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            # A bare close is an empty handshake, which the server rejects quietly
+            socket.create_connection((args.host, args.port)).close()
+            return proc
+        except OSError:
+            if time.monotonic() > deadline:
+                proc.kill()
+                raise RuntimeError("server did not start")
+            time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5004)
+    parser.add_argument("--bots", type=int, default=1000)
+    parser.add_argument("--prefix", default="bot", help="username prefix")
+    parser.add_argument("--room", help="join this room (username@room)")
+    parser.add_argument("--connect-rate", type=float, default=0,
+                        help="new connections per second (0 = as fast as possible)")
+    parser.add_argument("--connect-concurrency", type=int, default=64,
+                        help="handshakes in flight at once")
+    parser.add_argument("--delay", type=parse_delay, default=parse_delay("uniform:0.05:0.5"),
+                        help="answer delay distribution: fixed:S, uniform:LO:HI, exp:MEAN or normal:MEAN:SD")
+    parser.add_argument("--correct-rate", type=float, default=0.5,
+                        help="chance of answering correctly (needs --file)")
+    parser.add_argument("--churn", type=float, default=0.0,
+                        help="chance a bot disconnects on each question")
+    parser.add_argument("--file", help="question bank used by the server, for correct answers")
+    parser.add_argument("--scoredelta", action="store_true", help="announce CAPS:scoredelta")
+    parser.add_argument("--v2", action="store_true", help="negotiate protocol v2 frames")
+    parser.add_argument("--timeout", type=float, default=600, help="give up after this many seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--per-round", action="store_true", help="print every round")
+    parser.add_argument("--spawn-server", action="store_true", help="run a local headless server")
+    parser.add_argument("--io-mode", default="selectors", help="with --spawn-server")
+    parser.add_argument("--questions", type=int, default=5, help="with --spawn-server")
+    parser.add_argument("--question-time", type=float, default=30,
+                        help="with --spawn-server: seconds per question (0 = wait for every answer)")
+    args = parser.parse_args()
+
+    answer_key = {}
+    if args.file:
+        # Question text -> correct letter
+        bank = open_bank(args.file)
+        for i in range(len(bank)):
+            q = bank[i]
+            answer_key.setdefault(q["question"], q["Answer"][-1].strip().upper())
+
+    proc = spawn_server(args) if args.spawn_server else None
+    try:
+        stats = asyncio.run(swarm(args, answer_key))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+    report(args, stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,42 @@
 import tkinter as tk
+import collections
+import math
+import queue
 import socket
 import threading
 import time
 import os  # Added for safe process termination
 
+from log_view import LogView
+from protocol import Decoder
+from squid_client import MAX_LINE_BYTES, RECV_SIZE, apply_scoreboard
+
+# Inbound messages are handled on the Tk main thread this often; everything
+# that arrived in between is applied first and the widgets painted once
+UI_INTERVAL_MS = 30
+
+# Messages handled per pass before yielding to Tk, so a flood cannot freeze
+# the window
+UI_BATCH_LIMIT = 5000
+
+# Recent read-to-paint latencies kept for the status line, and how often
+# (seconds) that line is refreshed
+UI_LATENCY_SAMPLES = 500
+UI_STATS_INTERVAL = 1.0
+
+# Optional protocol features announced after the handshake; v2 frames carry
+# questions and usernames intact whatever characters they contain, and
+# heartbeat lets the server tell a quiet player from a dead connection
+CAPS = "CAPS:scoredelta,timer,resume,v2,heartbeat\n"
+
+# Attempts to take our place back after the connection drops mid-game, and
+# the delay before each
+RECONNECT_DELAYS = (0.5, 1.0, 1.0, 2.0, 2.0, 3.0, 3.0)
+
+# Lines are written to the socket from the connect, answer and listener
+# threads; one write at a time, so two lines are never interleaved
+send_lock = threading.Lock()
+
 # Default question and options shown before the game starts
 default_question = "What does CPU stand for?"
 default_option_a = "Central Processing Unit"
@@ -13,6 +46,7 @@ default_option_c = "Central Program Utility"
 # Widget references that need to be accessed across functions
 scoreboard_names = None
 scoreboard_scores = None
+scoreboard_title = None
 option_a_entry = None
 option_b_entry = None
 option_c_entry = None
@@ -22,6 +56,7 @@ def build_ui(root):
     global server_entry, port_entry, log_box, username_entry
     global question_box, selected_choice, scoreboard_names, scoreboard_scores
     global option_a_entry, option_b_entry, option_c_entry, response_box
+    global scoreboard_title, log_view, ui_stats_label, question_title
 
     # Main window setup
     root.title("SUquid Quiz Games | Client")
@@ -75,9 +110,11 @@ def build_ui(root):
     log_box = tk.Text(root, width=46)
     log_box.grid(row=8, column=0, columnspan=6, sticky="nsew", padx=20)
     log_box.config(state=tk.DISABLED)
+    log_view = LogView(root, log_box)
 
     # Question display area
-    tk.Label(root, text="Question").grid(row=0, column=3, sticky="w", padx=20, pady=10)
+    question_title = tk.Label(root, text="Question")
+    question_title.grid(row=0, column=3, sticky="w", padx=20, pady=10)
     question_box = tk.Text(root, height=3, width=50, wrap=tk.WORD)
     question_box.insert(tk.END, default_question)
     question_box.grid(row=1, column=3, sticky="ew", padx=20, pady=10)
@@ -124,9 +161,8 @@ def build_ui(root):
     )
 
     # Scoreboard UI
-    tk.Label(root, text="Scoreboard").grid(
-        row=0, column=4, columnspan=2, sticky="ew", padx=20, pady=10
-    )
+    scoreboard_title = tk.Label(root, text="Scoreboard")
+    scoreboard_title.grid(row=0, column=4, columnspan=2, sticky="ew", padx=20, pady=10)
 
     tk.Label(root, text="Username").grid(row=1, column=4, padx=(20, 5), pady=5)
     scoreboard_names = tk.Text(root, height=20, width=20)
@@ -138,13 +174,22 @@ def build_ui(root):
     scoreboard_scores.grid(row=2, column=5, rowspan=5, sticky="nsew", padx=(5, 20))
     scoreboard_scores.config(state=tk.DISABLED)
 
+    # Read-to-paint latency of inbound messages
+    ui_stats_label = tk.Label(root, text="", anchor="w")
+    ui_stats_label.grid(row=9, column=0, columnspan=6, sticky="ew", padx=20, pady=(0, 5))
+
+    root.after(UI_INTERVAL_MS, drain_ui_events)
 
-def update_response_box(text):
-    # Shows feedback for the most recent answer
-    response_box.config(state=tk.NORMAL)
-    response_box.delete(1.0, tk.END)
-    response_box.insert(tk.END, text + "\n")
-    response_box.config(state=tk.DISABLED)
+
+def log(text):
+    # Add a line to the event log; rendered in batches on the Tk main thread,
+    # so it is safe to call from the socket threads
+    log_view.write(text)
+
+
+def send_line(sock, text):
+    with send_lock:
+        sock.sendall(text.encode())
 
 
 def connect():
@@ -155,22 +200,18 @@ def connect():
 
 
 def connect_worker():
-    global s, is_connected
+    global s, is_connected, session_token
 
     try:
         # Prevent double connections
         if is_connected:
-            log_box.config(state=tk.NORMAL)
-            log_box.insert("end", "Already connected! Please disconnect first.\n")
-            log_box.config(state=tk.DISABLED)
+            log("Already connected! Please disconnect first.")
             return
 
         IP = server_entry.get()
         Port = port_entry.get()
 
-        log_box.config(state=tk.NORMAL)
-        log_box.insert("end", "Connecting to the server ...\n")
-        log_box.config(state=tk.DISABLED)
+        log("Connecting to the server ...")
 
         # Create socket and connect
         s = socket.socket()
@@ -179,20 +220,52 @@ def connect_worker():
 
         # Send username to server
         Username = username_entry.get()
-        s.send((Username if Username else " ").encode())
+        send_line(s, (Username if Username else " ") + "\n")
 
-        log_box.config(state=tk.NORMAL)
-        log_box.insert("end", "Username sent to the server.\n")
-        log_box.config(state=tk.DISABLED)
+        # Ask for top-N scoreboard deltas instead of the full list each time,
+        # for the time left on each question, for a session token and for
+        # protocol v2 frames
+        send_line(s, CAPS)
+        session_token = None
+
+        log("Username sent to the server.")
 
         # Mark as connected and start listening
         is_connected = True
         start_listen()
 
     except Exception as e:
-        log_box.config(state=tk.NORMAL)
-        log_box.insert("end", "Error encountered: " + str(e) + "\n")
-        log_box.config(state=tk.DISABLED)
+        log("Error encountered: " + str(e))
+
+
+def reconnect(token):
+    # Run reconnection logic in a background daemon thread
+    t = threading.Thread(target=reconnect_worker, args=(token,))
+    t.daemon = True
+    t.start()
+
+
+def reconnect_worker(token):
+    global s, is_connected
+
+    for delay in RECONNECT_DELAYS:
+        time.sleep(delay)
+        # Stop if the user connected or disconnected in the meantime
+        if is_connected or session_token != token:
+            return
+        try:
+            sock = socket.socket()
+            sock.settimeout(1.0)
+            sock.connect((server_entry.get(), int(port_entry.get())))
+            send_line(sock, f"RESUME:{token}\n{CAPS}")
+        except (OSError, ValueError):
+            continue
+        s = sock
+        is_connected = True
+        start_listen()
+        return
+
+    log("Could not reconnect to the game.")
 
 
 def send_answer():
@@ -207,96 +280,238 @@ def send_answer_worker():
 
     try:
         if not is_connected:
-            log_box.config(state=tk.NORMAL)
-            log_box.insert("end", "Not connected to the server.\n")
-            log_box.config(state=tk.DISABLED)
+            log("Not connected to the server.")
             return
 
         # Prevent sending answers before a question is active
         if not game_active:
-            log_box.config(state=tk.NORMAL)
-            log_box.insert("end", "Game not started yet. Answer not sent.\n")
-            log_box.config(state=tk.DISABLED)
+            log("Game not started yet. Answer not sent.")
             return
 
         answer = selected_choice.get()
-        s.send(f"ANSWER:{answer}".encode())
+        send_line(s, f"ANSWER:{answer}\n")
 
-        log_box.config(state=tk.NORMAL)
-        log_box.insert("end", "Answer sent: " + answer + "\n")
-        log_box.config(state=tk.DISABLED)
+        log("Answer sent: " + answer)
 
     except Exception as e:
-        log_box.config(state=tk.NORMAL)
-        log_box.insert("end", "Error sending answer: " + str(e) + "\n")
-        log_box.config(state=tk.DISABLED)
+        log("Error sending answer: " + str(e))
+
+
+def update_response_box(text):
+    # Shows feedback for the most recent answer (painted on the next pass)
+    set_pending("response", text)
+
+
+def paint_response_box(text):
+    response_box.config(state=tk.NORMAL)
+    response_box.delete(1.0, tk.END)
+    response_box.insert(tk.END, text + "\n")
+    response_box.config(state=tk.DISABLED)
 
 
 def update_scoreboard(message):
-    global scoreboard_names, scoreboard_scores
+    global scoreboard_rows
 
     try:
-        # Expected format:
-        # SCOREBOARD:ranked_usernames_csv:score_csv
-        parts = message.split(":")
-        if len(parts) < 3:
-            return
+        # A full list, a top-N snapshot or a delta against the rows we hold
+        scoreboard_rows = apply_scoreboard(scoreboard_rows, message)[0]
 
-        usernames = parts[1].split(",") if parts[1] else []
-        scores = parts[2].split(",") if parts[2] else []
+        # Every update is applied, but the board is redrawn once per pass
+        set_pending("scoreboard", True)
 
-        scoreboard_names.config(state=tk.NORMAL)
-        scoreboard_scores.config(state=tk.NORMAL)
-        scoreboard_names.delete(1.0, tk.END)
-        scoreboard_scores.delete(1.0, tk.END)
+    except Exception as e:
+        log("Error updating scoreboard: " + str(e))
 
-        for i in range(min(len(usernames), len(scores))):
-            scoreboard_names.insert(tk.END, usernames[i] + "\n")
-            scoreboard_scores.insert(tk.END, scores[i] + "\n")
 
-        scoreboard_names.config(state=tk.DISABLED)
-        scoreboard_scores.config(state=tk.DISABLED)
+def render_scoreboard():
+    global scoreboard_lines
+
+    # Order by rank; ties keep their current on-screen order
+    position = {line[0]: i for i, line in enumerate(scoreboard_lines)}
+    ordered = sorted(
+        scoreboard_rows.items(),
+        key=lambda item: (item[1][0], position.get(item[0], len(position))),
+    )
+    new_lines = [(name, f"{rank}. {name}", str(score)) for name, (rank, score) in ordered]
+
+    scoreboard_names.config(state=tk.NORMAL)
+    scoreboard_scores.config(state=tk.NORMAL)
+
+    # Rewrite only the rows that changed
+    for i, (name, name_text, score_text) in enumerate(new_lines):
+        if i < len(scoreboard_lines):
+            if scoreboard_lines[i][1:] == (name_text, score_text):
+                continue
+            line = f"{i + 1}.0"
+            scoreboard_names.delete(line, f"{i + 1}.end")
+            scoreboard_names.insert(line, name_text)
+            scoreboard_scores.delete(line, f"{i + 1}.end")
+            scoreboard_scores.insert(line, score_text)
+        else:
+            scoreboard_names.insert(tk.END, name_text + "\n")
+            scoreboard_scores.insert(tk.END, score_text + "\n")
+
+    if len(new_lines) < len(scoreboard_lines):
+        scoreboard_names.delete(f"{len(new_lines) + 1}.0", tk.END)
+        scoreboard_scores.delete(f"{len(new_lines) + 1}.0", tk.END)
+
+    scoreboard_names.config(state=tk.DISABLED)
+    scoreboard_scores.config(state=tk.DISABLED)
+    scoreboard_lines = [(name, name_text, score_text) for name, name_text, score_text in new_lines]
+
+
+def update_my_rank(message):
+    rank, score, total = message.fields
+    set_pending("rank", f"Scoreboard (you: #{rank} of {total}, {score} pts)")
 
-    except Exception as e:
-        log_box.config(state=tk.NORMAL)
-        log_box.insert("end", "Error updating scoreboard: " + str(e) + "\n")
-        log_box.config(state=tk.DISABLED)
 
+def clear_scoreboard():
+    global scoreboard_rows, scoreboard_lines
 
-def update_question(message):
+    scoreboard_rows = {}
+    scoreboard_lines = []
+    pending_ui.pop("scoreboard", None)
+    pending_ui.pop("rank", None)
+
+    scoreboard_names.config(state=tk.NORMAL)
+    scoreboard_names.delete(1.0, tk.END)
+    scoreboard_names.config(state=tk.DISABLED)
+
+    scoreboard_scores.config(state=tk.NORMAL)
+    scoreboard_scores.delete(1.0, tk.END)
+    scoreboard_scores.config(state=tk.DISABLED)
+
+    scoreboard_title.config(text="Scoreboard")
+
+
+def update_question(fields):
+    # fields: question text, option A, option B, option C; a question
+    # replaced before it was painted is never drawn
+    set_pending("question", fields)
+
+
+def paint_question(parts):
     global question_box, option_a_entry, option_b_entry, option_c_entry
 
     try:
-        # Expected format:
-        # QUESTION:question_text:optionA:optionB:optionC
-        parts = message.split(":")
-        if len(parts) < 5:
-            return
-
         question_box.config(state=tk.NORMAL)
         question_box.delete(1.0, tk.END)
-        question_box.insert(tk.END, parts[1])
+        question_box.insert(tk.END, parts[0])
         question_box.config(state=tk.DISABLED)
 
         option_a_entry.config(state=tk.NORMAL)
         option_a_entry.delete(0, tk.END)
-        option_a_entry.insert(0, parts[2])
+        option_a_entry.insert(0, parts[1])
         option_a_entry.config(state="readonly")
 
         option_b_entry.config(state=tk.NORMAL)
         option_b_entry.delete(0, tk.END)
-        option_b_entry.insert(0, parts[3])
+        option_b_entry.insert(0, parts[2])
         option_b_entry.config(state="readonly")
 
         option_c_entry.config(state=tk.NORMAL)
         option_c_entry.delete(0, tk.END)
-        option_c_entry.insert(0, parts[4])
+        option_c_entry.insert(0, parts[3])
         option_c_entry.config(state="readonly")
 
     except Exception as e:
-        log_box.config(state=tk.NORMAL)
-        log_box.insert("end", "Error updating question: " + str(e) + "\n")
-        log_box.config(state=tk.DISABLED)
+        log("Error updating question: " + str(e))
+
+
+def set_pending(kind, value):
+    # Record the latest update of one kind for the next paint; an update
+    # that replaces one not yet painted is counted as coalesced
+    global ui_coalesced
+    if kind in pending_ui:
+        ui_coalesced += 1
+    pending_ui[kind] = value
+
+
+def post_ui(action):
+    # Run action() on the Tk main thread, in order with inbound messages
+    ui_events.put(action)
+
+
+def drain_ui_events():
+    # Tk main thread: handle the messages queued by the listener in order,
+    # then paint the latest state once
+    oldest = None
+    handled = 0
+    try:
+        while handled < UI_BATCH_LIMIT:
+            item = ui_events.get_nowait()
+            handled += 1
+            if callable(item):
+                item()
+                continue
+            received_at, message = item
+            if oldest is None:
+                oldest = received_at
+            handle_message(message)
+    except queue.Empty:
+        pass
+
+    try:
+        if paint_ui() and oldest is not None:
+            ui_latencies.append(time.monotonic() - oldest)
+        show_countdown()
+        show_ui_stats()
+    except tk.TclError:
+        # The window is being destroyed
+        return
+
+    root.after(1 if handled >= UI_BATCH_LIMIT else UI_INTERVAL_MS, drain_ui_events)
+
+
+def paint_ui():
+    # Draw the pending updates; returns whether anything was drawn
+    if not pending_ui:
+        return False
+    updates = pending_ui.copy()
+    pending_ui.clear()
+
+    if "question" in updates:
+        paint_question(updates["question"])
+    if "scoreboard" in updates:
+        render_scoreboard()
+    if "rank" in updates:
+        scoreboard_title.config(text=updates["rank"])
+    if "response" in updates:
+        paint_response_box(updates["response"])
+
+    # Flush the redraw now so the latency covers the actual paint
+    root.update_idletasks()
+    return True
+
+
+def show_countdown():
+    # Seconds left on the current question, from the last TIMELEFT
+    global countdown_shown
+
+    text = "Question"
+    if question_deadline is not None:
+        remaining = max(0, math.ceil(question_deadline - time.monotonic()))
+        text = f"Question ({remaining} s left)"
+    if text != countdown_shown:
+        question_title.config(text=text)
+        countdown_shown = text
+
+
+def show_ui_stats():
+    global ui_stats_shown
+
+    now = time.monotonic()
+    if not ui_latencies or now - ui_stats_shown < UI_STATS_INTERVAL:
+        return
+    ui_stats_shown = now
+
+    ms = sorted(x * 1000 for x in ui_latencies)
+    p50 = ms[len(ms) // 2]
+    p99 = ms[min(len(ms) - 1, int(len(ms) * 0.99))]
+    ui_stats_label.config(
+        text=f"UI latency (read to paint): p50 {p50:.1f} ms, p99 {p99:.1f} ms, "
+             f"max {ms[-1]:.1f} ms | {ui_coalesced} updates coalesced"
+    )
 
 
 def start_listen():
@@ -307,129 +522,172 @@ def start_listen():
 
 
 def handle_message(message):
-    global is_connected, s, game_active
+    global is_connected, s, game_active, question_deadline, session_token
 
-    # Scoreboard updates go straight to the UI
-    if message.startswith("SCOREBOARD:"):
+    kind = message.kind
+    fields = message.fields
+
+    # Scoreboard updates are applied now and drawn on the next paint
+    if kind in ("scoreboard", "scoretop", "scoredelta"):
         update_scoreboard(message)
         return
 
-    # New question message
-    if message.startswith("QUESTION:"):
-        update_question(message)
+    if kind == "myrank":
+        update_my_rank(message)
+        return
+
+    # New question message; its time limit follows in TIMELEFT
+    if kind == "question":
+        update_question(fields)
         game_active = True
-        log_box.config(state=tk.NORMAL)
-        log_box.insert("end", "New question received.\n")
-        log_box.config(state=tk.DISABLED)
+        question_deadline = None
+        log("New question received.")
         return
 
-    # Result feedback for the user's answer
-    if message.startswith("RESULT:"):
-        parts = message.split(":", 2)
-        if len(parts) == 3:
-            update_response_box(parts[2])
+    # Session token for reconnecting after a dropped connection
+    if kind == "session":
+        session_token = fields[0]
         return
 
-    # Game already started rejection
-    if message == "GAME_ALREADY_STARTED":
-        log_box.config(state=tk.NORMAL)
-        log_box.insert("end", "Connection rejected: game already started.\n")
-        log_box.config(state=tk.DISABLED)
+    # Reconnected: score, whether we answered, seconds left and the open question
+    if kind == "resumed":
+        score, answered, seconds, question = fields
+        if question:
+            update_question(question)
+            game_active = not answered
+            question_deadline = time.monotonic() + seconds if seconds else None
+        log(f"Reconnected to the game with {score} points.")
+        return
+
+    if kind == "error" and fields[0] == "BAD_SESSION":
+        log("Could not rejoin the game: it is over or the session expired.")
+        session_token = None
         is_connected = False
         s.close()
         return
 
+    if kind == "timeleft":
+        question_deadline = time.monotonic() + fields[0]
+        return
+
+    # Result feedback for the user's answer
+    if kind == "result":
+        question_deadline = None
+        update_response_box(fields[1])
+        return
+
     # Game end notification
-    if message == "GAMEOVER":
-        log_box.config(state=tk.NORMAL)
-        log_box.insert("end", "Game over.\n")
-        log_box.config(state=tk.DISABLED)
+    if kind == "gameover":
+        log("Game over.")
         game_active = False
+        question_deadline = None
+        session_token = None
         return
 
     # Player left notification
-    if message.startswith("USER_LEFT:"):
-        name = message.split(":", 1)[1]
-        log_box.config(state=tk.NORMAL)
-        log_box.insert("end", f"{name} left the game.\n")
-        log_box.config(state=tk.DISABLED)
+    if kind == "left":
+        log(f"{', '.join(fields[0])} left the game.")
         return
 
     # Successful connection message
-    if message.startswith("Welcome,"):
-        log_box.config(state=tk.NORMAL)
-        log_box.insert("end", "Connected successfully!\n")
-        log_box.config(state=tk.DISABLED)
+    if kind == "welcome":
+        log("Connected successfully!")
+        return
+
+    # Answer timing errors
+    if kind == "error":
+        code = fields[0]
+        if code == "GAME_NOT_STARTED":
+            log("You tried to answer before the game started.")
+        elif code == "NO_ACTIVE_QUESTION":
+            log("You tried to answer with no active question.")
+        elif code == "TIME_UP":
+            log("Time was up; your answer was not counted.")
+        else:
+            log(message.text())
+        return
+
+    if kind != "notice":
+        return
+    text = fields[0]
+
+    # Game already started rejection
+    if text == "GAME_ALREADY_STARTED":
+        log("Connection rejected: game already started.")
+        is_connected = False
+        s.close()
+        return
+
+    # The server admits no more players for now
+    if text in ("LOBBY_FULL", "ROOM_FULL"):
+        log("Connection rejected: the lobby is full, try again later.")
+        is_connected = False
+        s.close()
         return
 
     # Username validation errors
-    if message in [
+    if text in [
         "The name cannot be empty!",
         f"The name {username_entry.get().strip().lower()} already exists!",
     ]:
-        log_box.config(state=tk.NORMAL)
-        log_box.insert("end", message + "\n")
-        log_box.config(state=tk.DISABLED)
+        log(text)
         is_connected = False
         s.close()
         return
 
-    # Answer timing errors
-    if message == "ERROR:GAME_NOT_STARTED":
-        log_box.config(state=tk.NORMAL)
-        log_box.insert("end", "You tried to answer before the game started.\n")
-        log_box.config(state=tk.DISABLED)
-        return
+    # Fallback: log anything unexpected
+    log(text)
 
-    if message == "ERROR:NO_ACTIVE_QUESTION":
-        log_box.config(state=tk.NORMAL)
-        log_box.insert("end", "You tried to answer with no active question.\n")
-        log_box.config(state=tk.DISABLED)
-        return
 
+def connection_lost(reason):
     # Server disconnect or socket error
-    if message.startswith("Connection error") or message == "Server closed the connection.":
-        log_box.config(state=tk.NORMAL)
-        log_box.insert("end", message + "\n")
-        log_box.config(state=tk.DISABLED)
-        is_connected = False
-        try:
-            s.close()
-        except:
-            pass
-        return
+    global is_connected, question_deadline
 
-    # Fallback: log anything unexpected
-    log_box.config(state=tk.NORMAL)
-    log_box.insert("end", message + "\n")
-    log_box.config(state=tk.DISABLED)
+    log(reason)
+    is_connected = False
+    question_deadline = None
+    try:
+        s.close()
+    except:
+        pass
+    # Dropped mid-game: try to take our place back
+    if session_token is not None and game_active:
+        log("Trying to reconnect ...")
+        reconnect(session_token)
 
 
 def listen_worker():
-    global s, is_connected, recv_buf
+    global s, is_connected
+
+    # Bytes are framed before decoding, so characters split across reads
+    # are decoded whole; scoreboards of large lobbies can be long
+    decoder = Decoder(MAX_LINE_BYTES)
 
     # Continuously read from the socket while connected
     while is_connected:
         try:
-            chunk = s.recv(1024).decode()
+            chunk = s.recv(RECV_SIZE)
             if not chunk:
-                handle_message("Server closed the connection.")
+                post_ui(lambda: connection_lost("Server closed the connection."))
                 is_connected = False
                 s.close()
                 break
 
-            recv_buf += chunk
-
-            # Process full newline-delimited messages
-            while "\n" in recv_buf:
-                message, recv_buf = recv_buf.split("\n", 1)
-                handle_message(message.strip())
+            # Hand complete messages to the Tk main thread; heartbeats are
+            # answered right here and never reach the UI
+            now = time.monotonic()
+            for message in decoder.feed(chunk):
+                if message.kind == "ping":
+                    send_line(s, f"PONG:{message.fields[0]}\n")
+                else:
+                    ui_events.put((now, message))
 
         except socket.timeout:
             continue
         except Exception as e:
             if is_connected:
-                handle_message(f"Connection error: {e}")
+                reason = f"Connection error: {e}"
+                post_ui(lambda: connection_lost(reason))
             is_connected = False
             try:
                 s.close()
@@ -446,13 +704,14 @@ def disconnect():
 
 
 def disconnect_worker():
-    global s, is_connected
+    global s, is_connected, session_token
+
+    # No reconnecting after this
+    session_token = None
 
     try:
         if not is_connected:
-            log_box.config(state=tk.NORMAL)
-            log_box.insert("end", "Not connected to the server.\n")
-            log_box.config(state=tk.DISABLED)
+            log("Not connected to the server.")
             return
 
         # Stop listener and close socket
@@ -461,22 +720,12 @@ def disconnect_worker():
         s.close()
 
         # Clear scoreboard UI
-        scoreboard_names.config(state=tk.NORMAL)
-        scoreboard_names.delete(1.0, tk.END)
-        scoreboard_names.config(state=tk.DISABLED)
+        post_ui(clear_scoreboard)
 
-        scoreboard_scores.config(state=tk.NORMAL)
-        scoreboard_scores.delete(1.0, tk.END)
-        scoreboard_scores.config(state=tk.DISABLED)
-
-        log_box.config(state=tk.NORMAL)
-        log_box.insert("end", "Disconnected from the server.\n")
-        log_box.config(state=tk.DISABLED)
+        log("Disconnected from the server.")
 
     except Exception as e:
-        log_box.config(state=tk.NORMAL)
-        log_box.insert("end", "Error disconnecting: " + str(e) + "\n")
-        log_box.config(state=tk.DISABLED)
+        log("Error disconnecting: " + str(e))
         is_connected = False
 
 
@@ -500,8 +749,29 @@ def on_closing():
 is_connected = False
 game_active = False
 
-# Buffer used to accumulate partial socket messages
-recv_buf = ""
+# Scoreboard state: username -> (rank, score), and the rows on screen as
+# (username, name text, score text) so deltas only touch changed lines
+scoreboard_rows = {}
+scoreboard_lines = []
+
+# Inbound messages for the Tk main thread as (receive time, message), and
+# callables for UI actions posted by the worker threads
+ui_events = queue.Queue()
+
+# Updates waiting to be painted: kind -> latest value
+pending_ui = {}
+
+# Read-to-paint latency (seconds) of the oldest message in each painted pass
+ui_latencies = collections.deque(maxlen=UI_LATENCY_SAMPLES)
+ui_coalesced = 0
+ui_stats_shown = 0.0
+
+# time.monotonic() at which the current question closes, if it has a limit
+question_deadline = None
+
+# Token from the server's SESSION line, used to reconnect mid-game
+session_token = None
+countdown_shown = "Question"
 
 root = tk.Tk()
 build_ui(root)
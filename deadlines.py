@@ -0,0 +1,101 @@
+# Monotonic-clock deadline scheduler shared by every game room.
+#
+# Pending callbacks sit in one heap ordered by their time.monotonic()
+# deadline and a single thread sleeps until the earliest is due, so any
+# number of rooms can have rounds (and their countdown ticks) running at
+# once for the cost of a heap push and pop each. Cancelling only marks the
+# entry; it is dropped when it reaches the top of the heap. Callbacks run on
+# the scheduler thread, so they must be short and must not block.
+import heapq
+import itertools
+import threading
+import time
+
+
+class Deadline:
+    __slots__ = ("when", "fn", "args", "cancelled")
+
+    def __init__(self, when, fn, args):
+        self.when = when
+        self.fn = fn
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class DeadlineScheduler:
+
+    def __init__(self, lateness_histogram=None, on_error=None):
+        # lateness_histogram observes how long after its deadline each
+        # callback started; on_error is called with exceptions raised by
+        # callbacks
+        self.lateness_histogram = lateness_histogram
+        self.on_error = on_error
+        self.cond = threading.Condition()
+        self.heap = []                  # (when, seq, Deadline)
+        self.seq = itertools.count()
+        self.thread = None
+        self.stopped = False
+
+    def call_at(self, when, fn, *args):
+        # Run fn(*args) once time.monotonic() reaches when; returns a
+        # Deadline whose cancel() stops it from running
+        deadline = Deadline(when, fn, args)
+        with self.cond:
+            if self.thread is None and not self.stopped:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            heapq.heappush(self.heap, (when, next(self.seq), deadline))
+            # Only a new earliest deadline changes how long the thread sleeps
+            if self.heap[0][2] is deadline:
+                self.cond.notify()
+        return deadline
+
+    def call_later(self, delay, fn, *args):
+        return self.call_at(time.monotonic() + delay, fn, *args)
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.heap.clear()
+            self.cond.notify()
+
+    def pending(self):
+        with self.cond:
+            return sum(1 for _, _, d in self.heap if not d.cancelled)
+
+    def next_due(self):
+        # Wait for the earliest live deadline and pop it; None once stopped
+        with self.cond:
+            while not self.stopped:
+                if not self.heap:
+                    self.cond.wait()
+                    continue
+                when, _, deadline = self.heap[0]
+                if deadline.cancelled:
+                    heapq.heappop(self.heap)
+                    continue
+                delay = when - time.monotonic()
+                if delay > 0:
+                    self.cond.wait(delay)
+                    continue
+                heapq.heappop(self.heap)
+                return deadline
+        return None
+
+    def run(self):
+        while True:
+            deadline = self.next_due()
+            if deadline is None:
+                return
+            if deadline.cancelled:
+                continue
+            if self.lateness_histogram is not None:
+                self.lateness_histogram.observe(time.monotonic() - deadline.when)
+            try:
+                deadline.fn(*deadline.args)
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(e)
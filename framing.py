@@ -0,0 +1,74 @@
+# Newline-delimited message framing shared by the server and clients.
+#
+# TCP is a byte stream: one recv() may hold half a message or several of
+# them. LineFramer buffers raw bytes per connection and hands back complete
+# lines. Splitting happens on bytes, and each finished line is decoded once;
+# a b"\n" byte never occurs inside a multibyte UTF-8 sequence, so characters
+# straddling a recv() boundary are simply carried in the buffer until their
+# line is complete. Bytes already searched for a newline are not searched
+# again, so a long line arriving in many small reads is framed in linear
+# time.
+import re
+
+# Legacy clients send answers without a trailing newline
+LEGACY_ANSWER = re.compile(rb"ANSWER:[A-Za-z]")
+
+# Upper bound on a single buffered line; a peer that exceeds it without
+# sending a newline is treated as broken
+MAX_LINE_BYTES = 64 * 1024
+
+
+class FrameTooLong(ValueError):
+    pass
+
+
+class LineFramer:
+
+    def __init__(self, max_line=MAX_LINE_BYTES):
+        self.max_line = max_line
+        self.buf = bytearray()
+        self.scanned = 0        # leading bytes of buf known to hold no newline
+
+    def feed(self, data):
+        # Add received bytes and return every complete line as a str,
+        # without its trailing newline
+        buf = self.buf
+        buf += data
+
+        messages = []
+        start = 0
+        nl = buf.find(b"\n", self.scanned)
+        while nl >= 0:
+            messages.append(buf[start:nl].decode("utf-8", "replace"))
+            start = nl + 1
+            nl = buf.find(b"\n", start)
+
+        if start:
+            del buf[:start]
+        self.scanned = len(buf)
+        if len(buf) > self.max_line:
+            buf.clear()
+            self.scanned = 0
+            raise FrameTooLong(f"message exceeds {self.max_line} bytes")
+        return messages
+
+    def pending(self):
+        # Bytes of the incomplete line received so far
+        return bytes(self.buf)
+
+    def take_pending(self):
+        # Remove and return the incomplete line as a str
+        data = self.buf.decode("utf-8", "replace")
+        self.buf.clear()
+        self.scanned = 0
+        return data
+
+
+def split_handshake(data):
+    # The first message on a connection is the username. Current clients
+    # terminate it with a newline and may pipeline more messages after it;
+    # legacy clients send the bare name in a single segment.
+    name, sep, rest = data.partition(b"\n")
+    if not sep:
+        return data, b""
+    return name, rest
@@ -0,0 +1,605 @@
+# Gateway processes: one large game spread over several CPU cores.
+#
+# In "gateways" I/O mode the QuizServer process is the coordinator: it runs
+# the rooms, rounds, answer ranking and scoreboards but owns no client
+# socket. GatewayPool starts N gateway processes (this file, run as a
+# script). Each binds the public port with SO_REUSEPORT, so the kernel
+# spreads new connections over them, and does all the per-client socket
+# work: accepting (with its share of the handshake rate and pending
+# handshake limit), reading and line framing, encoding messages for each
+# connection's protocol version and the non-blocking outbound queues of
+# outbound.FanOut.
+#
+# Coordinator and gateway talk over a socketpair the gateway inherits. Each
+# item is a pickled tuple preceded by its 4-byte big-endian length; both
+# ends are this module, so nothing from a client is ever unpickled.
+#
+#   gateway -> coordinator
+#   ("ready", error)                  listening, or why not (str)
+#   ("open", cid, addr)               new client connection
+#   ("hello", cid, data)              its first message: username or RESUME:
+#   ("lines", cid, lines, at)         framed lines, read at time.monotonic() at
+#   ("closed", cid, reason)           connection gone: None, "evicted",
+#                                     "oversized" or an error text
+#   ("stats", stats)                  the gateway's FanOut.stats(), every second
+#   ("written", stamps)               [(cid, at)]: timed sends written out at
+#                                     time.monotonic() at
+#   ("pinged", cids, at)              PING handed to these connections at
+#                                     time.monotonic() at
+#
+#   coordinator -> gateway
+#   ("send", cids, data, protocol, timed)
+#                                     data: bytes, or (kind, fields) of a Message
+#   ("sendeach", pairs)               [(cid, data)]: a message of its own for
+#                                     each connection
+#   ("close", cid, flush)
+#
+# A broadcast crosses each link once, carrying the ids of that gateway's
+# recipients, and every gateway encodes it for its own connections, so the
+# fan-out work of questions and scoreboards is divided among the gateways.
+# Per-player messages sent together (every player's rank after a scoreboard
+# update) also cross each link as one item.
+# time.monotonic() is system-wide on the platforms that have SO_REUSEPORT,
+# so arrival and write times stamped by a gateway compare with the
+# coordinator's clock. Round trips are timed from the gateway's own PING
+# stamp, so the link's delay is not taken for network latency. A gateway
+# exits when its link to the coordinator closes.
+import argparse
+import itertools
+import os
+import pickle
+import selectors
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+from admission import TokenBucket
+from framing import LEGACY_ANSWER, FrameTooLong, LineFramer, split_handshake
+from outbound import CLOSE_GRACE, MAX_QUEUE_BYTES, FanOut
+from protocol import Message
+
+GATEWAY_SCRIPT = os.path.abspath(__file__)
+
+# Bytes requested per recv() on client sockets and on the link
+RECV_SIZE = 16 * 1024
+LINK_RECV_SIZE = 256 * 1024
+
+HEADER = struct.Struct("!I")
+
+# Seconds between a gateway's stats reports and its sweeps for connections
+# closed by its fan-out
+REPORT_INTERVAL = 1.0
+
+# Seconds the coordinator waits for a gateway to start listening
+START_TIMEOUT = 10.0
+
+
+def wire(data):
+    # What a link carries for bytes or a Message to send to clients
+    if isinstance(data, Message):
+        return data.kind, data.fields
+    return data
+
+
+class Link:
+    # One end of a coordinator <-> gateway channel. send() only queues the
+    # pickled item; a writer thread ships everything queued since its last
+    # write in one sendall, so a burst of small messages (a MYRANK for every
+    # player) costs a few system calls rather than one each.
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+        self.queued = threading.Condition(self.lock)
+        self.out = []                   # encoded items not yet written
+        self.closed = False
+        self.buf = bytearray()          # received bytes not yet decoded
+        self.items = []                 # decoded items not yet taken by receive()
+        self.writer = threading.Thread(target=self.writer_loop, daemon=True)
+        self.writer.start()
+
+    def send(self, *item):
+        # Returns False once the link is closed
+        data = pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            if self.closed:
+                return False
+            self.out.append(HEADER.pack(len(data)) + data)
+            if len(self.out) == 1:
+                self.queued.notify()
+        return True
+
+    def close(self):
+        # Items already queued are still written
+        with self.lock:
+            self.closed = True
+            self.queued.notify()
+
+    def writer_loop(self):
+        while True:
+            with self.lock:
+                while not self.out and not self.closed:
+                    self.queued.wait()
+                out, self.out = self.out, []
+                closing = self.closed
+            if out:
+                try:
+                    self.sock.sendall(b"".join(out))
+                except OSError:
+                    with self.lock:
+                        self.closed = True
+                        self.out = []
+                    break
+            elif closing:
+                break
+        # The peer reads EOF, and a receive() blocked on this end returns
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def feed(self, data):
+        # Add received bytes and return every complete item
+        buf = self.buf
+        buf += data
+        items = []
+        start = 0
+        while len(buf) - start >= HEADER.size:
+            (size,) = HEADER.unpack_from(buf, start)
+            end = start + HEADER.size + size
+            if len(buf) < end:
+                break
+            items.append(pickle.loads(buf[start + HEADER.size:end]))
+            start = end
+        del buf[:start]
+        return items
+
+    def receive(self):
+        # Blocking: the next item from the peer, or None once it is gone
+        while not self.items:
+            try:
+                data = self.sock.recv(LINK_RECV_SIZE)
+            except OSError:
+                data = b""
+            if not data:
+                return None
+            self.items = self.feed(data)
+            self.items.reverse()
+        return self.items.pop()
+
+
+def listen(ip, port, backlog):
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        s.bind((ip, port))
+        s.listen(backlog)
+    except OSError:
+        s.close()
+        raise
+    s.setblocking(False)
+    return s
+
+
+class Gateway:
+    # The gateway process: a selectors loop over the listening socket, the
+    # client sockets and the link, plus the FanOut writer thread and the
+    # link's writer thread
+
+    def __init__(self, link, ip, port, listen_backlog, handshake_rate, max_pending_handshakes,
+                 max_queue_bytes):
+        self.link = link
+        self.ip = ip
+        self.port = port
+        self.listen_backlog = listen_backlog
+        self.handshake_rate = handshake_rate
+        self.max_pending_handshakes = max(1, max_pending_handshakes)
+        self.fanout = FanOut(max_queue_bytes, on_evict=self.on_evict)
+        self.sel = selectors.DefaultSelector()
+        self.cids = itertools.count(1)
+        self.states = {}                # cid -> per-connection state
+        self.pending = 0                # accepted connections yet to send a first message
+        self.evicted = []               # states of connections the fan-out evicted
+        self.timing = {}                # cid -> state whose timed send is not reported yet
+
+    def on_evict(self, conn):
+        # Called from Connection.send, i.e. on the loop thread
+        self.evicted.append(conn.gateway_state)
+
+    def serve(self):
+        try:
+            listener = listen(self.ip, self.port, self.listen_backlog)
+        except OSError as e:
+            self.link.send("ready", str(e))
+            self.link.close()
+            self.link.writer.join()
+            return
+        self.link.send("ready", None)
+        self.fanout.start()
+
+        sel = self.sel
+        sel.register(self.link.sock, selectors.EVENT_READ, self.link)
+        sel.register(listener, selectors.EVENT_READ, None)
+        listening = True
+        bucket = TokenBucket(self.handshake_rate, self.handshake_rate)
+        next_report = 0.0
+        running = True
+
+        while running:
+            wait = bucket.delay()
+            admit = not wait and self.pending < self.max_pending_handshakes
+            if admit != listening:
+                if admit:
+                    sel.register(listener, selectors.EVENT_READ, None)
+                else:
+                    sel.unregister(listener)
+                listening = admit
+
+            events = sel.select(timeout=min(wait, 1.0) if wait else 1.0)
+            # Before any answer read below, so the coordinator has each
+            # player's question write time when it records the answer
+            self.report_written()
+            for key, _ in events:
+                if key.data is self.link:
+                    running = self.read_link()
+                elif key.data is None:
+                    self.accept(listener, bucket)
+                else:
+                    self.read_client(key.data)
+            for state in self.evicted:
+                self.drop(state, "evicted")
+            self.evicted = []
+
+            now = time.monotonic()
+            if now >= next_report:
+                self.forget_closed_connections()
+                self.link.send("stats", self.fanout.stats())
+                next_report = now + REPORT_INTERVAL
+
+        # The coordinator is gone or shutting down: what it queued is
+        # flushed for up to CLOSE_GRACE seconds
+        listener.close()
+        self.fanout.stop()
+        self.fanout.thread.join(CLOSE_GRACE + 1)
+        self.link.close()
+        self.link.writer.join(1)
+        sel.close()
+
+    def accept(self, listener, bucket):
+        try:
+            sock, addr = listener.accept()
+        except OSError:
+            return
+        bucket.take()
+        sock.setblocking(True)
+        # A recycled descriptor means the old socket was closed elsewhere
+        stale = self.sel.get_map().get(sock.fileno())
+        if stale is not None:
+            self.drop(stale.data, None)
+        cid = next(self.cids)
+        conn = self.fanout.connect(sock, addr)
+        state = {"cid": cid, "conn": conn, "framer": LineFramer(), "handshaking": True}
+        conn.gateway_state = state
+        self.states[cid] = state
+        self.pending += 1
+        self.sel.register(sock, selectors.EVENT_READ, state)
+        self.link.send("open", cid, addr)
+
+    def drop(self, state, reason):
+        # Stop serving a connection and tell the coordinator; the socket
+        # may already be closed
+        if self.states.pop(state["cid"], None) is None:
+            return
+        conn = state["conn"]
+        try:
+            self.sel.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        conn.close(flush=False)
+        if state["handshaking"]:
+            self.pending -= 1
+        self.link.send("closed", state["cid"], reason)
+
+    def forget_closed_connections(self):
+        # Connections the fan-out closed (after flushing them for the
+        # coordinator, or on a write error) are no longer reported by the
+        # selector, so sweep them
+        for state in list(self.states.values()):
+            if state["conn"].closed:
+                self.drop(state, None)
+
+    def report_written(self):
+        # Tell the coordinator when timed sends went out, in one item
+        stamps = []
+        for cid, state in list(self.timing.items()):
+            conn = state["conn"]
+            if conn.written_at is not None:
+                stamps.append((cid, conn.written_at))
+            elif not conn.closed:
+                continue
+            del self.timing[cid]
+        if stamps:
+            self.link.send("written", stamps)
+
+    def read_client(self, state):
+        conn = state["conn"]
+        try:
+            data = conn.sock.recv(RECV_SIZE)
+        except OSError as e:
+            self.drop(state, str(e))
+            return
+        if not data:
+            self.drop(state, None)
+            return
+        at = time.monotonic()
+
+        # First message on a connection is the username handshake
+        if state["handshaking"]:
+            state["handshaking"] = False
+            self.pending -= 1
+            name, data = split_handshake(data)
+            self.link.send("hello", state["cid"], name)
+            if not data:
+                return
+
+        framer = state["framer"]
+        try:
+            lines = framer.feed(data)
+        except FrameTooLong:
+            self.drop(state, "oversized")
+            return
+        if LEGACY_ANSWER.fullmatch(framer.buf):
+            lines.append(framer.take_pending())
+        # Sent even without a complete line: data is a sign of life
+        self.link.send("lines", state["cid"], lines, at)
+
+    def read_link(self):
+        # Carry out the coordinator's sends and closes. Returns False once
+        # the coordinator is gone.
+        try:
+            data = self.link.sock.recv(LINK_RECV_SIZE)
+        except OSError:
+            data = b""
+        if not data:
+            return False
+        for item in self.link.feed(data):
+            if item[0] == "send":
+                _, cids, data, protocol, timed = item
+                if not isinstance(data, bytes):
+                    data = Message(data[0], *data[1])
+                for cid in cids:
+                    state = self.states.get(cid)
+                    if state is not None:
+                        state["conn"].send(data, protocol, timed)
+                        if timed:
+                            self.timing[cid] = state
+                # Ahead of the PONGs on the link, so the coordinator
+                # measures them from here
+                if isinstance(data, Message) and data.kind == "ping":
+                    self.link.send("pinged", cids, time.monotonic())
+            elif item[0] == "sendeach":
+                for cid, data in item[1]:
+                    state = self.states.get(cid)
+                    if state is not None:
+                        if not isinstance(data, bytes):
+                            data = Message(data[0], *data[1])
+                        state["conn"].send(data)
+            elif item[0] == "close":
+                _, cid, flush = item
+                state = self.states.get(cid)
+                if state is None:
+                    continue
+                if flush:
+                    # Reported closed by the sweep once its queue is out
+                    state["conn"].close(flush=True)
+                else:
+                    self.drop(state, None)
+        return True
+
+
+class RemoteConnection:
+    # The coordinator's stand-in for a client connection owned by a
+    # gateway; the engine uses it like an outbound.Connection
+
+    def __init__(self, link, cid, addr):
+        self.link = link
+        self.cid = cid
+        self.addr = addr
+        self.closed = False
+        self.handshaking = True             # until the gateway forwards the first message
+
+        # Per-client protocol state owned by the engine
+        self.username = None
+        self.room = None
+        self.caps = set()
+        self.sent_rank = None
+        self.session = None
+        self.protocol = 1                   # version the gateway encodes messages in
+        self.last_heard = time.monotonic()
+        self.last_ping = 0.0
+        self.ping_stamp = None
+        self.rtt = None
+        self.written_at = None              # reported by the gateway for timed sends
+
+    def send(self, data, protocol=None, timed=False):
+        # The link keeps messages in order, so a protocol switch takes
+        # effect at the gateway exactly after data, as in Connection.send
+        if self.closed:
+            return False
+        if protocol is not None:
+            self.protocol = protocol
+        if timed:
+            self.written_at = None
+        return self.link.send("send", (self.cid,), wire(data), protocol, timed)
+
+    def close(self, flush=True):
+        # The gateway reports the connection closed once it is gone
+        if self.closed:
+            return
+        self.closed = True
+        self.link.send("close", self.cid, flush)
+
+
+class GatewayPool:
+    # The engine's fan-out in gateways mode, with the outbound.FanOut
+    # interface it uses: starts the gateway processes and routes messages
+    # to the connections they own
+
+    def __init__(self, count, max_queue_bytes=MAX_QUEUE_BYTES, on_evict=None):
+        self.count = max(1, count)
+        self.max_queue_bytes = max_queue_bytes
+        self.on_evict = on_evict
+        self.lock = threading.Lock()
+        self.connections = {}           # (link, cid) -> RemoteConnection
+        self.links = []
+        self.procs = []
+        self.reports = {}               # link -> its gateway's last FanOut.stats()
+
+    def start(self, ip, port, listen_backlog, handshake_rate, max_pending_handshakes):
+        # Start the gateways, each with its share of the admission limits,
+        # and wait until all are listening. Raises OSError if one cannot.
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise OSError("gateways need SO_REUSEPORT, which this platform does not have")
+        for _ in range(self.count):
+            ours, theirs = socket.socketpair()
+            self.procs.append(subprocess.Popen(
+                [sys.executable, GATEWAY_SCRIPT, "--link-fd", str(theirs.fileno()),
+                 "--ip", ip, "--port", str(port), "--listen-backlog", str(listen_backlog),
+                 "--handshake-rate", str(handshake_rate / self.count),
+                 "--max-pending-handshakes", str(max(1, max_pending_handshakes // self.count)),
+                 "--max-queue-bytes", str(self.max_queue_bytes)],
+                pass_fds=(theirs.fileno(),),
+            ))
+            theirs.close()
+            self.links.append(Link(ours))
+
+        for link in self.links:
+            link.sock.settimeout(START_TIMEOUT)
+            item = link.receive()
+            link.sock.settimeout(None)
+            if item is None or item[1]:
+                self.stop()
+                raise OSError(item[1] if item else "a gateway process exited during startup")
+
+    def open(self, link, cid, addr):
+        conn = RemoteConnection(link, cid, addr)
+        with self.lock:
+            self.connections[link, cid] = conn
+        return conn
+
+    def get(self, link, cid):
+        with self.lock:
+            return self.connections.get((link, cid))
+
+    def closed(self, conn):
+        conn.closed = True
+        with self.lock:
+            self.connections.pop((conn.link, conn.cid), None)
+
+    def drop_link(self, link):
+        # A gateway exited: its connections are gone. Returns them.
+        with self.lock:
+            conns = [c for (l, _), c in self.connections.items() if l is link]
+            self.reports.pop(link, None)
+        for conn in conns:
+            self.closed(conn)
+        return conns
+
+    def report(self, link, stats):
+        with self.lock:
+            self.reports[link] = stats
+
+    def evicted(self, conn):
+        if self.on_evict:
+            self.on_evict(conn)
+
+    def open_connections(self):
+        with self.lock:
+            return list(self.connections.values())
+
+    def broadcast(self, conns, data, timed=False):
+        # One item per gateway, carrying the ids of its recipients
+        groups = {}
+        for conn in conns:
+            if not conn.closed:
+                groups.setdefault(conn.link, []).append(conn.cid)
+                if timed:
+                    conn.written_at = None
+        data = wire(data)
+        for link, cids in groups.items():
+            link.send("send", cids, data, None, timed)
+
+    def send_each(self, pairs):
+        # [(conn, data)]: one item per gateway, carrying (cid, data) for
+        # each of its recipients
+        groups = {}
+        for conn, data in pairs:
+            if not conn.closed:
+                groups.setdefault(conn.link, []).append((conn.cid, wire(data)))
+        for link, items in groups.items():
+            link.send("sendeach", items)
+
+    def written(self, link, stamps):
+        # A gateway's report of when timed sends went out
+        with self.lock:
+            conns = [(self.connections.get((link, cid)), at) for cid, at in stamps]
+        for conn, at in conns:
+            if conn is not None:
+                conn.written_at = at
+
+    def pinged(self, link, cids, at):
+        # When a gateway handed out a PING; round trips count from there
+        with self.lock:
+            conns = [self.connections.get((link, cid)) for cid in cids]
+        for conn in conns:
+            if conn is not None:
+                conn.last_ping = at
+
+    def stats(self):
+        # Totals of the gateways' last reports (at most a second old)
+        with self.lock:
+            reports = list(self.reports.values())
+            stats = {"connections": len(self.connections)}
+        for key in ("bytes_sent", "bytes_deferred", "evictions", "queued_bytes", "backlogged_connections"):
+            stats[key] = sum(r[key] for r in reports)
+        stats["max_backlog_bytes"] = max((r["max_backlog_bytes"] for r in reports), default=0)
+        return stats
+
+    def stop(self):
+        # Gateways flush their clients for up to CLOSE_GRACE seconds, then exit
+        for link in self.links:
+            link.close()
+        for proc in self.procs:
+            try:
+                proc.wait(CLOSE_GRACE + 2)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SUquid gateway process (started by the server)")
+    parser.add_argument("--link-fd", type=int, required=True, help="socket connected to the coordinator")
+    parser.add_argument("--ip", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5004)
+    parser.add_argument("--listen-backlog", type=int, default=4096)
+    parser.add_argument("--handshake-rate", type=float, default=0)
+    parser.add_argument("--max-pending-handshakes", type=int, default=512)
+    parser.add_argument("--max-queue-bytes", type=int, default=MAX_QUEUE_BYTES)
+    args = parser.parse_args(argv)
+
+    # Ctrl-C reaches the whole process group; the coordinator decides when
+    # the gateways stop, by closing their links
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    link = Link(socket.socket(fileno=args.link_fd))
+    Gateway(link, args.ip, args.port, args.listen_backlog, args.handshake_rate,
+            args.max_pending_handshakes, args.max_queue_bytes).serve()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
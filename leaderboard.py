@@ -0,0 +1,176 @@
+# Incrementally maintained scoreboard for connected players.
+#
+# Players are kept in a list sorted by (-score, join order), so ties keep
+# the order in which players joined, as the original full re-sort did.
+# Score changes move only the affected entries (bisect), or fall back to a
+# single re-sort when most of the lobby changed at once. The ranked view
+# (rank with ties, as "1. alice") and the SCOREBOARD message, whose
+# encodings protocol.Message caches, are built on first use after a change
+# and cached until the next one.
+import bisect
+import itertools
+import threading
+
+from protocol import Message
+
+# Above this fraction of changed players one sort beats per-entry moves
+RESORT_FRACTION = 0.125
+
+
+class Leaderboard:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.scores = {}      # username -> score
+        self.keys = {}        # username -> sort key in self.order
+        self.order = []       # sorted [(-score, join_seq, username)]
+        self.join_seq = itertools.count()
+        self._ranked = None   # cached [(rank, username, score)]
+        self._ranks = None    # cached username -> rank
+        self._message = None  # cached scoreboard Message
+
+    def __len__(self):
+        return len(self.order)
+
+    def __contains__(self, username):
+        return username in self.keys
+
+    def _changed(self):
+        self._ranked = None
+        self._ranks = None
+        self._message = None
+
+    def add(self, username, score=0):
+        with self.lock:
+            if username in self.keys:
+                return
+            key = (-score, next(self.join_seq), username)
+            self.scores[username] = score
+            self.keys[username] = key
+            bisect.insort(self.order, key)
+            self._changed()
+
+    def remove(self, username):
+        with self.lock:
+            key = self.keys.pop(username, None)
+            if key is None:
+                return
+            del self.scores[username]
+            del self.order[bisect.bisect_left(self.order, key)]
+            self._changed()
+
+    def add_points(self, points):
+        # Apply {username: delta} for players on the board; others are ignored
+        with self.lock:
+            changed = [(u, d) for u, d in points.items() if d and u in self.keys]
+            if not changed:
+                return
+
+            if len(changed) > len(self.order) * RESORT_FRACTION:
+                for u, d in changed:
+                    self.scores[u] += d
+                    _, seq, _ = self.keys[u]
+                    self.keys[u] = (-self.scores[u], seq, u)
+                self.order = sorted(self.keys.values())
+            else:
+                for u, d in changed:
+                    old = self.keys[u]
+                    del self.order[bisect.bisect_left(self.order, old)]
+                    self.scores[u] += d
+                    new = (-self.scores[u], old[1], u)
+                    self.keys[u] = new
+                    bisect.insort(self.order, new)
+            self._changed()
+
+    def clear(self):
+        with self.lock:
+            self.scores.clear()
+            self.keys.clear()
+            self.order.clear()
+            self._changed()
+
+    def _build(self):
+        # Rank with ties: tied players share the rank of the first of them
+        ranked = []
+        ranks = {}
+        current_rank = 0
+        prev_score = None
+        for idx, (neg_score, _, u) in enumerate(self.order, start=1):
+            score = -neg_score
+            if prev_score is None or score < prev_score:
+                current_rank = idx
+                prev_score = score
+            ranked.append((current_rank, u, score))
+            ranks[u] = current_rank
+        self._ranked = ranked
+        self._ranks = ranks
+
+    def ranked(self):
+        with self.lock:
+            if self._ranked is None:
+                self._build()
+            return self._ranked
+
+    def rank_of(self, username):
+        with self.lock:
+            if self._ranks is None:
+                self._build()
+            return self._ranks.get(username)
+
+    def winners(self):
+        # (usernames sharing the top score, top score), or ([], None)
+        with self.lock:
+            if not self.order:
+                return [], None
+            top = self.order[0][0]
+            names = []
+            for neg_score, _, u in self.order:
+                if neg_score != top:
+                    break
+                names.append(u)
+            return names, -top
+
+    def message(self):
+        # The full scoreboard Message, shared by all recipients
+        with self.lock:
+            if self._message is None:
+                if self._ranked is None:
+                    self._build()
+                self._message = Message("scoreboard", self._ranked)
+            return self._message
+
+
+# Top-N scoreboard protocol for clients that announced CAPS:scoredelta.
+# Instead of the full SCOREBOARD line every recipient gets:
+#   SCORETOP:ranked_names_csv:scores_csv:total_players    (snapshot on opt-in)
+#   SCOREDELTA:ranked_names_csv:scores_csv:removed_csv:total_players
+#   MYRANK:rank:score:total_players                       (per recipient)
+# Ranked names use the SCOREBOARD form ("3. alice"). A delta lists only
+# top-N entries whose rank or score changed, plus names that left the top N.
+# The *_message functions build protocol Messages.
+
+def top_view(ranked, n):
+    # {username: (rank, score)} for the first n ranked rows
+    return {u: (rank, score) for rank, u, score in ranked[:n]}
+
+
+def _rows(entries):
+    return [(rank, u, score) for u, (rank, score) in entries]
+
+
+def top_message(view, total):
+    rows = sorted(_rows(view.items()), key=lambda row: row[0])
+    return Message("scoretop", rows, total)
+
+
+def delta_message(old_view, new_view, old_total, total):
+    # Delta from old_view to new_view, or None if nothing changed
+    changed = [(u, entry) for u, entry in new_view.items() if old_view.get(u) != entry]
+    removed = [u for u in old_view if u not in new_view]
+    if not changed and not removed and old_total == total:
+        return None
+    return Message("scoredelta", _rows(changed), removed, total)
+
+
+def rank_message(rank, score, total):
+    return Message("myrank", rank, score, total)
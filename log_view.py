@@ -0,0 +1,100 @@
+# Batched, bounded event log for the Tk front-ends.
+#
+# Inserting into a Text widget once per message, from whichever thread
+# produced it, made the GUIs fall behind busy games and let the log grow
+# forever. LogView instead collects lines from any thread and renders them
+# on the Tk main thread every LOG_INTERVAL_MS through after(): one insert
+# and one scroll per batch, whatever the number of lines. The widget keeps
+# at most max_lines lines (older ones are trimmed from the top), and a
+# burst larger than that is cut down to its newest lines before it is ever
+# rendered; both are counted, and skipped lines are noted in the log.
+import collections
+import queue
+import threading
+import tkinter as tk
+
+# Lines kept in the widget
+MAX_LOG_LINES = 1000
+
+# How often pending lines are rendered
+LOG_INTERVAL_MS = 100
+
+
+class LogView:
+
+    def __init__(self, root, widget, source=None, max_lines=MAX_LOG_LINES, interval_ms=LOG_INTERVAL_MS):
+        # source is an optional queue.Queue of lines (None entries are
+        # ignored) drained on every render, besides lines given to write()
+        self.root = root
+        self.widget = widget
+        self.source = source
+        self.max_lines = max_lines
+        self.interval_ms = interval_ms
+
+        self.lock = threading.Lock()
+        self.pending = collections.deque()
+        self.dropped = 0        # lines skipped before they were rendered
+        self.reported = 0       # of those, already noted in the log
+        self.trimmed = 0        # lines rendered and later trimmed from the top
+
+        # Lines already in the widget (e.g. a heading) stay above the log
+        self.header_lines = int(widget.index("end-1c").split(".")[0]) - 1
+        self.lines = 0
+
+        self.root.after(self.interval_ms, self.render)
+
+    def write(self, line):
+        # Safe to call from any thread
+        with self.lock:
+            self.pending.append(line)
+            # One line of a full batch is left for the "skipped" note
+            if len(self.pending) >= self.max_lines:
+                self.pending.popleft()
+                self.dropped += 1
+
+    def take_batch(self):
+        # (lines to render, lines skipped since the last batch)
+        if self.source is not None:
+            try:
+                while True:
+                    line = self.source.get_nowait()
+                    if line is not None:
+                        self.write(line)
+            except queue.Empty:
+                pass
+
+        with self.lock:
+            batch = list(self.pending)
+            self.pending.clear()
+            skipped = self.dropped - self.reported
+            self.reported = self.dropped
+        return batch, skipped
+
+    def render(self):
+        batch, skipped = self.take_batch()
+        if skipped:
+            batch.insert(0, f"... {skipped} log lines skipped ...")
+
+        if batch:
+            try:
+                self.insert(batch)
+            except tk.TclError:
+                # The window is being destroyed
+                return
+        self.root.after(self.interval_ms, self.render)
+
+    def insert(self, batch):
+        widget = self.widget
+        widget.config(state=tk.NORMAL)
+        widget.insert(tk.END, "\n".join(batch) + "\n")
+        self.lines += len(batch)
+
+        excess = self.lines - self.max_lines
+        if excess > 0:
+            first = self.header_lines + 1
+            widget.delete(f"{first}.0", f"{first + excess}.0")
+            self.lines -= excess
+            self.trimmed += excess
+
+        widget.config(state=tk.DISABLED)
+        widget.yview(tk.END)
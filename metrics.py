@@ -0,0 +1,236 @@
+# Counters, gauges and histograms for server health, served in the
+# Prometheus text format.
+#
+# A Registry holds the metrics; the engine records into them as it runs
+# and render() produces the exposition text on demand. Gauges and counters
+# can also be backed by a function that is only called at scrape time, for
+# values the engine already tracks (connected players, outbound bytes).
+# serve() exposes a registry over HTTP:
+#
+#   curl http://127.0.0.1:9104/metrics
+#
+# TimedLock is a drop-in threading.Lock that records how long threads wait
+# for it and how long it is held; it also works under threading.Condition.
+import bisect
+import http.server
+import threading
+import time
+
+# Upper bounds (seconds) for latency histograms
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+
+def _label_value(value):
+    # Backslash, double quote and newline must be escaped in label values
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labels, extra=None):
+    items = list(labels.items())
+    if extra:
+        items.append(extra)
+    if not items:
+        return ""
+    body = ",".join(f'{k}="{_label_value(v)}"' for k, v in items)
+    return "{" + body + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, labels, fn=None):
+        self.name = name
+        self.labels = labels
+        self.fn = fn
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        value = self.fn() if self.fn else self.value
+        return [(self.name, self.labels, None, value)]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(self.buckets) + 1)   # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        # with histogram.time(): ... observes the block's duration
+        return _Timer(self)
+
+    def samples(self):
+        with self.lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        samples = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            samples.append((self.name + "_bucket", self.labels, ("le", _number(float(bound))), cumulative))
+        samples.append((self.name + "_sum", self.labels, None, total))
+        samples.append((self.name + "_count", self.labels, None, count))
+        return samples
+
+
+class _Timer:
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Registry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.families = {}    # name -> (kind, help, [metric])
+
+    def _add(self, metric, help_text):
+        with self.lock:
+            family = self.families.setdefault(metric.name, (metric.kind, help_text, []))
+            if family[0] != metric.kind:
+                raise ValueError(f"{metric.name} is already registered as a {family[0]}")
+            family[2].append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=None, fn=None):
+        return self._add(Counter(name, labels or {}, fn), help_text)
+
+    def gauge(self, name, help_text, labels=None, fn=None):
+        return self._add(Gauge(name, labels or {}, fn), help_text)
+
+    def histogram(self, name, help_text, labels=None, buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, labels or {}, buckets), help_text)
+
+    def render(self):
+        with self.lock:
+            families = [(name, kind, help_text, list(metrics))
+                        for name, (kind, help_text, metrics) in sorted(self.families.items())]
+        lines = []
+        for name, kind, help_text, metrics in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for metric in metrics:
+                for sample_name, labels, extra, value in metric.samples():
+                    lines.append(f"{sample_name}{_label_text(labels, extra)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class TimedLock:
+
+    def __init__(self, wait_histogram, hold_histogram):
+        self._lock = threading.Lock()
+        self.wait_histogram = wait_histogram
+        self.hold_histogram = hold_histogram
+        self.owner = None
+        self.acquired_at = 0.0
+
+    def acquire(self, blocking=True, timeout=-1):
+        start = time.perf_counter()
+        ok = self._lock.acquire(blocking, timeout)
+        if ok:
+            self.acquired_at = time.perf_counter()
+            self.owner = threading.get_ident()
+            self.wait_histogram.observe(self.acquired_at - start)
+        return ok
+
+    def release(self):
+        held = time.perf_counter() - self.acquired_at
+        self.owner = None
+        self._lock.release()
+        self.hold_histogram.observe(held)
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    # threading.Condition hooks: time spent in Condition.wait() is neither
+    # waiting for the lock nor holding it, so it is kept out of both
+    def _is_owned(self):
+        return self.owner == threading.get_ident()
+
+    def _release_save(self):
+        self.release()
+
+    def _acquire_restore(self, state):
+        self._lock.acquire()
+        self.acquired_at = time.perf_counter()
+        self.owner = threading.get_ident()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(registry, host="127.0.0.1", port=9104):
+    # Serve registry.render() at /metrics from a daemon thread; returns the
+    # HTTP server, whose shutdown() stops it
+    httpd = http.server.ThreadingHTTPServer((host, port), _Handler)
+    httpd.daemon_threads = True
+    httpd.registry = registry
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
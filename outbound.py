@@ -0,0 +1,378 @@
+# Non-blocking outbound fan-out for client connections.
+#
+# Every client socket is wrapped in a Connection that owns a bounded queue
+# of encoded frames. send() first tries to write straight to the socket
+# without blocking; whatever the kernel does not accept is queued and
+# drained by a single FanOut writer thread once the socket becomes
+# writable. A slow or stalled client therefore only delays itself, and
+# one whose backlog exceeds the configured limit is evicted.
+#
+# Sockets stay in blocking mode for readers (handle_client threads or the
+# selectors loop); writes use MSG_DONTWAIT so they never wait. That needs a
+# socket without a timeout: Python waits for a socket with a timeout to
+# become writable before any send, MSG_DONTWAIT or not, so FanOut.connect
+# clears it. Platforms without MSG_DONTWAIT skip the direct attempt and
+# always hand frames to the writer thread, which only writes to sockets
+# reported writable.
+#
+# Frames may be given as bytes or as protocol.Message objects; a Message is
+# encoded for the protocol version its connection speaks, and its encoding
+# is cached, so a broadcast costs one encoding per version.
+#
+# A frame sent with timed=True records when its last byte was handed to the
+# kernel in the connection's written_at, whether it went out directly or
+# from the queue. The engine times questions this way, so answers can be
+# ranked by how long after its own question each player answered.
+import collections
+import selectors
+import socket
+import threading
+import time
+
+from protocol import Message
+
+SEND_FLAGS = getattr(socket, "MSG_DONTWAIT", 0)
+
+# Default per-connection backlog before a client counts as a slow consumer
+MAX_QUEUE_BYTES = 1024 * 1024
+
+# How long a connection closed with flush=True may take to drain
+CLOSE_GRACE = 2.0
+
+# TCP keepalive probing of every client socket: seconds idle before the
+# first probe, seconds between probes and unanswered probes before the
+# kernel drops the connection. This catches dead peers among clients that
+# do not take part in the engine's PING/PONG heartbeat.
+KEEPALIVE = (10, 5, 3)
+
+
+def set_keepalive(sock):
+    # Options a platform does not have are skipped; the system defaults
+    # (hours) then apply to them
+    idle, interval, count = KEEPALIVE
+    options = [
+        (socket.SOL_SOCKET, getattr(socket, "SO_KEEPALIVE", None), 1),
+        (socket.IPPROTO_TCP, getattr(socket, "TCP_KEEPIDLE", getattr(socket, "TCP_KEEPALIVE", None)), idle),
+        (socket.IPPROTO_TCP, getattr(socket, "TCP_KEEPINTVL", None), interval),
+        (socket.IPPROTO_TCP, getattr(socket, "TCP_KEEPCNT", None), count),
+    ]
+    for level, option, value in options:
+        if option is None:
+            continue
+        try:
+            sock.setsockopt(level, option, value)
+        except OSError:
+            pass
+
+
+class Connection:
+
+    def __init__(self, fanout, sock, addr):
+        self.fanout = fanout
+        self.sock = sock
+        self.addr = addr
+        self.lock = threading.Lock()
+        self.frames = collections.deque()   # memoryviews still to be written
+        self.queued_bytes = 0
+        self.high_water = 0                 # largest backlog seen, in bytes
+        self.closed = False
+        self.closing_deadline = None        # set by close(flush=True) while draining
+        self.evicted = False
+        self.registered = False             # only touched by the writer thread
+        self.written_at = None              # time.monotonic() the last timed frame was written
+        self.timed_bytes = None             # queued bytes up to the end of that frame, while unwritten
+
+        # Per-client protocol state owned by the engine
+        self.username = None                # set once the handshake succeeds
+        self.room = None                    # GameRoom the client joined
+        self.caps = set()                   # optional features announced with CAPS:
+        self.sent_rank = None               # last (rank, score, total) sent as MYRANK
+        self.session = None                 # session token for reconnecting
+        self.protocol = 1                   # wire protocol version of outgoing messages
+        self.last_heard = time.monotonic()  # when data last arrived from the client
+        self.last_ping = 0.0                # when the client was last sent PING
+        self.ping_stamp = None              # stamp of that PING until its PONG arrives
+        self.rtt = None                     # lowest round-trip time in seconds, from heartbeats
+
+    def send(self, data, protocol=None, timed=False):
+        # Queue bytes or a Message for delivery. Returns False if the
+        # connection is closed. protocol switches the connection to that
+        # version for everything sent after data; the switch and the
+        # encoding of each message happen under the lock, so no message
+        # goes out in the wrong format. timed=True stamps written_at once
+        # data is written.
+        with self.lock:
+            if self.closed or self.closing_deadline is not None:
+                return False
+            if isinstance(data, Message):
+                data = data.encode(self.protocol)
+            if protocol is not None:
+                self.protocol = protocol
+            if timed:
+                self.written_at = None
+                self.timed_bytes = None
+
+            if not self.frames and SEND_FLAGS:
+                try:
+                    sent = self.sock.send(data, SEND_FLAGS)
+                except BlockingIOError:
+                    sent = 0
+                except OSError:
+                    self._close_locked()
+                    return False
+                self.fanout.count_sent(sent)
+                if sent == len(data):
+                    if timed:
+                        self.written_at = time.monotonic()
+                    return True
+                data = memoryview(data)[sent:]
+
+            if self.fanout.max_queue_bytes and self.queued_bytes + len(data) > self.fanout.max_queue_bytes:
+                self.evicted = True
+                self._close_locked()
+                evict = True
+            else:
+                self.frames.append(memoryview(data))
+                self.queued_bytes += len(data)
+                self.high_water = max(self.high_water, self.queued_bytes)
+                if timed:
+                    self.timed_bytes = self.queued_bytes
+                evict = False
+
+        if evict:
+            self.fanout.evicted(self)
+            return False
+        self.fanout.count_deferred(len(data))
+        self.fanout.wake(self)
+        return True
+
+    def close(self, flush=True):
+        # Close the connection, optionally after delivering what is queued
+        with self.lock:
+            if self.closed:
+                return
+            if flush and self.frames:
+                if self.closing_deadline is None:
+                    self.closing_deadline = time.monotonic() + self.fanout.close_grace
+                wake = True
+            else:
+                self._close_locked()
+                wake = False
+        if wake:
+            self.fanout.wake(self)
+
+    def flush(self):
+        # Writer thread: push queued frames until the socket would block.
+        # Returns True once nothing is left to write.
+        with self.lock:
+            while self.frames and not self.closed:
+                frame = self.frames[0]
+                try:
+                    sent = self.sock.send(frame, SEND_FLAGS)
+                except BlockingIOError:
+                    break
+                except OSError:
+                    self._close_locked()
+                    break
+                self.fanout.count_sent(sent)
+                self.queued_bytes -= sent
+                if self.timed_bytes is not None:
+                    self.timed_bytes -= sent
+                    if self.timed_bytes <= 0:
+                        self.written_at = time.monotonic()
+                        self.timed_bytes = None
+                if sent == len(frame):
+                    self.frames.popleft()
+                else:
+                    self.frames[0] = frame[sent:]
+                    break
+
+            if self.closing_deadline is not None and (
+                not self.frames or time.monotonic() >= self.closing_deadline
+            ):
+                self._close_locked()
+            return self.closed or not self.frames
+
+    def _close_locked(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.frames.clear()
+        self.queued_bytes = 0
+        self.timed_bytes = None
+        # shutdown() wakes any reader blocked in recv() on this socket
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        self.fanout.forget(self)
+
+
+class FanOut:
+
+    def __init__(self, max_queue_bytes=MAX_QUEUE_BYTES, close_grace=CLOSE_GRACE, on_evict=None):
+        # max_queue_bytes of 0 disables slow-consumer eviction
+        self.max_queue_bytes = max_queue_bytes
+        self.close_grace = close_grace
+        self.on_evict = on_evict
+
+        self.lock = threading.Lock()
+        self.connections = set()
+        self.dirty = []                   # connections with new frames for the writer
+        self.bytes_sent = 0
+        self.bytes_deferred = 0           # bytes that had to wait in a queue
+        self.evictions = 0
+
+        self.sel = selectors.DefaultSelector()
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+        self.sel.register(self.wake_r, selectors.EVENT_READ, None)
+        self.running = False
+        self.thread = None
+
+    def connect(self, sock, addr):
+        # Frames are written whole, so Nagle's algorithm would only hold a
+        # small write (a question right after a round's results) back until
+        # the peer's delayed ACK, up to ~40 ms
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            pass
+        set_keepalive(sock)
+        sock.settimeout(None)
+        conn = Connection(self, sock, addr)
+        with self.lock:
+            self.connections.add(conn)
+        return conn
+
+    def open_connections(self):
+        with self.lock:
+            return list(self.connections)
+
+    def broadcast(self, conns, data, timed=False):
+        # data (bytes, or a Message encoded once per protocol version) is
+        # shared by every recipient
+        for conn in conns:
+            conn.send(data, timed=timed)
+
+    def send_each(self, pairs):
+        # [(conn, data)]: a message of its own for each recipient
+        for conn, data in pairs:
+            conn.send(data)
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.writer_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        # Give every connection close_grace seconds to flush, then exit
+        with self.lock:
+            conns = list(self.connections)
+        for conn in conns:
+            conn.close(flush=True)
+        self.running = False
+        self.wake(None)
+
+    def wake(self, conn):
+        # Only the first connection added since the writer last looked needs
+        # to poke the wake socket; later ones ride along with that wake-up
+        with self.lock:
+            needed = conn is None or not self.dirty
+            if conn is not None:
+                self.dirty.append(conn)
+        if not needed:
+            return
+        try:
+            self.wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            # A full wake pipe already guarantees a pending wake-up
+            pass
+
+    def forget(self, conn):
+        with self.lock:
+            self.connections.discard(conn)
+        # Let the writer drop its registration for the closed socket
+        self.wake(conn)
+
+    def evicted(self, conn):
+        with self.lock:
+            self.evictions += 1
+        if self.on_evict:
+            self.on_evict(conn)
+
+    def count_sent(self, n):
+        with self.lock:
+            self.bytes_sent += n
+
+    def count_deferred(self, n):
+        with self.lock:
+            self.bytes_deferred += n
+
+    def stats(self):
+        # Backpressure snapshot for logs and metrics
+        with self.lock:
+            conns = list(self.connections)
+            stats = {
+                "connections": len(conns),
+                "bytes_sent": self.bytes_sent,
+                "bytes_deferred": self.bytes_deferred,
+                "evictions": self.evictions,
+            }
+        backlogs = [c.queued_bytes for c in conns]
+        stats["queued_bytes"] = sum(backlogs)
+        stats["backlogged_connections"] = sum(1 for b in backlogs if b)
+        stats["max_backlog_bytes"] = max(backlogs, default=0)
+        return stats
+
+    def writer_loop(self):
+        # After stop() keep going until the last closing connection is done
+        while self.running or len(self.sel.get_map()) > 1:
+            for key, _ in self.sel.select(timeout=0.5):
+                if key.data is None:
+                    try:
+                        while self.wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                self.drain(key.data)
+
+            with self.lock:
+                dirty, self.dirty = self.dirty, []
+            for conn in dirty:
+                self.drain(conn)
+
+            # Connections closing with a flush must not wait forever on a
+            # peer that stopped reading
+            now = time.monotonic()
+            for key in list(self.sel.get_map().values()):
+                conn = key.data
+                if conn is not None and conn.closing_deadline is not None and now >= conn.closing_deadline:
+                    self.drain(conn)
+
+        self.sel.close()
+
+    def drain(self, conn):
+        done = conn.flush()
+        if done and conn.registered:
+            try:
+                self.sel.unregister(conn.sock)
+            except (KeyError, ValueError):
+                pass
+            conn.registered = False
+        elif not done and not conn.registered:
+            # A recycled descriptor means a closed socket is still registered
+            stale = self.sel.get_map().get(conn.sock.fileno())
+            if stale is not None:
+                self.sel.unregister(stale.fileobj)
+                stale.data.registered = False
+            self.sel.register(conn.sock, selectors.EVENT_WRITE, conn)
+            conn.registered = True
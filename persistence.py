@@ -0,0 +1,178 @@
+# Write-behind persistence of game results.
+#
+# The engine hands answer events and final standings to a ResultsWriter,
+# which only puts them on a queue; a background thread writes them to a
+# SQLite database in batches, one transaction per batch, so game threads
+# never wait for the disk. The database uses write-ahead logging and every
+# batch is committed within FLUSH_INTERVAL of its first event, so a crash
+# loses at most the events not yet committed. If the writer falls more than
+# max_pending submissions behind, new ones are dropped (and their events
+# counted) rather than slowing the game down.
+#
+#   sqlite3 results.db "SELECT username, score FROM standings WHERE rank = 1"
+import queue
+import sqlite3
+import threading
+import time
+
+# Submissions (a game start, a round's answers, final standings) queued
+# before new ones are dropped
+MAX_PENDING = 10000
+
+# Events written per transaction, and how long a batch may wait for more
+BATCH_SIZE = 1000
+FLUSH_INTERVAL = 0.2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id TEXT PRIMARY KEY,
+    room TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    questions INTEGER NOT NULL,
+    players INTEGER NOT NULL,
+    reason TEXT
+);
+CREATE TABLE IF NOT EXISTS answers (
+    game_id TEXT NOT NULL,
+    question_index INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    answer TEXT,
+    correct INTEGER NOT NULL,
+    position INTEGER,
+    points INTEGER NOT NULL,
+    answered_at REAL,
+    compensation REAL
+);
+CREATE TABLE IF NOT EXISTS standings (
+    game_id TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    score INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS answers_game ON answers (game_id, question_index);
+CREATE INDEX IF NOT EXISTS standings_game ON standings (game_id, rank);
+"""
+
+INSERT_GAME = "INSERT OR REPLACE INTO games (id, room, started_at, questions, players) VALUES (?, ?, ?, ?, ?)"
+FINISH_GAME = "UPDATE games SET finished_at = ?, reason = ? WHERE id = ?"
+INSERT_ANSWER = ("INSERT INTO answers (game_id, question_index, username, answer, correct, position, points, "
+                 "answered_at, compensation) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+INSERT_STANDING = "INSERT INTO standings (game_id, rank, username, score) VALUES (?, ?, ?, ?)"
+
+
+def ranked_standings(game_id, scores):
+    # {username: score} -> standings rows, tied scores sharing a rank
+    rows = []
+    prev_score = None
+    rank = 0
+    for position, (username, score) in enumerate(sorted(scores.items(), key=lambda item: (-item[1], item[0])), 1):
+        if score != prev_score:
+            rank = position
+            prev_score = score
+        rows.append((game_id, rank, username, score))
+    return rows
+
+
+class ResultsWriter:
+
+    def __init__(self, path, max_pending=MAX_PENDING, batch_histogram=None, on_error=None):
+        # batch_histogram observes the time spent writing each batch;
+        # on_error is called with database errors
+        self.path = path
+        self.batch_histogram = batch_histogram
+        self.on_error = on_error
+        self.queue = queue.Queue(max_pending)
+        self.lock = threading.Lock()    # guards dropped, which game threads update
+        self.written = 0            # events committed to the database
+        self.dropped = 0            # events discarded because the queue was full
+        self.failed = 0             # events lost to database errors
+
+        # Opened here so a bad path is reported at startup; the connection
+        # is then only used by the writer thread
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        # Databases created before answers were ranked with latency compensation
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(answers)")}
+        if "compensation" not in columns:
+            self.db.execute("ALTER TABLE answers ADD COLUMN compensation REAL")
+        self.db.commit()
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, statement, rows, size=None):
+        # Queue rows for one statement without blocking
+        try:
+            self.queue.put_nowait((statement, rows))
+        except queue.Full:
+            with self.lock:
+                self.dropped += len(rows) if size is None else size
+
+    def game_started(self, game_id, room, questions, players):
+        self.submit(INSERT_GAME, [(game_id, room, time.time(), questions, players)])
+
+    def answers(self, rows):
+        # rows: (game_id, question_index, username, answer, correct,
+        # position, points, answered_at, compensation in seconds)
+        if rows:
+            self.submit(INSERT_ANSWER, rows)
+
+    def game_finished(self, game_id, reason, scores):
+        # scores: {username: final score}; ranked on the writer thread
+        self.submit(FINISH_GAME, [(time.time(), reason, game_id)])
+        # No statement: the writer turns (game_id, scores) into standings rows
+        self.submit(None, (game_id, dict(scores)), len(scores))
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def close(self, timeout=5.0):
+        # Write whatever is queued and stop the writer thread
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self.thread.join(timeout)
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            batch = []
+            count = 0
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while True:
+                if item is None:
+                    stopping = True
+                    break
+                statement, rows = item
+                if statement is None:
+                    statement, rows = INSERT_STANDING, ranked_standings(*rows)
+                batch.append((statement, rows))
+                count += len(rows)
+                if count >= BATCH_SIZE:
+                    break
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch:
+                self.write(batch, count)
+        self.db.close()
+
+    def write(self, batch, count):
+        start = time.perf_counter()
+        try:
+            with self.db:
+                for statement, rows in batch:
+                    self.db.executemany(statement, rows)
+        except sqlite3.Error as e:
+            self.failed += count
+            if self.on_error is not None:
+                self.on_error(e)
+            return
+        self.written += count
+        if self.batch_histogram is not None:
+            self.batch_histogram.observe(time.perf_counter() - start)
@@ -0,0 +1,259 @@
+# Wire formats of the messages the server sends to clients.
+#
+# Protocol v1 is the original text protocol: one line per message, fields
+# joined with ":" and lists with ",", so a question containing a colon or a
+# username containing a comma cannot be sent intact. Protocol v2 frames
+# every message as a 4-byte big-endian payload length followed by a compact
+# JSON array, [kind, field, ...], which carries any text unchanged.
+#
+# Every connection starts in v1. A client that lists "v2" in its CAPS: line
+# is answered with the v1 line "PROTOCOL:2", and everything the server sends
+# after it comes as v2 frames. Clients keep sending v1 lines (the handshake,
+# CAPS:, ANSWER:), which have no fields that need escaping.
+#
+# The engine builds each message once as a Message; its wire form for a
+# protocol version is encoded on first use and cached, so a broadcast is
+# encoded once per version in use and all recipients share the same bytes.
+# Decoder turns the received byte stream back into Messages on the client
+# side, whichever version the server speaks.
+#
+#   kind        fields                                  v1 line
+#   welcome     username                                Welcome, alice!
+#   question    text, a, b, c                           QUESTION:text:a:b:c
+#   result      correct, text                           RESULT:CORRECT|WRONG:text
+#   timeleft    seconds                                 TIMELEFT:seconds
+#   left        usernames                               USER_LEFT:names_csv
+#   gameover                                            GAMEOVER
+#   notice      text                                    text
+#   error       code                                    ERROR:code
+#   session     token                                   SESSION:token
+#   resumed     score, answered, seconds, question      RESUMED:score:answered:seconds[:text:a:b:c]
+#   scoreboard  rows                                    SCOREBOARD:names_csv:scores_csv
+#   scoretop    rows, total                             SCORETOP:names_csv:scores_csv:total
+#   scoredelta  rows, removed, total                    SCOREDELTA:names_csv:scores_csv:removed_csv:total
+#   myrank      rank, score, total                      MYRANK:rank:score:total
+#   ping        stamp                                   PING:stamp
+#
+# rows are [rank, username, score] in rank order (v1 names read "3. alice"),
+# removed and usernames are lists of usernames and question is
+# [text, a, b, c] or None.
+#
+# Clients with CAPS:heartbeat are pinged every few seconds and answer with
+# the line PONG:stamp, echoing the ping's stamp; the server times these
+# exchanges to estimate each player's round trip. A client that stays
+# silent too long is taken for a dead peer and disconnected.
+import json
+
+from framing import FrameTooLong
+
+# v1 line after which a connection switches to v2 frames
+UPGRADE = "PROTOCOL:2"
+
+# Upper bound on one received message; scoreboards of very large lobbies
+# are long
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+HEADER_BYTES = 4
+
+
+def rows_csv(rows):
+    names = ",".join([f"{rank}. {u}" for rank, u, _ in rows])
+    scores = ",".join([str(score) for _, _, score in rows])
+    return names, scores
+
+
+def resumed_text(score, answered, seconds, question):
+    line = f"RESUMED:{score}:{int(answered)}:{seconds}"
+    if question:
+        line += ":" + ":".join(question)
+    return line
+
+
+def scoreboard_text(rows):
+    names, scores = rows_csv(rows)
+    return f"SCOREBOARD:{names}:{scores}"
+
+
+def scoretop_text(rows, total):
+    names, scores = rows_csv(rows)
+    return f"SCORETOP:{names}:{scores}:{total}"
+
+
+def scoredelta_text(rows, removed, total):
+    names, scores = rows_csv(rows)
+    return f"SCOREDELTA:{names}:{scores}:{','.join(removed)}:{total}"
+
+
+# kind -> function(*fields) returning the v1 line
+V1_TEXT = {
+    "welcome": lambda username: f"Welcome, {username}!",
+    "question": lambda text, a, b, c: f"QUESTION:{text}:{a}:{b}:{c}",
+    "result": lambda correct, text: f"RESULT:{'CORRECT' if correct else 'WRONG'}:{text}",
+    "timeleft": lambda seconds: f"TIMELEFT:{seconds}",
+    "left": lambda usernames: f"USER_LEFT:{','.join(usernames)}",
+    "gameover": lambda: "GAMEOVER",
+    "notice": lambda text: text,
+    "error": lambda code: f"ERROR:{code}",
+    "session": lambda token: f"SESSION:{token}",
+    "resumed": resumed_text,
+    "scoreboard": scoreboard_text,
+    "scoretop": scoretop_text,
+    "scoredelta": scoredelta_text,
+    "myrank": lambda rank, score, total: f"MYRANK:{rank}:{score}:{total}",
+    "ping": lambda stamp: f"PING:{stamp}",
+}
+
+
+class Message:
+    __slots__ = ("kind", "fields", "wire")
+
+    def __init__(self, kind, *fields):
+        self.kind = kind
+        self.fields = fields
+        self.wire = {}                  # protocol version -> encoded bytes
+
+    def __repr__(self):
+        return f"Message({self.kind!r}, {', '.join(map(repr, self.fields))})"
+
+    def text(self):
+        return V1_TEXT[self.kind](*self.fields)
+
+    def encode(self, version=1):
+        # Concurrent first uses may both encode; they produce the same bytes
+        data = self.wire.get(version)
+        if data is None:
+            if version == 1:
+                data = (self.text() + "\n").encode()
+            else:
+                payload = json.dumps([self.kind, *self.fields], separators=(",", ":"),
+                                     ensure_ascii=False).encode()
+                data = len(payload).to_bytes(HEADER_BYTES, "big") + payload
+            self.wire[version] = data
+        return data
+
+
+def parse_ranked_rows(names_csv, scores_csv):
+    # "1. alice,2. bob" + "5,3" -> [(1, "alice", 5), (2, "bob", 3)]
+    names = names_csv.split(",") if names_csv else []
+    scores = scores_csv.split(",") if scores_csv else []
+    rows = []
+    for i in range(min(len(names), len(scores))):
+        rank, _, name = names[i].partition(". ")
+        rows.append((int(rank), name, int(scores[i])))
+    return rows
+
+
+def parse_line(line):
+    # One v1 line -> Message, or None if the line is malformed. Lines that
+    # are not protocol messages (announcements, handshake rejections such
+    # as GAME_ALREADY_STARTED) become notices.
+    if line == "GAMEOVER":
+        return Message("gameover")
+    if line.startswith("Welcome, ") and line.endswith("!"):
+        return Message("welcome", line[9:-1])
+    kind, sep, rest = line.partition(":")
+    if not sep:
+        return Message("notice", line)
+    try:
+        if kind == "QUESTION":
+            parts = rest.split(":")
+            if len(parts) < 4:
+                return None
+            return Message("question", *parts[:4])
+        if kind == "RESULT":
+            verdict, sep, text = rest.partition(":")
+            if not sep:
+                return None
+            return Message("result", verdict == "CORRECT", text)
+        if kind == "TIMELEFT":
+            return Message("timeleft", int(rest))
+        if kind == "USER_LEFT":
+            return Message("left", rest.split(","))
+        if kind == "ERROR":
+            return Message("error", rest)
+        if kind == "SESSION":
+            return Message("session", rest)
+        if kind == "PING":
+            return Message("ping", int(rest))
+        if kind == "RESUMED":
+            parts = rest.split(":")
+            question = parts[3:7] if len(parts) >= 7 else None
+            return Message("resumed", int(parts[0]), parts[1] == "1", int(parts[2]), question)
+        if kind == "MYRANK":
+            parts = rest.split(":")
+            if len(parts) != 3:
+                return None
+            return Message("myrank", *map(int, parts))
+        if kind in ("SCOREBOARD", "SCORETOP", "SCOREDELTA"):
+            parts = rest.split(":")
+            if len(parts) < 2:
+                return None
+            rows = parse_ranked_rows(parts[0], parts[1])
+            if kind == "SCOREBOARD":
+                return Message("scoreboard", rows)
+            if kind == "SCORETOP":
+                return Message("scoretop", rows, int(parts[2]) if len(parts) > 2 else len(rows))
+            if len(parts) < 4:
+                return None
+            return Message("scoredelta", rows, parts[2].split(",") if parts[2] else [], int(parts[3]))
+    except (ValueError, IndexError):
+        return None
+    return Message("notice", line)
+
+
+class Decoder:
+    # Splits what a client receives into Messages: v1 lines until the
+    # server's PROTOCOL:2 line, v2 frames after it. Like LineFramer it keeps
+    # incomplete input buffered between feeds.
+
+    def __init__(self, max_size=MAX_MESSAGE_BYTES):
+        self.max_size = max_size
+        self.version = 1
+        self.buf = bytearray()
+        self.scanned = 0        # leading bytes of buf known to hold no newline (v1)
+
+    def feed(self, data):
+        # Add received bytes and return every complete message. Raises
+        # FrameTooLong for oversized messages and ValueError for frames
+        # that are not valid v2 payloads.
+        buf = self.buf
+        buf += data
+
+        messages = []
+        start = 0
+        while True:
+            if self.version == 1:
+                nl = buf.find(b"\n", max(start, self.scanned))
+                if nl < 0:
+                    break
+                line = buf[start:nl].decode("utf-8", "replace").strip()
+                start = nl + 1
+                if line == UPGRADE:
+                    self.version = 2
+                elif line:
+                    message = parse_line(line)
+                    if message is not None:
+                        messages.append(message)
+            else:
+                if len(buf) - start < HEADER_BYTES:
+                    break
+                size = int.from_bytes(buf[start:start + HEADER_BYTES], "big")
+                if size > self.max_size:
+                    raise FrameTooLong(f"message exceeds {self.max_size} bytes")
+                end = start + HEADER_BYTES + size
+                if len(buf) < end:
+                    break
+                fields = json.loads(bytes(buf[start + HEADER_BYTES:end]))
+                start = end
+                if not isinstance(fields, list) or not fields or not isinstance(fields[0], str):
+                    raise ValueError("malformed protocol v2 frame")
+                messages.append(Message(*fields))
+
+        if start:
+            del buf[:start]
+        self.scanned = len(buf) if self.version == 1 else 0
+        if self.version == 1 and len(buf) > self.max_size:
+            buf.clear()
+            self.scanned = 0
+            raise FrameTooLong(f"message exceeds {self.max_size} bytes")
+        return messages
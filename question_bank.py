@@ -0,0 +1,195 @@
+# Compiled, memory-mapped question banks.
+#
+# The text format (5 non-blank lines per question) has to be parsed in full
+# to find any one question. compile_bank() turns it into a binary file that
+# can be read lazily:
+#
+#   header   magic "SQB1", version, question count, offset of the offset
+#            table, and the source file's mtime_ns and size
+#   records  one per question: its 5 lines, UTF-8, joined by "\n"
+#   table    count + 1 little-endian uint64 record offsets
+#
+# QuestionBank maps the compiled file and decodes a question only when it
+# is asked for, so loading N questions costs O(N) whatever the bank size.
+# open_bank() compiles a text file next to itself (as "<file>.sqb") the
+# first time, recompiles when the source's mtime or size changes, and keeps
+# open banks cached per process.
+#
+#   python question_bank.py quiz_qa.txt [-o quiz_qa.txt.sqb]
+import argparse
+import array
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+
+MAGIC = b"SQB1"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIQqQ")   # magic, version, reserved, count, table offset, mtime_ns, size
+OFFSET = struct.Struct("<Q")
+
+COMPILED_SUFFIX = ".sqb"
+
+FIELDS = ("question", "A", "B", "C", "Answer")
+
+
+class BankFormatError(IOError):
+    pass
+
+
+def iter_questions(f):
+    # Yield the 5 stripped lines of each question in a text bank; a
+    # trailing incomplete question is ignored
+    group = []
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        group.append(line)
+        if len(group) == 5:
+            yield group
+            group = []
+
+
+def compile_bank(src_path, dst_path=None):
+    # Compile a text bank into dst_path (default "<src_path>.sqb") and
+    # return the path written. The file is replaced atomically.
+    if dst_path is None:
+        dst_path = src_path + COMPILED_SUFFIX
+    st = os.stat(src_path)
+    offsets = array.array("Q")
+
+    fd, tmp_path = tempfile.mkstemp(prefix=".sqb-", dir=os.path.dirname(os.path.abspath(dst_path)))
+    try:
+        with os.fdopen(fd, "wb") as out, open(src_path, encoding="utf-8") as src:
+            out.write(bytes(HEADER.size))
+            pos = HEADER.size
+            for lines in iter_questions(src):
+                record = "\n".join(lines).encode()
+                offsets.append(pos)
+                out.write(record)
+                pos += len(record)
+            offsets.append(pos)
+
+            if sys.byteorder != "little":
+                offsets.byteswap()
+            out.write(offsets.tobytes())
+            out.seek(0)
+            out.write(HEADER.pack(MAGIC, VERSION, 0, len(offsets) - 1, pos, st.st_mtime_ns, st.st_size))
+        os.replace(tmp_path, dst_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return dst_path
+
+
+class QuestionBank:
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self.map) < HEADER.size:
+                raise BankFormatError(f"{path} is not a compiled question bank")
+            magic, version, _, count, table, mtime_ns, size = HEADER.unpack_from(self.map)
+            if magic != MAGIC or version != VERSION or table + (count + 1) * OFFSET.size > len(self.map):
+                raise BankFormatError(f"{path} is not a compiled question bank")
+        except BaseException:
+            self.map.close()
+            raise
+        self.count = count
+        self.table = table
+        self.source_mtime_ns = mtime_ns
+        self.source_size = size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        # Decode one question as {"question", "A", "B", "C", "Answer"}
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        start, end = struct.unpack_from("<2Q", self.map, self.table + index * OFFSET.size)
+        lines = self.map[start:end].decode("utf-8").split("\n")
+        return dict(zip(FIELDS, lines))
+
+    def matches(self, st):
+        # True if this bank was compiled from a file with the given stat
+        return self.source_mtime_ns == st.st_mtime_ns and self.source_size == st.st_size
+
+    def close(self):
+        self.map.close()
+
+
+# Open banks by absolute source path
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def compiled_path(src_path):
+    # Where the compiled form of src_path lives: next to it if that
+    # directory is writable, otherwise in the temp directory
+    path = src_path + COMPILED_SUFFIX
+    if os.access(os.path.dirname(path) or ".", os.W_OK):
+        return path
+    digest = hashlib.sha1(src_path.encode()).hexdigest()[:12]
+    name = f"{os.path.basename(src_path)}-{digest}{COMPILED_SUFFIX}"
+    return os.path.join(tempfile.gettempdir(), name)
+
+
+def open_bank(src_path):
+    # Return a QuestionBank for a text or compiled bank, compiling (or
+    # recompiling a stale) text bank first. Raises IOError if the file
+    # cannot be read.
+    if src_path.endswith(COMPILED_SUFFIX):
+        return QuestionBank(src_path)
+
+    src_path = os.path.abspath(src_path)
+    st = os.stat(src_path)
+    with _cache_lock:
+        bank = _cache.get(src_path)
+        if bank is not None:
+            if bank.matches(st):
+                return bank
+            # Questions already handed out are plain dicts, so a stale map
+            # can be closed before its file is replaced
+            bank.close()
+            del _cache[src_path]
+
+        path = compiled_path(src_path)
+        try:
+            bank = QuestionBank(path)
+        except (OSError, ValueError):
+            bank = None
+        if bank is not None and not bank.matches(st):
+            bank.close()
+            bank = None
+        if bank is None:
+            compile_bank(src_path, path)
+            bank = QuestionBank(path)
+
+        _cache[src_path] = bank
+        return bank
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile a text question bank")
+    parser.add_argument("source", help="question file in the 5-line text format")
+    parser.add_argument("-o", "--output", help="compiled file (default: <source>.sqb)")
+    args = parser.parse_args(argv)
+
+    path = compile_bank(args.source, args.output)
+    bank = QuestionBank(path)
+    print(f"{path}: {len(bank)} questions")
+    bank.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
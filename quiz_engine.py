@@ -0,0 +1,1923 @@
+# Game engine for the SUquid quiz server.
+#
+# QuizServer owns the sockets: the accept loops, the outbound fan-out and
+# the handshake that places each client in a GameRoom. Everything needed
+# to host one game lives on its GameRoom: the question bank, the players,
+# the round and scoreboard logic, each under the room's own lock, so any
+# number of rooms can play concurrently without contending with each other.
+# Nothing here imports Tkinter, so the engine can run on display-less hosts
+# and be imported by workers, benchmarks and front-ends. Front-ends observe
+# the engine through log_queue (human-readable event lines) and
+# scoreboard_listeners (called with a room name and its ranked scoreboard,
+# which is empty once the room is discarded).
+import heapq
+import itertools
+import math
+import os
+import re
+import secrets
+import socket
+import selectors
+import threading
+import queue
+import time
+import uuid
+
+from admission import TokenBucket
+from deadlines import DeadlineScheduler
+from framing import LEGACY_ANSWER, FrameTooLong, LineFramer, split_handshake
+from gateway import GatewayPool
+from leaderboard import Leaderboard, delta_message, rank_message, top_message, top_view
+from metrics import Registry, TimedLock, serve as serve_metrics
+from outbound import MAX_QUEUE_BYTES, FanOut
+from persistence import ResultsWriter
+from protocol import UPGRADE, Message
+from question_bank import open_bank
+from snapshots import SNAPSHOT_VERSION, SnapshotStore
+
+
+# Connection handling model used by server_loop:
+#   "threads"   - a pool of handshake workers, then one blocking
+#                 read_client thread per player
+#   "selectors" - a single event loop multiplexing every connection
+#   "gateways"  - gateway processes own the connections; this process
+#                 handles their players' messages, one thread per gateway,
+#                 so the socket work of a huge lobby uses several cores
+IO_MODES = ("threads", "selectors", "gateways")
+
+# Bytes requested per recv() on client sockets
+RECV_SIZE = 16 * 1024
+
+# Rows in the top-N scoreboard sent to clients with CAPS:scoredelta
+SCOREBOARD_TOP = 20
+
+# Room for clients that do not ask for one; it always exists
+DEFAULT_ROOM = "main"
+
+# Room names clients may ask for in their handshake ("alice@room")
+ROOM_NAME = re.compile(r"[a-z0-9_-]{1,32}")
+
+# Seconds between TIMELEFT reminders sent to clients with CAPS:timer
+TIMELEFT_INTERVAL = 5
+
+# Seconds a resumed game waits for its players to reconnect
+RESUME_GRACE = 10.0
+
+# Seconds a new connection has to send its handshake
+HANDSHAKE_TIMEOUT = 10.0
+
+# Seconds a client with CAPS:heartbeat may stay silent before it is taken
+# for a dead peer; it is sent PING every third of that
+IDLE_TIMEOUT = 15.0
+
+# Most seconds an answer's arrival time is moved back to make up for its
+# player's round trip, about a long intercontinental RTT; bounds what a
+# client gains by answering PINGs late
+MAX_COMPENSATION = 0.2
+
+# Seconds between checks for stalled handshakes and silent clients, so a
+# dead peer loses its player slot within seconds instead of stalling rounds.
+# Each tick only checks the connections due then.
+HEARTBEAT_TICK = 0.1
+
+# Seconds between checks of a connection with nothing due: a handshake
+# without a timeout, or a client that has not announced heartbeats yet
+HEARTBEAT_RECHECK = 1.0
+
+# Connections the kernel queues for accept() (the OS may cap it, e.g. at
+# net.core.somaxconn); Python's default is only 128
+LISTEN_BACKLOG = 4096
+
+# New connections admitted per second (up to a second's worth at once);
+# the rest wait in the listen backlog, so a join storm at the start of an
+# event does not starve running games. 0 admits them as they come.
+HANDSHAKE_RATE = 1000
+
+# Threads completing handshakes in threads mode, and accepted connections
+# whose handshake may be unfinished at any time (both modes)
+HANDSHAKE_WORKERS = 8
+MAX_PENDING_HANDSHAKES = 512
+
+# Gateway processes in gateways mode; one core is left to the coordinator
+GATEWAYS = max(1, (os.cpu_count() or 1) - 1)
+
+# Lobby scoreboard updates for players joining or leaving within this many
+# seconds of each other are sent as one, and so are the USER_LEFT notices
+# of players leaving together. The window grows by as much again
+# for every SCOREBOARD_COALESCE_PLAYERS players in the room, so a large
+# lobby filling up is not sent its scoreboard more often than it can take.
+SCOREBOARD_COALESCE = 0.05
+SCOREBOARD_COALESCE_PLAYERS = 500
+
+# Replies to answers that cannot be counted, and how they are logged
+ANSWER_REJECTIONS = {
+    "GAME_NOT_STARTED": "tried to answer before the game started",
+    "NO_ACTIVE_QUESTION": "tried to answer with no active question",
+    "TIME_UP": "answered after the time was up",
+}
+
+
+def encode(message):
+    # Wire form of one v1 protocol line; handshake replies are sent before
+    # a client can negotiate another protocol version
+    return (message + "\n").encode()
+
+
+def question_message(q):
+    return Message("question", q["question"], q["A"], q["B"], q["C"])
+
+
+def ordinal_suffix(position):
+    return "st" if position == 1 else "nd" if position == 2 else "rd" if position == 3 else "th"
+
+
+def result_message(position, points, correct_answer):
+    # Result for one player: position is their place among correct
+    # answers, 0 for a wrong answer, None if they did not answer in time
+    if position is None:
+        return Message("result", False, f"Time is up! Correct answer: {correct_answer}.")
+    if not position:
+        return Message("result", False, f"Wrong Answer! Correct answer: {correct_answer}.")
+    if position <= 3:
+        return Message(
+            "result", True,
+            f"Congratulations! "
+            f"You are the {position}{ordinal_suffix(position)} person to answer correctly. "
+            f"Points earned: {points}"
+        )
+    return Message("result", True, f"Congratulations! Points earned: {points}")
+
+
+def load_question_file(file_path, question_count):
+    # Read question_count questions from a question bank (5-line text file,
+    # compiled and cached on first use, or a compiled .sqb file). Raises
+    # IOError if the file cannot be read.
+    bank = open_bank(file_path)
+    total_questions_in_file = len(bank)
+
+    # Cycle through file if fewer questions than requested
+    return [bank[q % total_questions_in_file] for q in range(question_count)]
+
+
+def parse_resume(received_data):
+    # "RESUME:<token>" -> token, or None for an ordinary handshake
+    if not received_data.startswith(b"RESUME:"):
+        return None
+    return received_data[7:].decode(errors="replace").strip()
+
+
+def parse_handshake(received_data):
+    # "alice" or "alice@room" -> (username, room name or None).
+    # Raises UnicodeDecodeError for undecodable names.
+    username, _, room_name = received_data.decode().strip().lower().partition("@")
+    return username.strip(), room_name.strip() or None
+
+
+class GameRoom:
+
+    def __init__(self, server, name):
+        self.server = server
+        self.name = name
+
+        # Lock used to protect this room's data structures accessed by multiple
+        # threads; it records its wait and hold times
+        self.lock = TimedLock(server.room_lock_wait, server.room_lock_hold)
+
+        # Signalled (under lock) when the last outstanding player answers or
+        # leaves, or the question's time runs out, so run_game can close the
+        # round immediately
+        self.round_done = threading.Condition(self.lock)
+
+        # Flags tracking game state
+        self.game_running = False
+        self.game_ending = False
+
+        # Set of players who were present when the game started
+        self.game_roster = set()
+
+        # Loaded questions from file
+        self.questions = []
+        self.active_question_idx = None
+        self.game_thread = None
+        self.game_id = None               # identifies the game in the results database
+
+        # Session token of every player in the room (username -> token);
+        # a token lets its player reconnect while the game is running
+        self.sessions = {}
+
+        # Player-related state
+        self.players = {}                 # username -> outbound.Connection
+        self.player_scores = {}           # username -> total score
+        self.answers_by_player = {}       # username -> list of answers
+
+        # Per-round answer state. record_answer only does set and dict
+        # updates under the lock; messages are formatted when the round ends.
+        self.answered_players = set()     # usernames who already answered current question
+        self.correct_count = 0            # correct answers so far this round
+        self.round_correct = []           # (compensated answer time, arrival order, username)
+        self.round_results = {}           # username -> (position among correct answers or 0, points,
+                                          #              answer, time.time() it arrived,
+                                          #              latency compensation in seconds)
+        self.round_answer = None          # correct choice of the current question, normalized
+        self.outstanding = set()          # connected usernames yet to answer current question
+
+        # Current round: answers are accepted while it is open; round_id
+        # tells a deadline which round it was scheduled for
+        self.round_open = False
+        self.round_id = 0
+        self.round_deadline = None        # time.monotonic() at which the round closes, if limited
+        self.round_started = None         # time.monotonic() at which the question started going out
+
+        # Handshakes assigned to this room that have not joined yet; guarded
+        # by the server's rooms_lock so a reserved room is never discarded
+        self.reserved = 0
+
+        # Ranked scoreboard of connected players, kept up to date incrementally
+        self.leaderboard = Leaderboard()
+
+        # Top-N view last sent to delta clients; deltas are computed against
+        # it, and new delta clients get it as their starting snapshot.
+        # scoreboard_lock guards it and is only held to compute a delta or
+        # send a snapshot; broadcast_lock keeps whole broadcasts in order.
+        # A snapshot may overtake the delta that led to it, which is
+        # harmless because applying that delta again changes nothing.
+        self.scoreboard_lock = threading.Lock()
+        self.broadcast_lock = threading.Lock()
+        self.last_top = {}
+        self.last_total = 0
+        self.scoreboard_due = False       # a coalesced lobby scoreboard update is scheduled
+        self.departed = []                # usernames left since the last USER_LEFT, under lock
+
+    def log(self, message):
+        if self.name != DEFAULT_ROOM:
+            message = f"[{self.name}] {message}"
+        self.server.log(message)
+
+    def broadcast(self, message, conns=None, timed=False):
+        # Queue one Message for every recipient; it is encoded once per
+        # protocol version and the bytes are shared. timed=True records
+        # when it is written to each connection (conn.written_at).
+        if conns is None:
+            conns = list(self.players.values())
+        self.server.fanout.broadcast(conns, message, timed)
+
+    def start_game(self, questions):
+        # Run the game loop in a separate thread. Returns True if the game
+        # was started.
+        with self.lock:
+            if self.game_running:
+                self.log("A game is already in progress! Please wait for it to finish.")
+                return False
+            if len(self.players) < 2:
+                self.log("Need at least 2 players to start the game.")
+                return False
+            self.questions = questions
+
+        self.game_thread = threading.Thread(target=self.run_game)
+        self.game_thread.start()
+        return True
+
+    def close_all_clients(self):
+        # Close all client connections once their queued messages are out
+        for conn in list(self.players.values()):
+            conn.close(flush=True)
+
+    def finish_game(self, reason=None):
+        # Prevent multiple finish calls
+        if self.game_ending:
+            return
+        if self.game_running and self.server.snapshots is not None and self.server.shutdown_flag.is_set():
+            self.suspend_game(reason)
+            return
+        self.game_ending = True
+
+        if reason:
+            self.log(reason)
+
+        #Explicit Winner Announcement
+        winners, max_score = self.leaderboard.winners()
+
+        # Create winner message
+        if winners:
+            winner_str = ", ".join(winners)
+            announcement = f"The winner(s): {winner_str} with {max_score} points!"
+        else:
+            announcement = "No winners."
+
+        self.log(announcement)
+
+        # Notify clients that the game is over and who won; winner
+        # announcement first so it appears in their log
+        conns = list(self.players.values())
+        self.broadcast(Message("notice", announcement), conns)
+        self.broadcast(Message("gameover"), conns)
+
+        self.refresh_scoreboard()
+
+        results = self.server.results
+        if results is not None and self.game_running:
+            results.game_finished(self.game_id, reason, self.player_scores)
+        if self.server.snapshots is not None:
+            self.server.snapshots.discard(self.name)
+        self.server.end_sessions(self.sessions)
+        self.sessions = {}
+
+        # Clean up all state; connections close once the messages are flushed
+        self.close_all_clients()
+        self.players.clear()
+        self.leaderboard.clear()
+        with self.scoreboard_lock:
+            self.last_top = {}
+            self.last_total = 0
+        self.player_scores.clear()
+        self.answers_by_player.clear()
+        self.game_roster = set()
+        self.refresh_scoreboard()
+
+        if self.game_running:
+            self.server.games_total.inc()
+        self.game_running = False
+        self.game_ending = False
+        self.server.discard_room_if_empty(self)
+
+    def suspend_game(self, reason=None):
+        # Server shutting down with snapshots on: close the connections but
+        # keep the snapshot and session tokens, so the next start resumes
+        # the game. There is no GAMEOVER and no game_finished row, and
+        # game_ending stays set, so later finish calls and the players'
+        # departures leave that state alone.
+        self.game_ending = True
+        if reason:
+            self.log(reason)
+        self.log("The game was saved and resumes when the server starts again.")
+        conns = list(self.players.values())
+        self.broadcast(Message("notice", "The server is restarting; the game will resume."), conns)
+        self.close_all_clients()
+
+    def run_game(self, first_question=0, resumed=False):
+        # Reset per-game state
+        self.answered_players = set()
+        self.correct_count = 0
+        self.round_correct = []
+        self.round_results = {}
+
+        results = self.server.results
+        if resumed:
+            self.wait_for_players()
+        else:
+            # Snapshot of players at game start
+            with self.lock:
+                self.game_roster = set(self.players.keys())
+            self.game_running = True
+
+            self.game_id = uuid.uuid4().hex
+            if results is not None:
+                results.game_started(self.game_id, self.name, len(self.questions), len(self.game_roster))
+            self.save_snapshot(0)
+
+        shutdown_flag = self.server.shutdown_flag
+
+        # Iterate through questions
+        for question_index in range(first_question, len(self.questions)):
+            if shutdown_flag.is_set():
+                self.finish_game("Server shutting down.")
+                return
+
+            with self.lock:
+                too_few = len(self.players) < 2
+            if too_few:
+                self.finish_game("Player count is less than 2; Ending the game.")
+                return
+
+            self.active_question_idx = question_index
+
+            q = self.questions[question_index]
+            message = question_message(q)
+            correct_answer = q["Answer"][-1].strip().upper()
+
+            # Reset round-specific tracking
+            with self.lock:
+                self.answered_players = set()
+                self.correct_count = 0
+                self.round_correct = []
+                self.round_results = {}
+                self.round_answer = correct_answer
+                self.outstanding = set(self.players)
+                self.round_id += 1
+                self.round_deadline = None
+                self.round_started = time.monotonic()
+                self.round_open = True
+
+            # Send question to all players, noting when it reaches each
+            # socket: the last player of a large room gets it milliseconds
+            # after the first, and answers are timed from their own copy
+            with self.server.question_fanout_seconds.time():
+                self.broadcast(message, timed=True)
+
+            # The clock starts once the question is out
+            timers = self.schedule_deadline()
+
+            self.log("Waiting for answers to current question...")
+            waiting_for_last_answer = False
+
+            # Wait until all connected players answer or time runs out;
+            # receive_answer, leave and expire_round signal round_done
+            with self.lock:
+                while self.outstanding and self.round_open and not shutdown_flag.is_set():
+                    # Grace period if players leave mid-question
+                    if len(self.players) < 2 and not waiting_for_last_answer:
+                        self.log("Waiting for last player's answer before ending.")
+                        waiting_for_last_answer = True
+                    self.round_done.wait(timeout=1.0)
+
+                self.round_open = False
+                missed = [] if shutdown_flag.is_set() else self.score_missed_answers()
+                podium = self.rank_correct_answers()
+
+            for timer in timers:
+                timer.cancel()
+            if missed:
+                self.server.rounds_timed_out_total.inc()
+                self.log(f"Time is up: {len(missed)} player(s) did not answer.")
+            for position, (user, points, compensation) in enumerate(podium, 1):
+                ms = round(compensation * 1000)
+                note = f" ({ms} ms latency compensation)" if ms else ""
+                self.log(f"{user} answered correctly ({position}{ordinal_suffix(position)}) +{points} pts{note}")
+
+            if shutdown_flag.is_set():
+                self.finish_game("Server shutting down.")
+                return
+
+            # Send individual results. Only the first three correct answers
+            # get their own text; everyone else with the same outcome shares
+            # one Message, so a round encodes a handful of results and each
+            # goes out as a broadcast to the players who earned it
+            round_scores = {}
+            result_recipients = {}
+            for user, (position, points, _, _, _) in self.round_results.items():
+                if points:
+                    round_scores[user] = points
+                conn = self.players.get(user)
+                if conn:
+                    key = (position if position is None or position <= 3 else 4, points)
+                    result_recipients.setdefault(key, []).append(conn)
+            for (position, points), conns in result_recipients.items():
+                self.broadcast(result_message(position, points, correct_answer), conns)
+
+            # Hand the round's answers to the results writer
+            if results is not None:
+                results.answers([
+                    (self.game_id, question_index, user, answer, 1 if position else 0, position, points, at,
+                     compensation)
+                    for user, (position, points, answer, at, compensation) in self.round_results.items()
+                ])
+
+            # Apply round scores to total scores
+            with self.lock:
+                for user, pts in round_scores.items():
+                    if user in self.player_scores:
+                        self.player_scores[user] += pts
+                self.leaderboard.add_points(round_scores)
+
+            self.refresh_scoreboard()
+            self.broadcast_scoreboard()
+            self.server.rounds_total.inc()
+            self.server.log_backpressure()
+            self.save_snapshot(question_index + 1)
+
+            if not self.game_running:
+                return
+
+        self.finish_game("All questions have been sent and answered!")
+
+    def save_snapshot(self, next_question):
+        # Hand the state needed to resume the game at next_question to the
+        # snapshot writer
+        store = self.server.snapshots
+        if store is None:
+            return
+        with self.lock:
+            state = {
+                "version": SNAPSHOT_VERSION,
+                "room": self.name,
+                "game_id": self.game_id,
+                "taken_at": time.time(),
+                "next_question": next_question,
+                "questions": self.questions,
+                "scores": dict(self.player_scores),
+                "roster": sorted(self.game_roster),
+                "sessions": dict(self.sessions),
+            }
+        store.save(self.name, state)
+
+    def resume(self, state):
+        # Restore a game from a snapshot and continue it from its next
+        # question once the players had RESUME_GRACE seconds to reconnect
+        with self.lock:
+            self.questions = state["questions"]
+            self.game_id = state["game_id"]
+            self.player_scores = dict(state["scores"])
+            self.answers_by_player = {user: [] for user in self.player_scores}
+            self.game_roster = set(state["roster"])
+            self.sessions = dict(state["sessions"])
+            self.game_running = True
+        self.server.add_sessions(self.name, self.sessions)
+
+        self.game_thread = threading.Thread(target=self.run_game, args=(state["next_question"], True))
+        self.game_thread.start()
+
+    def wait_for_players(self):
+        # Resumed game: wait until the whole roster is back, or the grace
+        # period is over
+        deadline = time.monotonic() + RESUME_GRACE
+        with self.lock:
+            while len(self.players) < len(self.game_roster) and not self.server.shutdown_flag.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.round_done.wait(min(remaining, 1.0))
+            back = len(self.players)
+        self.log(f"{back} of {len(self.game_roster)} players reconnected to the resumed game.")
+
+    def schedule_deadline(self):
+        # Close the current round question_time seconds from now and remind
+        # timer-aware clients how long is left. Returns the scheduled
+        # deadlines so the round can cancel them when it ends early.
+        limit = self.server.question_time
+        if not limit:
+            return []
+        scheduler = self.server.deadlines
+        with self.lock:
+            self.round_deadline = deadline = time.monotonic() + limit
+            round_id = self.round_id
+        timers = [scheduler.call_at(deadline, self.expire_round, round_id)]
+        reminders = math.ceil(limit / TIMELEFT_INTERVAL) - 1
+        for i in range(1, reminders + 1):
+            timers.append(scheduler.call_at(deadline - i * TIMELEFT_INTERVAL, self.server.defer,
+                                            self.send_time_left))
+        self.send_time_left()
+        return timers
+
+    def expire_round(self, round_id):
+        # Scheduler thread: the round's time is up
+        with self.lock:
+            if round_id != self.round_id or not self.round_open:
+                return
+            self.round_open = False
+            self.round_done.notify_all()
+
+    def send_time_left(self, conns=None):
+        # TIMELEFT:<whole seconds left, rounded up> for clients with CAPS:timer
+        deadline = self.round_deadline
+        if not self.round_open or deadline is None:
+            return
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        if conns is None:
+            conns = list(self.players.values())
+        conns = [c for c in conns if "timer" in c.caps]
+        if conns:
+            self.server.fanout.broadcast(conns, Message("timeleft", math.ceil(remaining)))
+
+    def score_missed_answers(self):
+        # Under lock, once the round has closed: players still connected who
+        # did not answer are scored as wrong. Returns their usernames.
+        missed = [user for user in self.outstanding if user in self.players]
+        for user in missed:
+            self.round_results[user] = (None, 0, None, None, 0.0)
+            self.answers_by_player[user].append({
+                "question_index": self.active_question_idx,
+                "answer": None,
+                "correct": False,
+            })
+        self.outstanding = set()
+        return missed
+
+    def rank_correct_answers(self):
+        # Under lock, once the round has closed: number the correct answers
+        # by answer time less their latency compensation and award their
+        # points, a point per player for the first and one for the rest.
+        # Returns [(username, points, compensation)] for the first three.
+        podium = []
+        for position, (_, _, user) in enumerate(sorted(self.round_correct), 1):
+            _, _, answer, at, compensation = self.round_results[user]
+            points = len(self.players) if position == 1 else 1
+            self.round_results[user] = (position, points, answer, at, compensation)
+            if position <= 3:
+                podium.append((user, points, compensation))
+        return podium
+
+    def receive_answer(self, username, answer, arrived=None):
+        with self.server.answer_ingest_seconds.time():
+            self.record_answer(username, answer, arrived)
+
+    def record_answer(self, username, answer, arrived=None):
+        # Only the bookkeeping runs under the lock: a set lookup, a few
+        # dict updates and a comparison with the precomputed answer.
+        # Replies and log lines are produced after it is released.
+        # arrived is the time.monotonic() the answer was read at, if not now.
+        answer = answer.strip().upper()
+        now = time.time()
+        if arrived is None:
+            arrived = time.monotonic()
+        with self.lock:
+            # Reject answers if game is not active
+            if not self.game_running:
+                rejection = "GAME_NOT_STARTED"
+
+            # Reject answers if there is no active question
+            elif self.active_question_idx is None or self.active_question_idx >= len(self.questions):
+                rejection = "NO_ACTIVE_QUESTION"
+
+            # Ignore duplicate answers
+            elif username in self.answered_players:
+                return
+
+            # Reject answers that arrive after the round has closed
+            elif not self.round_open:
+                rejection = "TIME_UP"
+
+            else:
+                rejection = None
+                self.answered_players.add(username)
+                self.outstanding.discard(username)
+                if not self.outstanding:
+                    self.round_done.notify_all()
+
+                # Correct answers are ranked when the round closes, by the
+                # time from the player's question being written to their
+                # answer arriving, less their round trip. Players whose
+                # question was not timed (resumed mid-round) count from the
+                # round's start.
+                correct = answer == self.round_answer
+                conn = self.players.get(username)
+                compensation = self.server.compensation(conn)
+                delivered = conn.written_at if conn is not None else None
+                if delivered is None or delivered < self.round_started:
+                    delivered = self.round_started
+                delivery = delivered - self.round_started
+                if correct:
+                    self.correct_count += 1
+                    self.round_correct.append((arrived - delivered - compensation, self.correct_count, username))
+                self.round_results[username] = (0, 0, answer, now, compensation)
+
+                # Log answer history
+                self.answers_by_player[username].append({
+                    "question_index": self.active_question_idx,
+                    "answer": answer,
+                    "correct": correct,
+                })
+
+        if rejection:
+            conn = self.players.get(username)
+            self.log(f"{username} {ANSWER_REJECTIONS[rejection]}.")
+            if conn:
+                conn.send(Message("error", rejection))
+            return
+
+        self.server.answers_total.inc()
+        self.server.answer_compensation_seconds.observe(compensation)
+        self.server.question_delivery_seconds.observe(delivery)
+
+        # Log specific answer choice; the first three correct answers are
+        # logged with their points when the round closes
+        self.log(f"Player {username} submitted answer: {answer}")
+        self.log(f"{username} answered {'correctly' if correct else 'incorrectly'}.")
+
+    def join(self, conn, addr, username):
+        # Add a validated handshake to this room's lobby. Returns False if
+        # the connection was rejected.
+        with self.lock:
+            # Reject any join attempts once game has started (no reconnections allowed)
+            if self.game_running:
+                rejection = "GAME_ALREADY_STARTED"
+                self.log(f"Connection attempt from {addr} rejected: game already started.")
+            elif username in self.players:
+                rejection = f"The name {username} already exists!"
+                self.log(f"Duplicate username attempt: {username}")
+            else:
+                rejection = None
+                conn.username = username
+                conn.room = self
+                self.players[username] = conn
+                self.answers_by_player.setdefault(username, [])
+                self.player_scores.setdefault(username, 0)
+                self.leaderboard.add(username, self.player_scores[username])
+                token = self.sessions[username] = secrets.token_urlsafe(16)
+                conn.session = token
+
+        if rejection:
+            conn.send(encode(rejection))
+            conn.close()
+            return False
+
+        self.server.add_sessions(self.name, {username: token})
+
+        self.log(f"{username} has connected to the server.")
+        conn.send(Message("welcome", username))
+
+        # The lobby, the new player included, gets the updated scoreboard.
+        # The player was in the lobby before any game could start, so a game
+        # started since then already sends them its questions.
+        self.schedule_scoreboard()
+
+        return True
+
+    def rejoin(self, conn, addr, username, token):
+        # Give a player's place back to a new connection presenting their
+        # session token, replacing the old connection if the server has not
+        # noticed it dropped yet. The player is resynced with one RESUMED
+        # line. Returns False if the connection was rejected.
+        with self.lock:
+            if self.sessions.get(username) != token:
+                old = None
+                resumed = None
+            else:
+                old = self.players.get(username)
+                conn.username = username
+                conn.room = self
+                conn.session = token
+                self.players[username] = conn
+                self.answers_by_player.setdefault(username, [])
+                score = self.player_scores.setdefault(username, 0)
+                if old is None:
+                    self.leaderboard.add(username, score)
+                answered = username in self.answered_players
+                if self.round_open and not answered:
+                    self.outstanding.add(username)
+                resumed = self.resumed_message(score, answered)
+                # A resumed game may be waiting for its players
+                self.round_done.notify_all()
+
+        if resumed is None:
+            self.log(f"Reconnection attempt from {addr} rejected: unknown session.")
+            conn.send(encode("ERROR:BAD_SESSION"))
+            conn.close()
+            return False
+
+        if old is not None:
+            old.close(flush=False)
+        self.log(f"{username} has reconnected.")
+        conn.send(resumed)
+        self.refresh_scoreboard()
+        self.broadcast_scoreboard()
+        return True
+
+    def resumed_message(self, score, answered):
+        # Under lock. The player's score, whether they answered, the seconds
+        # left and the question, the last two only while a round is open
+        if not (self.game_running and self.round_open and self.active_question_idx is not None):
+            return Message("resumed", score, False, 0, None)
+        seconds = 0
+        if self.round_deadline is not None:
+            seconds = max(0, math.ceil(self.round_deadline - time.monotonic()))
+        q = self.questions[self.active_question_idx]
+        return Message("resumed", score, answered, seconds, [q["question"], q["A"], q["B"], q["C"]])
+
+    def leave(self, username, conn):
+        with self.lock:
+            # The player may already be gone (e.g. removed by finish_game),
+            # or the name may now belong to a newer connection
+            if self.players.get(username) is not conn:
+                return
+            self.players.pop(username)
+            self.leaderboard.remove(username)
+            self.outstanding.discard(username)
+            if not self.outstanding:
+                self.round_done.notify_all()
+
+        # We only log disconnects if the game isn't ending,
+        # otherwise the log gets flooded when everyone is kicked at once.
+        if not self.game_ending:
+            self.log(f"{username} has disconnected from the server.")
+
+        if not self.game_running:
+            self.player_scores.pop(username, None)
+            token = self.sessions.pop(username, None)
+            if token is not None:
+                self.server.end_sessions({username: token})
+
+        self.schedule_departure(username)
+
+        if not self.game_running:
+            self.schedule_scoreboard()
+
+    def schedule_departure(self, username):
+        # Tell the remaining players who left. One heartbeat check can reap
+        # hundreds of dead peers at once, so departures are batched like
+        # scoreboard updates and go out as one USER_LEFT list
+        with self.lock:
+            self.departed.append(username)
+            if len(self.departed) > 1:
+                return
+            delay = SCOREBOARD_COALESCE * max(1, len(self.players) / SCOREBOARD_COALESCE_PLAYERS)
+        self.server.deadlines.call_later(delay, self.server.defer, self.send_departures)
+
+    def send_departures(self):
+        # Room worker
+        with self.lock:
+            departed, self.departed = self.departed, []
+        self.broadcast(Message("left", departed))
+
+    def schedule_scoreboard(self):
+        # Joins and departures come in bursts (players arriving when an
+        # event starts, dead connections reaped by one check), and each
+        # would otherwise send the whole lobby a scoreboard; the updates of
+        # a burst go out as one
+        with self.lock:
+            if self.scoreboard_due:
+                return
+            self.scoreboard_due = True
+            delay = SCOREBOARD_COALESCE * max(1, len(self.players) / SCOREBOARD_COALESCE_PLAYERS)
+        self.server.deadlines.call_later(delay, self.server.defer, self.send_due_scoreboard)
+
+    def send_due_scoreboard(self):
+        # Room worker
+        with self.lock:
+            self.scoreboard_due = False
+        self.refresh_scoreboard()
+        self.broadcast_scoreboard()
+
+    def ranked_players(self):
+        # [(rank, username, score)] for connected players, highest first
+        return self.leaderboard.ranked()
+
+    def broadcast_scoreboard(self):
+        # Legacy clients get the full cached scoreboard message. Delta
+        # clients share one delta for the top N plus their own rank.
+        fanout = self.server.fanout
+        with self.server.scoreboard_broadcast_seconds.time(), self.broadcast_lock:
+            conns = list(self.players.values())
+            legacy = [c for c in conns if "scoredelta" not in c.caps]
+            if legacy:
+                fanout.broadcast(legacy, self.leaderboard.message())
+
+            with self.scoreboard_lock:
+                ranked = self.leaderboard.ranked()
+                total = len(ranked)
+                view = top_view(ranked, self.server.scoreboard_top)
+                delta = delta_message(self.last_top, view, self.last_total, total)
+                self.last_top = view
+                self.last_total = total
+
+            delta_conns = [c for c in conns if "scoredelta" in c.caps]
+            if delta is not None:
+                fanout.broadcast(delta_conns, delta)
+            # Every rank goes out in one call, so in gateways mode each link
+            # carries one item instead of one per player
+            ranks = []
+            for c in delta_conns:
+                message = self.rank_update(c, total)
+                if message is not None:
+                    ranks.append((c, message))
+            fanout.send_each(ranks)
+
+    def rank_update(self, conn, total):
+        # MYRANK only goes out when the recipient's standing changed;
+        # returns it, or None
+        rank = self.leaderboard.rank_of(conn.username)
+        if rank is None:
+            return None
+        entry = (rank, self.leaderboard.scores.get(conn.username, 0), total)
+        if entry == conn.sent_rank:
+            return None
+        conn.sent_rank = entry
+        return rank_message(*entry)
+
+    def send_rank(self, conn, total):
+        message = self.rank_update(conn, total)
+        if message is not None:
+            conn.send(message)
+
+    def send_scoreboard_to_client(self, conn):
+        # While a coalesced update is pending, it brings the full scoreboard
+        # and the player's rank; both cost a pass over the whole room, which
+        # a join storm cannot afford per player. Delta clients still need
+        # the top-N snapshot the deltas apply to.
+        due = self.scoreboard_due
+        if "scoredelta" not in conn.caps:
+            if not due:
+                conn.send(self.leaderboard.message())
+            return
+        with self.scoreboard_lock:
+            conn.send(top_message(self.last_top, self.last_total))
+            conn.sent_rank = None
+            if not due:
+                self.send_rank(conn, self.last_total)
+
+    def refresh_scoreboard(self):
+        # Push the current ranking to any attached front-end
+        listeners = self.server.scoreboard_listeners
+        if not listeners:
+            return
+        ranked = self.ranked_players()
+        for listener in listeners:
+            listener(self.name, ranked)
+
+
+class QuizServer:
+
+    # Settings after io_mode are keyword-only: there are many of them, and
+    # several have the same type
+    def __init__(self, ip="127.0.0.1", port=5004, io_mode="threads", *, max_queue_bytes=MAX_QUEUE_BYTES,
+                 scoreboard_top=SCOREBOARD_TOP, max_room_size=0, metrics_port=0, metrics_ip="127.0.0.1",
+                 question_time=0, results_db=None, snapshot_dir=None, idle_timeout=IDLE_TIMEOUT,
+                 handshake_timeout=HANDSHAKE_TIMEOUT, max_compensation=MAX_COMPENSATION,
+                 listen_backlog=LISTEN_BACKLOG, handshake_rate=HANDSHAKE_RATE, handshake_workers=HANDSHAKE_WORKERS,
+                 max_pending_handshakes=MAX_PENDING_HANDSHAKES, max_lobby=0, gateways=GATEWAYS):
+        self.ip = ip
+        self.port = port
+        self.io_mode = io_mode
+        self.scoreboard_top = scoreboard_top
+
+        # Seconds players get for each question; 0 waits for every answer
+        self.question_time = question_time
+
+        # Seconds before a silent heartbeat client or an unfinished
+        # handshake is disconnected; 0 disables either check
+        self.idle_timeout = idle_timeout
+        self.handshake_timeout = handshake_timeout
+        self.ping_stamps = itertools.count(1)
+
+        # Cap on the round trip subtracted from a correct answer's arrival
+        # time when answers are ranked; 0 ranks by arrival alone
+        self.max_compensation = max_compensation
+
+        # Admission of new connections: listen backlog, handshakes admitted
+        # per second, handshake workers (threads mode) and the most
+        # handshakes in progress at once
+        self.listen_backlog = listen_backlog
+        self.handshake_rate = handshake_rate
+        self.handshake_workers = max(1, handshake_workers)
+        self.max_pending_handshakes = max(1, max_pending_handshakes)
+        self.handshake_lock = threading.Lock()
+        self.handshakes_pending = 0
+
+        # Players that may wait in lobbies (rooms without a running game)
+        # across the whole server, not per room; further handshakes get
+        # LOBBY_FULL. 0 = no limit.
+        self.max_lobby = max_lobby
+
+        # Players per automatically assigned room; 0 puts everyone who does
+        # not name a room in DEFAULT_ROOM
+        self.max_room_size = max_room_size
+
+        # Per-connection outbound queues drained by one writer thread;
+        # clients whose backlog passes max_queue_bytes are evicted. In
+        # gateways mode start_server replaces it with a GatewayPool of
+        # that many processes.
+        self.max_queue_bytes = max_queue_bytes
+        self.gateways = gateways
+        self.fanout = FanOut(max_queue_bytes, on_evict=self.on_slow_consumer)
+        self.logged_evictions = 0   # evictions count at the last backlog report
+
+        # Counters, gauges and histograms for monitoring; served in the
+        # Prometheus text format on metrics_ip:metrics_port unless the port is 0
+        self.metrics_port = metrics_port
+        self.metrics_ip = metrics_ip
+        self.metrics_httpd = None
+        self.setup_metrics()
+
+        # Game results streamed to a SQLite database by a background writer;
+        # None unless results_db is set. Raises sqlite3.Error if the
+        # database cannot be opened.
+        self.results = None
+        if results_db:
+            self.results = ResultsWriter(
+                results_db,
+                batch_histogram=self.results_batch_seconds,
+                on_error=lambda e: self.log(f"Could not save game results: {e}"),
+            )
+
+        # Running games are snapshotted to snapshot_dir, if set, and resumed
+        # from there when the server starts
+        self.snapshots = None
+        if snapshot_dir:
+            self.snapshots = SnapshotStore(
+                snapshot_dir, on_error=lambda e: self.log(f"Could not save a game snapshot: {e}"))
+
+        # Question deadlines of every room, on one timer thread
+        self.deadlines = DeadlineScheduler(
+            self.deadline_lateness_seconds,
+            on_error=lambda e: self.log(f"Deadline callback failed: {e}"),
+        )
+
+        # Work a deadline makes due that costs a pass over a room or over
+        # many connections (coalesced scoreboards, TIMELEFT reminders, the
+        # connection checks) runs on one room worker thread. The scheduler
+        # thread only queues it, so no deadline waits behind a large room.
+        self.room_jobs = queue.Queue()
+        threading.Thread(target=self.room_worker, daemon=True).start()
+
+        # Heap of (time.monotonic() of the next check, sequence, connection)
+        # over every open connection, for check_connections
+        self.watch_lock = threading.Lock()
+        self.watched = []
+        self.watch_seq = itertools.count()
+
+        # Game rooms by name. rooms_lock only guards the mapping and room
+        # reservations; game state is protected by each room's own lock.
+        self.rooms_lock = TimedLock(self.rooms_lock_wait, self.rooms_lock_hold)
+        self.rooms = {DEFAULT_ROOM: GameRoom(self, DEFAULT_ROOM)}
+        self.room_seq = itertools.count(2)
+
+        # Session token -> (room name, username), under rooms_lock. Players
+        # get a token when they join, so a dropped connection can take its
+        # place back mid-game with "RESUME:<token>".
+        self.sessions = {}
+
+        # Server socket reference so it can be closed cleanly on shutdown
+        self.server_sock = None
+
+        # Event used to signal threads to stop
+        self.shutdown_flag = threading.Event()
+
+        # Human-readable event lines for whichever front-end is attached
+        self.log_queue = queue.Queue()
+
+        # Callables invoked with (room name, ranked scoreboard
+        # [(rank, username, score)]) whenever a room's scoreboard changes;
+        # an empty list means it was cleared
+        self.scoreboard_listeners = []
+
+    def log(self, message):
+        self.log_queue.put(message)
+
+    def setup_metrics(self):
+        m = self.metrics = Registry()
+
+        self.question_fanout_seconds = m.histogram(
+            "squid_question_fanout_seconds", "Time to queue a QUESTION for every player in a room.")
+        self.answer_ingest_seconds = m.histogram(
+            "squid_answer_ingest_seconds", "Time to process one ANSWER, including lock waits.")
+        self.scoreboard_broadcast_seconds = m.histogram(
+            "squid_scoreboard_broadcast_seconds", "Time to send one scoreboard update to a room.")
+
+        wait_help = "Time threads waited to acquire an engine lock."
+        hold_help = "Time an engine lock was held."
+        self.room_lock_wait = m.histogram("squid_lock_wait_seconds", wait_help, {"lock": "room"})
+        self.room_lock_hold = m.histogram("squid_lock_hold_seconds", hold_help, {"lock": "room"})
+        self.rooms_lock_wait = m.histogram("squid_lock_wait_seconds", wait_help, {"lock": "rooms"})
+        self.rooms_lock_hold = m.histogram("squid_lock_hold_seconds", hold_help, {"lock": "rooms"})
+
+        self.connections_total = m.counter("squid_connections_total", "Client connections accepted.")
+        self.lobby_full_total = m.counter(
+            "squid_lobby_full_total", "Handshakes rejected because the lobbies were full.")
+        self.answers_total = m.counter("squid_answers_total", "Answers accepted.")
+        self.rounds_total = m.counter("squid_rounds_total", "Rounds completed.")
+        self.games_total = m.counter("squid_games_total", "Games finished.")
+        self.rounds_timed_out_total = m.counter(
+            "squid_rounds_timed_out_total", "Rounds closed by their time limit with answers missing.")
+        self.deadline_lateness_seconds = m.histogram(
+            "squid_deadline_lateness_seconds", "Delay between a scheduled deadline and its callback.")
+        timeout_help = "Connections closed because the client went silent."
+        self.handshake_timeouts_total = m.counter("squid_timeouts_total", timeout_help, {"stage": "handshake"})
+        self.idle_timeouts_total = m.counter("squid_timeouts_total", timeout_help, {"stage": "idle"})
+        self.rtt_seconds = m.histogram(
+            "squid_client_rtt_seconds", "Client round-trip times measured with heartbeats.")
+        self.answer_compensation_seconds = m.histogram(
+            "squid_answer_compensation_seconds", "Latency compensation applied to answers when ranking them.")
+        self.question_delivery_seconds = m.histogram(
+            "squid_question_delivery_seconds",
+            "Time from a round starting to its QUESTION being written to a player who answered.")
+        self.results_batch_seconds = m.histogram(
+            "squid_results_batch_seconds", "Time to write one batch of game results to the database.")
+
+        # Read from the engine at scrape time
+        m.gauge("squid_rooms", "Game rooms.", fn=lambda: len(self.rooms))
+        m.gauge("squid_handshakes_pending", "Accepted connections whose handshake is unfinished.",
+                fn=lambda: self.handshakes_pending)
+        m.gauge("squid_players", "Players in all rooms.",
+                fn=lambda: sum(len(room.players) for room in list(self.rooms.values())))
+        m.gauge("squid_games_running", "Rooms with a game in progress.",
+                fn=lambda: sum(1 for room in list(self.rooms.values()) if room.game_running))
+        fanout_stat = lambda key: lambda: self.fanout.stats()[key]
+        m.gauge("squid_connections", "Open client connections.", fn=fanout_stat("connections"))
+        m.counter("squid_outbound_bytes_total", "Bytes written to client sockets.", fn=fanout_stat("bytes_sent"))
+        m.counter("squid_outbound_deferred_bytes_total", "Outbound bytes that had to wait in a queue.",
+                  fn=fanout_stat("bytes_deferred"))
+        m.counter("squid_evictions_total", "Clients evicted as slow consumers.", fn=fanout_stat("evictions"))
+        m.gauge("squid_outbound_queued_bytes", "Outbound bytes currently queued.", fn=fanout_stat("queued_bytes"))
+        m.gauge("squid_outbound_max_backlog_bytes", "Largest single-connection outbound backlog.",
+                fn=fanout_stat("max_backlog_bytes"))
+        results_stat = lambda key: lambda: getattr(self.results, key, 0)
+        m.counter("squid_results_written_total", "Result events saved to the database.",
+                  fn=results_stat("written"))
+        m.counter("squid_results_dropped_total", "Result events dropped because the writer fell behind.",
+                  fn=results_stat("dropped"))
+        m.counter("squid_results_failed_total", "Result events lost to database errors.",
+                  fn=results_stat("failed"))
+        m.gauge("squid_results_pending", "Result submissions waiting for the writer.",
+                fn=lambda: self.results.pending() if self.results else 0)
+
+    def on_slow_consumer(self, conn):
+        self.log(f"{conn.username or conn.addr} evicted: outbound queue exceeded "
+                 f"{self.fanout.max_queue_bytes} bytes.")
+
+    def defer(self, fn, *args):
+        # Scheduler thread: run fn(*args) on the room worker
+        self.room_jobs.put((fn, args))
+
+    def room_worker(self):
+        while True:
+            job = self.room_jobs.get()
+            if job is None:
+                return
+            fn, args = job
+            try:
+                fn(*args)
+            except Exception as e:
+                self.log(f"Room update failed: {e}")
+
+    def watch(self, conn):
+        # Any thread: include a new connection in the heartbeat checks
+        with self.watch_lock:
+            heapq.heappush(self.watched, (conn.last_heard, next(self.watch_seq), conn))
+
+    def check_connections(self):
+        # Scheduler thread, every HEARTBEAT_TICK seconds
+        if self.shutdown_flag.is_set():
+            return
+        self.defer(self.check_due_connections)
+        self.deadlines.call_later(HEARTBEAT_TICK, self.check_connections)
+
+    def check_due_connections(self):
+        # Room worker: check the connections whose next check has come,
+        # so a tick costs as much as the connections due, not all of them.
+        # Close handshakes that never finished and heartbeat clients that
+        # went silent, and ping the other heartbeat clients every third of
+        # idle_timeout. Closing wakes the connection's reader, which removes
+        # the player.
+        now = time.monotonic()
+        conns = []
+        with self.watch_lock:
+            while self.watched and self.watched[0][0] <= now:
+                conns.append(heapq.heappop(self.watched)[2])
+
+        interval = self.idle_timeout / 3
+        stalled = []
+        silent = []
+        due = []
+        for conn in conns:
+            if conn.closed:
+                continue
+            quiet = now - conn.last_heard
+            if conn.username is None:
+                if self.handshake_timeout and quiet > self.handshake_timeout:
+                    stalled.append(conn)
+                    continue
+            elif self.idle_timeout and "heartbeat" in conn.caps:
+                if quiet > self.idle_timeout:
+                    silent.append(conn)
+                    continue
+                if now - conn.last_ping >= interval:
+                    due.append(conn)
+        if due:
+            self.ping(due)
+
+        closing = set(stalled + silent)
+        with self.watch_lock:
+            for conn in conns:
+                if not conn.closed and conn not in closing:
+                    heapq.heappush(self.watched, (self.next_check(conn, now), next(self.watch_seq), conn))
+
+        for conn in stalled + silent:
+            conn.close(flush=False)
+        if stalled:
+            self.handshake_timeouts_total.inc(len(stalled))
+            self.log(f"Closed {len(stalled)} connection(s) that sent no username within "
+                     f"{self.handshake_timeout:g} s.")
+        if silent:
+            self.idle_timeouts_total.inc(len(silent))
+            names = ", ".join(sorted(conn.username for conn in silent))
+            self.log(f"No heartbeat for {self.idle_timeout:g} s, disconnecting: {names}")
+
+    def next_check(self, conn, now):
+        # When a connection just checked next needs a ping or may have
+        # timed out; data arriving meanwhile only moves the check later,
+        # which it then reschedules
+        if conn.username is None and self.handshake_timeout:
+            return conn.last_heard + self.handshake_timeout
+        if conn.username is not None and self.idle_timeout and "heartbeat" in conn.caps:
+            return min(conn.last_ping + self.idle_timeout / 3, conn.last_heard + self.idle_timeout)
+        return now + HEARTBEAT_RECHECK
+
+    def ping(self, conns):
+        # PING:<stamp> to each of conns; the PONG echoing the stamp gives a
+        # round-trip sample
+        stamp = next(self.ping_stamps)
+        now = time.monotonic()
+        for conn in conns:
+            conn.ping_stamp = stamp
+            conn.last_ping = now
+        self.fanout.broadcast(conns, Message("ping", stamp))
+
+    def record_pong(self, conn, stamp):
+        # A PONG echoing the last PING: the time from sending it to hearing
+        # back is a round-trip sample, and the connection keeps the lowest.
+        # A client can delay its PONGs but not speed them up, so holding
+        # them back does not raise its compensation. Stale or unstamped
+        # PONGs only count as signs of life.
+        if conn.ping_stamp is None or stamp != str(conn.ping_stamp):
+            return
+        conn.ping_stamp = None
+        sample = max(0.0, conn.last_heard - conn.last_ping)
+        if conn.rtt is None or sample < conn.rtt:
+            conn.rtt = sample
+        self.rtt_seconds.observe(sample)
+
+    def compensation(self, conn):
+        # Seconds taken off an answer's arrival time when answers are
+        # ranked: the player's lowest round trip, which covers both the
+        # question's way out and the answer's way back, up to
+        # max_compensation, so a player far from the server is not beaten
+        # on network latency alone. Clients without heartbeats get none.
+        if conn is None or conn.rtt is None:
+            return 0.0
+        return min(conn.rtt, self.max_compensation)
+
+    def room(self, name=DEFAULT_ROOM):
+        with self.rooms_lock:
+            return self.rooms.get(name)
+
+    def room_list(self):
+        with self.rooms_lock:
+            return list(self.rooms.values())
+
+    def load_questions(self, file_path, question_count):
+        if not file_path.strip():
+            self.log("Enter a valid question file path.")
+            return []
+
+        try:
+            questions = load_question_file(file_path, question_count)
+        except (IOError, ZeroDivisionError):
+            self.log(f"Could not read the file {file_path}")
+            return []
+
+        self.log(f"File {file_path} opened successfully.")
+        return questions
+
+    def start_game(self, question_count, file_path, room_name=DEFAULT_ROOM):
+        # Validate settings, load questions and start the game in one room.
+        # Returns True if the game was started.
+        room = self.room(room_name)
+        if room is None:
+            self.log(f"There is no room named {room_name}.")
+            return False
+
+        if room.game_running:
+            room.log("A game is already in progress! Please wait for it to finish.")
+            return False
+
+        if question_count <= 0:
+            self.log("Enter a valid number of questions before starting.")
+            return False
+
+        if not file_path.strip():
+            self.log("Enter a question file path before starting.")
+            return False
+
+        refreshed_questions = self.load_questions(file_path, question_count)
+
+        if not refreshed_questions:
+            self.log("Failed to load questions. Check your file path and format.")
+            return False
+
+        return room.start_game(refreshed_questions)
+
+    def assign_room(self, room_name):
+        # Pick the room for a new handshake and reserve a place in it.
+        # Returns (room, None) or (None, rejection message).
+        with self.rooms_lock:
+            if self.max_lobby and self.lobby_size() >= self.max_lobby:
+                self.lobby_full_total.inc()
+                return None, "LOBBY_FULL"
+            if room_name is not None:
+                if not ROOM_NAME.fullmatch(room_name):
+                    return None, "ERROR:BAD_ROOM_NAME"
+                room = self.rooms.get(room_name)
+                if room is None:
+                    room = self.rooms[room_name] = GameRoom(self, room_name)
+                elif self.max_room_size and len(room.players) + room.reserved >= self.max_room_size:
+                    return None, "ROOM_FULL"
+            elif not self.max_room_size:
+                room = self.rooms[DEFAULT_ROOM]
+            else:
+                # First lobby with space, or a fresh room when all are full or playing
+                for room in self.rooms.values():
+                    if not room.game_running and len(room.players) + room.reserved < self.max_room_size:
+                        break
+                else:
+                    room_name = f"room-{next(self.room_seq)}"
+                    while room_name in self.rooms:
+                        room_name = f"room-{next(self.room_seq)}"
+                    room = self.rooms[room_name] = GameRoom(self, room_name)
+            room.reserved += 1
+            return room, None
+
+    def lobby_size(self):
+        # Under rooms_lock: players and reserved places in rooms whose game
+        # has not started
+        return sum(len(room.players) + room.reserved for room in self.rooms.values() if not room.game_running)
+
+    def release_room(self, room):
+        with self.rooms_lock:
+            room.reserved -= 1
+        self.discard_room_if_empty(room)
+
+    def discard_room_if_empty(self, room):
+        # Rooms other than DEFAULT_ROOM go away with their last player
+        if room.name == DEFAULT_ROOM:
+            return
+        with self.rooms_lock:
+            if (not room.players and not room.reserved and not room.game_running
+                    and self.rooms.get(room.name) is room):
+                del self.rooms[room.name]
+            else:
+                return
+        # Front-ends drop what they keep of the room
+        room.refresh_scoreboard()
+
+    def add_sessions(self, room_name, sessions):
+        with self.rooms_lock:
+            for username, token in sessions.items():
+                self.sessions[token] = (room_name, username)
+
+    def end_sessions(self, sessions):
+        with self.rooms_lock:
+            for token in sessions.values():
+                self.sessions.pop(token, None)
+
+    def resume_client(self, conn, addr, token):
+        # Reconnect a player by session token. Returns their username, or
+        # None if the token is unknown.
+        with self.rooms_lock:
+            room_name, username = self.sessions.get(token, (None, None))
+            room = self.rooms.get(room_name)
+            if room is not None:
+                room.reserved += 1
+        if room is None:
+            self.log(f"Reconnection attempt from {addr} rejected: unknown session.")
+            conn.send(encode("ERROR:BAD_SESSION"))
+            conn.close()
+            return None
+
+        try:
+            if not room.rejoin(conn, addr, username, token):
+                return None
+        finally:
+            self.release_room(room)
+        return username
+
+    def resume_games(self):
+        # Continue the games found in the snapshot directory
+        if self.snapshots is None:
+            return
+        start = time.perf_counter()
+        states = self.snapshots.load_all()
+        for room_name, state in states.items():
+            with self.rooms_lock:
+                room = self.rooms.get(room_name)
+                if room is None:
+                    room = self.rooms[room_name] = GameRoom(self, room_name)
+            room.resume(state)
+            room.log(f"Resuming the game at question {state['next_question'] + 1} of "
+                     f"{len(state['questions'])} from a snapshot taken "
+                     f"{time.time() - state['taken_at']:.1f} s ago.")
+        if states:
+            self.log(f"Resumed {len(states)} game(s) in {(time.perf_counter() - start) * 1000:.0f} ms.")
+
+    def register_client(self, conn, addr, received_data):
+        # Validate the username sent by a new client and add them to a room.
+        # Returns the registered username, or None if the connection was rejected.
+        token = parse_resume(received_data)
+        if token is not None:
+            return self.resume_client(conn, addr, token)
+
+        try:
+            username, room_name = parse_handshake(received_data)
+        except:
+            conn.close(flush=False)
+            return None
+
+        # Validate username
+        if not username:
+            conn.send(encode("The name cannot be empty!"))
+            self.log("A user with an invalid username tried to connect.")
+            conn.close()
+            return None
+
+        room, rejection = self.assign_room(room_name)
+        if room is None:
+            self.log(f"Connection attempt from {addr} rejected: {rejection}")
+            conn.send(encode(rejection))
+            conn.close()
+            return None
+
+        try:
+            if not room.join(conn, addr, username):
+                return None
+        finally:
+            self.release_room(room)
+        return username
+
+    def process_client_data(self, username, conn, framer, data):
+        # Handle one chunk of data received from a registered client; it may
+        # hold any number of messages plus the start of the next one
+        conn.last_heard = time.monotonic()
+        messages = framer.feed(data)
+        if LEGACY_ANSWER.fullmatch(framer.buf):
+            messages.append(framer.take_pending())
+        for message in messages:
+            self.process_message(username, conn, message)
+
+    def process_message(self, username, conn, message):
+        message = message.strip()
+        if not message:
+            return
+        if message.startswith("ANSWER:"):
+            parts = message.split(":")
+            if len(parts) == 2:
+                conn.room.receive_answer(username, parts[1], conn.last_heard)
+        elif message.startswith("CAPS:"):
+            # Optional protocol features announced by newer clients. The
+            # switch to v2 comes first, so the replies below use it.
+            conn.caps.update(message[5:].split(","))
+            if "v2" in conn.caps and conn.protocol == 1:
+                conn.send(encode(UPGRADE), protocol=2)
+            if "scoredelta" in conn.caps:
+                conn.room.send_scoreboard_to_client(conn)
+            if "timer" in conn.caps:
+                conn.room.send_time_left([conn])
+            if "resume" in conn.caps and conn.session:
+                conn.send(Message("session", conn.session))
+            # A first round-trip sample before the next question
+            if "heartbeat" in conn.caps and self.idle_timeout and conn.ping_stamp is None:
+                self.ping([conn])
+        elif message == "PONG" or message.startswith("PONG:"):
+            # Heartbeat reply; receiving it already refreshed last_heard
+            self.record_pong(conn, message[5:])
+        else:
+            conn.send(Message("notice", message))
+
+    def unregister_client(self, username, conn):
+        conn.close(flush=False)
+        room = conn.room
+        if room is None:
+            return
+        room.leave(username, conn)
+        self.discard_room_if_empty(room)
+
+    def expected_close(self, conn):
+        # Errors on a connection the server already closed (the writer closes
+        # the socket once its queue drains, which can race a reader still in
+        # recv), or whose room is closing every client, are expected
+        return conn.closed or (conn.room is not None and conn.room.game_ending)
+
+    def handle_client(self, conn):
+        # Handshake worker (threads mode): read and register the username,
+        # then give the player a reader thread of their own. The accept loop
+        # only queues a connection once it has data to read, so this recv
+        # does not wait on a silent peer (the socket has no timeout of its
+        # own, see outbound.py)
+        try:
+            if conn.closed:
+                return
+            try:
+                received_data = conn.sock.recv(RECV_SIZE)
+            except:
+                conn.close(flush=False)
+                return
+            if conn.closed:
+                return
+
+            name, rest = split_handshake(received_data)
+            username = self.register_client(conn, conn.addr, name)
+        finally:
+            self.end_handshake()
+        if username is None:
+            return
+        threading.Thread(target=self.read_client, args=(username, conn, rest)).start()
+
+    def read_client(self, username, conn, rest):
+        # Blocking reader of one registered player (threads mode)
+        sock = conn.sock
+        framer = LineFramer()
+        try:
+            if rest:
+                self.process_client_data(username, conn, framer, rest)
+            while True:
+                data = sock.recv(RECV_SIZE)
+                if not data:
+                    break
+                self.process_client_data(username, conn, framer, data)
+
+        except FrameTooLong:
+            self.log(f"{username} sent an oversized message; disconnecting.")
+
+        except Exception as e:
+            # If the server closed the socket (game end, eviction), the error
+            # is expected. We suppress the log to avoid "WinError 10038" and
+            # "Bad file descriptor" spam.
+            if not self.expected_close(conn):
+                self.log(f"{username} connection error: {e}")
+
+        finally:
+            self.unregister_client(username, conn)
+
+    def begin_handshake(self):
+        with self.handshake_lock:
+            self.handshakes_pending += 1
+
+    def end_handshake(self):
+        with self.handshake_lock:
+            self.handshakes_pending -= 1
+
+    def handshake_worker(self, handshakes):
+        while not self.shutdown_flag.is_set():
+            try:
+                conn = handshakes.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            self.handle_client(conn)
+
+    def accept_threads(self, s):
+        # Thread-per-player model: a selector holds accepted connections
+        # until their username arrives, then a fixed pool of handshake
+        # workers registers them, and every registered player gets its own
+        # blocking reader. A silent peer thus costs a selector entry rather
+        # than a worker until check_due_connections closes it. Over the
+        # handshake rate, or with max_pending_handshakes unfinished, the
+        # listening socket is taken out of the selector and new connections
+        # wait in the listen backlog.
+        handshakes = queue.Queue()
+        for _ in range(self.handshake_workers):
+            threading.Thread(target=self.handshake_worker, args=(handshakes,), daemon=True).start()
+        sel = selectors.DefaultSelector()
+        sel.register(s, selectors.EVENT_READ, None)
+        listening = True
+        bucket = TokenBucket(self.handshake_rate, self.handshake_rate)
+        next_sweep = 0.0
+
+        try:
+            while not self.shutdown_flag.is_set():
+                wait = bucket.delay()
+                admit = not wait and self.handshakes_pending < self.max_pending_handshakes
+                if admit != listening:
+                    if admit:
+                        sel.register(s, selectors.EVENT_READ, None)
+                    else:
+                        sel.unregister(s)
+                    listening = admit
+                try:
+                    events = sel.select(timeout=min(wait, 1.0) if wait else 1.0)
+                except OSError as e:
+                    if not self.shutdown_flag.is_set():
+                        self.log(f"Server socket error: {e}")
+                        self.finish_all_games("Server disconnected.")
+                    break
+
+                now = time.monotonic()
+                if now >= next_sweep:
+                    self.forget_closed_handshakes(sel)
+                    next_sweep = now + 1.0
+
+                for key, _ in events:
+                    if key.data is not None:
+                        # The username (or EOF) arrived; a worker reads it
+                        sel.unregister(key.fileobj)
+                        handshakes.put(key.data)
+                        continue
+                    try:
+                        sock, addr = s.accept()
+                    except socket.timeout:
+                        continue
+                    except OSError as e:
+                        if not self.shutdown_flag.is_set():
+                            self.log(f"Server socket error: {e}")
+                            self.finish_all_games("Server disconnected.")
+                        return
+                    bucket.take()
+                    self.begin_handshake()
+                    # A recycled descriptor means the old socket was closed elsewhere
+                    stale = sel.get_map().get(sock.fileno())
+                    if stale is not None:
+                        self.forget_handshake(sel, stale.fileobj)
+                    conn = self.fanout.connect(sock, addr)
+                    self.watch(conn)
+                    sel.register(sock, selectors.EVENT_READ, conn)
+                    self.connections_total.inc()
+        finally:
+            for key in list(sel.get_map().values()):
+                if key.data is not None:
+                    key.data.close(flush=False)
+            sel.close()
+
+    def forget_handshake(self, sel, sock):
+        # Stop waiting for the username of a connection closed elsewhere
+        try:
+            sel.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+        self.end_handshake()
+
+    def forget_closed_handshakes(self, sel):
+        # Connections closed by check_due_connections while waiting for
+        # their username are no longer reported by the selector, so sweep them
+        for key in list(sel.get_map().values()):
+            if key.data is not None and key.data.closed:
+                self.forget_handshake(sel, key.fileobj)
+
+    def drop_connection(self, sel, sock, state):
+        # Stop watching a client socket and release its player slot; the
+        # socket may already be closed
+        try:
+            sel.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+        self.handshake_done(state)
+        if state["username"] is None:
+            state["conn"].close(flush=False)
+        else:
+            self.unregister_client(state["username"], state["conn"])
+
+    def handshake_done(self, state):
+        if state["handshaking"]:
+            state["handshaking"] = False
+            self.end_handshake()
+
+    def forget_closed_connections(self, sel):
+        # Connections closed elsewhere (evicted by the fan-out, or by
+        # finish_game) are no longer reported by the selector, so sweep them
+        for key in list(sel.get_map().values()):
+            if key.data is not None and key.data["conn"].closed:
+                self.drop_connection(sel, key.fileobj, key.data)
+
+    def accept_selectors(self, s):
+        # Event-loop model: one thread multiplexes the listening socket and every
+        # client. Client sockets stay blocking; they are only read once the
+        # selector reports them ready, so recv never waits. Over the
+        # handshake rate, or with max_pending_handshakes unfinished, the
+        # listening socket is taken out of the selector and new connections
+        # wait in the listen backlog while players keep being served.
+        sel = selectors.DefaultSelector()
+        sel.register(s, selectors.EVENT_READ, None)
+        listening = True
+        bucket = TokenBucket(self.handshake_rate, self.handshake_rate)
+        next_sweep = 0.0
+
+        try:
+            while not self.shutdown_flag.is_set():
+                wait = bucket.delay()
+                admit = not wait and self.handshakes_pending < self.max_pending_handshakes
+                if admit != listening:
+                    if admit:
+                        sel.register(s, selectors.EVENT_READ, None)
+                    else:
+                        sel.unregister(s)
+                    listening = admit
+                try:
+                    events = sel.select(timeout=min(wait, 1.0) if wait else 1.0)
+                except OSError as e:
+                    if not self.shutdown_flag.is_set():
+                        self.log(f"Server socket error: {e}")
+                        self.finish_all_games("Server disconnected.")
+                    break
+
+                now = time.monotonic()
+                if now >= next_sweep:
+                    self.forget_closed_connections(sel)
+                    next_sweep = now + 1.0
+
+                for key, _ in events:
+                    # New connection on the listening socket
+                    if key.data is None:
+                        try:
+                            sock, addr = s.accept()
+                        except OSError as e:
+                            if not self.shutdown_flag.is_set():
+                                self.log(f"Server socket error: {e}")
+                                self.finish_all_games("Server disconnected.")
+                            return
+                        bucket.take()
+                        self.begin_handshake()
+                        sock.setblocking(True)
+                        # A recycled descriptor means the old socket was closed elsewhere
+                        stale = sel.get_map().get(sock.fileno())
+                        if stale is not None:
+                            self.drop_connection(sel, stale.fileobj, stale.data)
+                        state = {
+                            "username": None,
+                            "conn": self.fanout.connect(sock, addr),
+                            "framer": LineFramer(),
+                            "handshaking": True,
+                        }
+                        self.watch(state["conn"])
+                        sel.register(sock, selectors.EVENT_READ, state)
+                        self.connections_total.inc()
+                        continue
+
+                    sock = key.fileobj
+                    state = key.data
+                    conn = state["conn"]
+                    try:
+                        data = sock.recv(RECV_SIZE)
+                    except OSError as e:
+                        if state["username"] is not None and not self.expected_close(conn):
+                            self.log(f"{state['username']} connection error: {e}")
+                        self.drop_connection(sel, sock, state)
+                        continue
+
+                    # First message on a connection is the username handshake
+                    if state["username"] is None:
+                        name, data = split_handshake(data)
+                        username = self.register_client(conn, conn.addr, name)
+                        self.handshake_done(state)
+                        if username is None:
+                            self.drop_connection(sel, sock, state)
+                            continue
+                        state["username"] = username
+                        if not data:
+                            continue
+
+                    if not data:
+                        self.drop_connection(sel, sock, state)
+                        continue
+
+                    try:
+                        self.process_client_data(state["username"], conn, state["framer"], data)
+                    except FrameTooLong:
+                        self.log(f"{state['username']} sent an oversized message; disconnecting.")
+                        self.drop_connection(sel, sock, state)
+                    except Exception as e:
+                        if not self.expected_close(conn):
+                            self.log(f"{state['username']} connection error: {e}")
+                        self.drop_connection(sel, sock, state)
+        finally:
+            sel.close()
+
+    def serve_gateways(self):
+        # Coordinator model: gateway processes share the listening port and
+        # own every client socket; each forwards handshakes and framed lines
+        # and gets back what to send. A thread per gateway handles its
+        # events in the order they were sent.
+        try:
+            self.fanout.start(self.ip, self.port, self.listen_backlog, self.handshake_rate,
+                              self.max_pending_handshakes)
+        except OSError as e:
+            self.log(f"Could not start the gateways: {e}")
+            return
+        self.log(f"{len(self.fanout.links)} gateway processes are sharing the port.")
+
+        threads = [threading.Thread(target=self.serve_gateway, args=(link,)) for link in self.fanout.links]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def serve_gateway(self, link):
+        pool = self.fanout
+        while True:
+            item = link.receive()
+            if item is None:
+                break
+            event = item[0]
+            if event == "stats":
+                pool.report(link, item[1])
+                continue
+            if event == "written":
+                pool.written(link, item[1])
+                continue
+            if event == "pinged":
+                pool.pinged(link, item[1], item[2])
+                continue
+            if event == "open":
+                self.watch(pool.open(link, item[1], item[2]))
+                self.connections_total.inc()
+                self.begin_handshake()
+                continue
+
+            conn = pool.get(link, item[1])
+            if conn is None:
+                continue
+            if event == "hello":
+                conn.handshaking = False
+                try:
+                    self.register_client(conn, conn.addr, item[2])
+                finally:
+                    self.end_handshake()
+            elif event == "lines":
+                # Lines still in flight when the connection was closed, or
+                # after a rejected handshake, are dropped
+                if conn.closed or conn.username is None:
+                    continue
+                conn.last_heard = item[3]
+                try:
+                    for message in item[2]:
+                        self.process_message(conn.username, conn, message)
+                except Exception as e:
+                    if not self.expected_close(conn):
+                        self.log(f"{conn.username} connection error: {e}")
+                    conn.close(flush=False)
+            elif event == "closed":
+                self.gateway_connection_closed(conn, item[2])
+
+        # The gateway exited: so did its connections
+        if not self.shutdown_flag.is_set():
+            self.log("A gateway process exited; its players were disconnected.")
+        for conn in pool.drop_link(link):
+            self.gateway_connection_closed(conn, None)
+
+    def gateway_connection_closed(self, conn, reason):
+        self.fanout.closed(conn)
+        if conn.handshaking:
+            conn.handshaking = False
+            self.end_handshake()
+        if reason == "evicted":
+            self.fanout.evicted(conn)
+        if conn.username is None:
+            return
+        if reason == "oversized":
+            self.log(f"{conn.username} sent an oversized message; disconnecting.")
+        elif reason and not self.expected_close(conn):
+            self.log(f"{conn.username} connection error: {reason}")
+        self.unregister_client(conn.username, conn)
+
+    def server_loop(self):
+        self.log(f"Server has started listening ({self.io_mode} mode)")
+        if self.io_mode == "gateways":
+            self.serve_gateways()
+            return
+
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            self.server_sock = s
+
+            # A restarted server can take its port back while connections of
+            # the previous process linger in TIME_WAIT (on Windows this option
+            # would let two servers share the port, so it is left off there)
+            if os.name != "nt":
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind((self.ip, self.port))
+            s.listen(self.listen_backlog)
+            s.settimeout(1.0)
+            self.fanout.start()
+
+            if self.io_mode == "selectors":
+                self.accept_selectors(s)
+            else:
+                self.accept_threads(s)
+
+    def start_server(self):
+        if self.io_mode == "gateways":
+            self.fanout = GatewayPool(self.gateways, self.max_queue_bytes, on_evict=self.on_slow_consumer)
+        self.resume_games()
+        if self.idle_timeout or self.handshake_timeout:
+            self.deadlines.call_later(HEARTBEAT_TICK, self.check_connections)
+        if self.metrics_port and self.metrics_httpd is None:
+            try:
+                self.metrics_httpd = serve_metrics(self.metrics, self.metrics_ip, self.metrics_port)
+                self.log(f"Metrics available at http://{self.metrics_ip}:{self.metrics_port}/metrics")
+            except OSError as e:
+                self.log(f"Could not start the metrics endpoint: {e}")
+        threading.Thread(target=self.server_loop).start()
+
+    def finish_all_games(self, reason=None):
+        for room in self.room_list():
+            room.finish_game(reason)
+
+    def shutdown(self):
+        self.shutdown_flag.set()
+        for room in self.room_list():
+            with room.lock:
+                room.round_done.notify_all()
+        self.finish_all_games("Server shutting down.")
+        if self.server_sock:
+            try:
+                self.server_sock.close()
+            except:
+                pass
+        self.fanout.stop()
+        self.deadlines.stop()
+        self.room_jobs.put(None)
+        if self.results:
+            self.results.close()
+        if self.snapshots:
+            self.snapshots.close()
+        if self.metrics_httpd:
+            self.metrics_httpd.shutdown()
+            self.metrics_httpd.server_close()
+
+    def log_backpressure(self):
+        # Report slow consumers once per round, only when some are backlogged
+        # or were evicted since the last report
+        stats = self.fanout.stats()
+        evicted = stats["evictions"] > self.logged_evictions
+        self.logged_evictions = stats["evictions"]
+        if stats["backlogged_connections"] or evicted:
+            self.log(
+                f"Outbound backlog: {stats['backlogged_connections']} slow clients, "
+                f"{stats['queued_bytes']} bytes queued (max {stats['max_backlog_bytes']}), "
+                f"{stats['evictions']} evicted so far."
+            )
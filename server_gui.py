@@ -0,0 +1,203 @@
+# Tkinter front-end for the SUquid quiz server.
+#
+# The GUI only collects settings and renders what the engine reports;
+# all game and networking logic lives in quiz_engine.QuizServer.
+import threading
+import tkinter as tk
+
+from log_view import LogView
+from quiz_engine import DEFAULT_ROOM, IO_MODES
+
+# How often the newest scoreboard reported by the engine is drawn
+SCOREBOARD_INTERVAL_MS = 200
+
+# Room name -> newest ranking reported; rooms with an empty ranking, such as
+# discarded ones, have no entry. Scoreboard listeners run on engine
+# threads, and Tk widgets may only be touched on the main thread.
+scoreboard_lock = threading.Lock()
+latest_scoreboards = {}
+# (room name, ranking) last drawn
+painted = (None, None)
+
+
+def build_ui(root, server):
+    global engine, ip_entry, port_entry, question_count_entry
+    global file_path_entry, log_box, scoreboard_scores, scoreboard_names
+    global io_mode_choice, room_entry
+
+    engine = server
+
+    # Basic window configuration
+    root.title("SUquid Quiz Games | Server")
+
+    root.grid_columnconfigure(0, weight=0)
+    root.grid_columnconfigure(1, weight=1)
+    root.grid_columnconfigure(2, weight=3)
+    root.grid_rowconfigure(7, weight=1)
+
+    # Number of questions input
+    question_count_label = tk.Label(root, text="Number of Questions")
+    question_count_label.grid(row=0, column=0, sticky="w", padx=10, pady=10)
+    question_count_entry = tk.Entry(root, width=30)
+    question_count_entry.grid(row=0, column=1, sticky="ew", padx=10, pady=10)
+
+    # Question file path input
+    file_path_label = tk.Label(root, text="Question File Path")
+    file_path_label.grid(row=1, column=0, sticky="w", padx=10, pady=10)
+    file_path_entry = tk.Entry(root, width=30)
+    file_path_entry.insert(0, "quiz_qa.txt")
+    file_path_entry.grid(row=1, column=1, sticky="ew", padx=10, pady=10)
+
+    # Port input
+    port_label = tk.Label(root, text="Port Number")
+    port_label.grid(row=2, column=0, sticky="w", padx=10, pady=10)
+    port_entry = tk.Entry(root, width=30)
+    port_entry.grid(row=2, column=1, sticky="ew", padx=10, pady=10)
+    port_entry.insert(0, str(engine.port))
+
+    # IP input
+    ip_label = tk.Label(root, text="IP")
+    ip_label.grid(row=3, column=0, sticky="w", padx=10, pady=10)
+    ip_entry = tk.Entry(root, width=30)
+    ip_entry.grid(row=3, column=1, sticky="ew", padx=10, pady=10)
+    ip_entry.insert(0, engine.ip)
+
+    # Connection handling model
+    io_mode_label = tk.Label(root, text="I/O Mode")
+    io_mode_label.grid(row=4, column=0, sticky="w", padx=10, pady=10)
+    io_mode_choice = tk.StringVar(value=engine.io_mode)
+    io_mode_menu = tk.OptionMenu(root, io_mode_choice, *IO_MODES)
+    io_mode_menu.grid(row=4, column=1, sticky="ew", padx=10, pady=10)
+
+    # Room that Start Game and the scoreboard refer to
+    room_label = tk.Label(root, text="Room")
+    room_label.grid(row=5, column=0, sticky="w", padx=10, pady=10)
+    room_entry = tk.Entry(root, width=30)
+    room_entry.grid(row=5, column=1, sticky="ew", padx=10, pady=10)
+    room_entry.insert(0, DEFAULT_ROOM)
+
+    # Buttons for server and game control
+    button_frame = tk.Frame(root)
+    button_frame.grid(row=6, column=0, columnspan=2, pady=20)
+
+    start_listening_button = tk.Button(
+        button_frame, text="Start Listening", command=start_server, width=15
+    )
+    start_listening_button.pack(side=tk.LEFT, padx=5)
+
+    start_game_button = tk.Button(
+        button_frame, text="Start Game", command=start_game, width=15
+    )
+    start_game_button.pack(side=tk.LEFT, padx=5)
+
+    filepath_button = tk.Button(
+        button_frame, text="Open File", command=load_questions, width=15
+    )
+    filepath_button.pack(side=tk.RIGHT, padx=5)
+
+    # Log box showing server events
+    log_box = tk.Text(root, height=15)
+    log_box.grid(row=7, column=0, columnspan=2, sticky="nsew", padx=10, pady=10)
+    log_box.insert(tk.END, "Event Log\n")
+    log_box.config(state=tk.DISABLED)
+
+    # Scoreboard UI
+    tk.Label(root, text="Username").grid(row=1, column=4, sticky="ew", padx=20, pady=5)
+    scoreboard_names = tk.Text(root, height=30, width=20)
+    scoreboard_names.grid(row=2, column=4, rowspan=6, sticky="nsew", padx=20, pady=10)
+    scoreboard_names.config(state=tk.DISABLED)
+
+    tk.Label(root, text="Score").grid(row=1, column=5, sticky="ew", padx=20, pady=5)
+    scoreboard_scores = tk.Text(root, height=30, width=15)
+    scoreboard_scores.grid(row=2, column=5, rowspan=6, sticky="nsew", padx=20, pady=10)
+    scoreboard_scores.config(state=tk.DISABLED)
+
+    engine.scoreboard_listeners.append(refresh_scoreboard)
+    root.after(SCOREBOARD_INTERVAL_MS, paint_scoreboard, root)
+
+    # Engine log lines are rendered in batches on the Tk main thread
+    LogView(root, log_box, source=engine.log_queue)
+
+    # Clean shutdown when window is closed
+    root.protocol("WM_DELETE_WINDOW", lambda: handle_close(root))
+    root.mainloop()
+
+
+def read_question_count():
+    try:
+        return int(question_count_entry.get().strip())
+    except ValueError:
+        return None
+
+
+def load_questions():
+    question_count = read_question_count()
+    if question_count is None:
+        engine.log("Enter a valid number of questions.")
+        return []
+    return engine.load_questions(file_path_entry.get(), question_count)
+
+
+def start_game():
+    question_count = read_question_count()
+    if question_count is None:
+        engine.log("Enter a valid number of questions before starting.")
+        return
+    engine.start_game(question_count, file_path_entry.get(), selected_room())
+
+
+def start_server():
+    try:
+        port = int(port_entry.get())
+    except ValueError:
+        engine.log("Enter a valid port number.")
+        return
+    engine.ip = ip_entry.get()
+    engine.port = port
+    engine.io_mode = io_mode_choice.get()
+    engine.start_server()
+
+
+def selected_room():
+    return room_entry.get().strip().lower() or DEFAULT_ROOM
+
+
+def refresh_scoreboard(room_name, ranked):
+    # Engine threads: later rankings of a room replace unpainted ones
+    with scoreboard_lock:
+        if ranked:
+            latest_scoreboards[room_name] = ranked
+        else:
+            latest_scoreboards.pop(room_name, None)
+
+
+def paint_scoreboard(root):
+    # Tk main thread: only the room picked in the Room entry is shown, and
+    # it is redrawn when its ranking changes or another room is picked
+    global painted
+    room_name = selected_room()
+    with scoreboard_lock:
+        ranked = latest_scoreboards.get(room_name, ())
+    if room_name != painted[0] or ranked is not painted[1]:
+        painted = (room_name, ranked)
+        draw_scoreboard(ranked)
+    root.after(SCOREBOARD_INTERVAL_MS, paint_scoreboard, root)
+
+
+def draw_scoreboard(ranked):
+    scoreboard_names.config(state=tk.NORMAL)
+    scoreboard_names.delete(1.0, tk.END)
+    scoreboard_scores.config(state=tk.NORMAL)
+    scoreboard_scores.delete(1.0, tk.END)
+
+    for rank, u, score in ranked:
+        scoreboard_names.insert(tk.END, f"{rank}. {u}\n")
+        scoreboard_scores.insert(tk.END, str(score) + "\n")
+
+    scoreboard_names.config(state=tk.DISABLED)
+    scoreboard_scores.config(state=tk.DISABLED)
+
+
+def handle_close(root):
+    engine.shutdown()
+    root.destroy()
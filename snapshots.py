@@ -0,0 +1,110 @@
+# Game-state snapshots for resuming games after a server restart.
+#
+# A running room hands its state to SnapshotStore.save() at every round
+# boundary: the questions, the next question to ask, each player's score
+# and session token. The store keeps only the newest state per room and a
+# background thread writes it as compact JSON (temporary file, fsync,
+# rename), so the game thread never waits for the disk and a crash leaves
+# either the previous snapshot or the new one, never a torn file. A
+# restarted server reads them back with load_all() and resumes each game
+# from its next question; rooms whose game finished have their snapshot
+# removed, while a server shutting down keeps the snapshots of the games
+# it interrupts.
+import json
+import os
+import threading
+
+SNAPSHOT_VERSION = 1
+
+SUFFIX = ".snapshot.json"
+
+
+class SnapshotStore:
+
+    def __init__(self, directory, on_error=None):
+        # on_error is called with exceptions raised while writing
+        self.directory = directory
+        self.on_error = on_error
+        os.makedirs(directory, exist_ok=True)
+
+        self.cond = threading.Condition()
+        self.pending = {}           # room name -> newest state, or None to remove its snapshot
+        self.stopped = False
+        self.written = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def path(self, room_name):
+        return os.path.join(self.directory, room_name + SUFFIX)
+
+    def save(self, room_name, state):
+        # state must not be modified afterwards; an unwritten older state
+        # of the same room is simply replaced
+        with self.cond:
+            self.pending[room_name] = state
+            self.cond.notify()
+
+    def discard(self, room_name):
+        with self.cond:
+            self.pending[room_name] = None
+            self.cond.notify()
+
+    def load_all(self):
+        # {room name: state} for every readable snapshot in the directory
+        states = {}
+        for entry in sorted(os.listdir(self.directory)):
+            if not entry.endswith(SUFFIX):
+                continue
+            try:
+                with open(os.path.join(self.directory, entry), "rb") as f:
+                    state = json.loads(f.read())
+            except (OSError, ValueError) as e:
+                if self.on_error is not None:
+                    self.on_error(e)
+                continue
+            if state.get("version") == SNAPSHOT_VERSION:
+                states[state["room"]] = state
+        return states
+
+    def close(self, timeout=5.0):
+        # Write what is pending and stop the writer thread
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        self.thread.join(timeout)
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.stopped:
+                    self.cond.wait()
+                if not self.pending:
+                    return
+                batch = self.pending
+                self.pending = {}
+            for room_name, state in batch.items():
+                try:
+                    if state is None:
+                        self.remove(room_name)
+                    else:
+                        self.write(room_name, state)
+                except OSError as e:
+                    if self.on_error is not None:
+                        self.on_error(e)
+
+    def write(self, room_name, state):
+        path = self.path(room_name)
+        tmp = path + ".tmp"
+        data = json.dumps(state, separators=(",", ":")).encode()
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self.written += 1
+
+    def remove(self, room_name):
+        try:
+            os.remove(self.path(room_name))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,264 @@
+# Headless asyncio client library for the SUquid quiz protocol.
+#
+#   client = SquidClient("127.0.0.1", 5004, "alice")
+#   await client.connect()
+#   async for event in client.events():
+#       if isinstance(event, Question):
+#           await client.submit_answer("A")
+#       elif isinstance(event, GameOver):
+#           break
+#   await client.close()
+#
+# Each SquidClient is one coroutine-driven session: a reader task decodes
+# incoming bytes (protocol.Decoder), turns protocol messages into the event
+# tuples below and puts them on an asyncio.Queue. Protocol v2 frames are
+# negotiated by default, so questions and usernames arrive intact whatever
+# characters they contain; pass caps without "v2" to speak the text lines.
+# No threads are used, so a single event loop can drive hundreds of
+# sessions. The client keeps the scoreboard itself, applying SCOREDELTA
+# patches, so every Scoreboard event carries the full known ranking
+# whichever format the server sent. Its entries are the client's live
+# table, which later deltas update in place; ranked_rows(event.entries)
+# gives the ordered rows, copy it to keep a snapshot.
+#
+# Every event ends with "at", the time.monotonic() at which its message was
+# read from the socket. The server's heartbeat PINGs are answered by the
+# reader task, so a session that is idle between events is not taken for a
+# dead connection.
+#
+# The server gives each player a session token. After a Disconnected event
+# mid-game, resume() reconnects with it and the player continues where they
+# left off: a Resumed event carries their score and the open question, and
+# events() can be iterated again.
+import asyncio
+import collections
+import time
+
+from protocol import MAX_MESSAGE_BYTES, Decoder
+
+# Scoreboards of very large lobbies exceed the server's inbound limit
+MAX_LINE_BYTES = MAX_MESSAGE_BYTES
+
+RECV_SIZE = 64 * 1024
+
+CHOICES = ("A", "B", "C")
+
+# Handshake replies after which the server closes the connection
+REJECTIONS = ("GAME_ALREADY_STARTED", "ROOM_FULL", "LOBBY_FULL", "ERROR:BAD_ROOM_NAME", "ERROR:BAD_SESSION")
+
+# Optional protocol features announced after the handshake
+DEFAULT_CAPS = ("scoredelta", "timer", "resume", "v2", "heartbeat")
+
+Question = collections.namedtuple("Question", "text a b c at")
+Result = collections.namedtuple("Result", "correct text at")
+Scoreboard = collections.namedtuple("Scoreboard", "entries total at")  # entries: {username: (rank, score)}
+MyRank = collections.namedtuple("MyRank", "rank score total at")
+TimeLeft = collections.namedtuple("TimeLeft", "seconds deadline at")   # deadline: monotonic close time
+Resumed = collections.namedtuple("Resumed", "score answered question at")  # question: Question or None
+PlayerLeft = collections.namedtuple("PlayerLeft", "usernames at")      # usernames: players who left together
+GameOver = collections.namedtuple("GameOver", "at")
+Notice = collections.namedtuple("Notice", "text at")                  # any other server line
+ServerError = collections.namedtuple("ServerError", "code at")        # ERROR:... replies
+Disconnected = collections.namedtuple("Disconnected", "reason at")    # always the last event
+
+
+class JoinRejected(Exception):
+    pass
+
+
+def apply_scoreboard(rows, message):
+    # Apply one scoreboard, scoretop or scoredelta Message to rows
+    # ({username: (rank, score)}). Returns (rows, total players), where
+    # rows may be a new dict.
+    if message.kind == "scoredelta":
+        changed, removed, total = message.fields
+        for rank, name, score in changed:
+            rows[name] = (rank, score)
+        for name in removed:
+            rows.pop(name, None)
+        return rows, total
+    rows = {name: (rank, score) for rank, name, score in message.fields[0]}
+    total = message.fields[1] if message.kind == "scoretop" else len(rows)
+    return rows, total
+
+
+def ranked_rows(rows):
+    # {username: (rank, score)} -> [(rank, username, score)] in rank order
+    return sorted(((rank, name, score) for name, (rank, score) in rows.items()),
+                  key=lambda row: row[0])
+
+
+class SquidClient:
+
+    def __init__(self, host, port, username, room=None, caps=DEFAULT_CAPS):
+        self.host = host
+        self.port = port
+        self.username = username.strip().lower()
+        self.room = room
+        self.caps = tuple(caps)
+
+        self.reader = None
+        self.writer = None
+        self.reader_task = None
+        self.queue = asyncio.Queue()
+        self.connected = False
+        self.welcomed = None            # future resolved by the Welcome line
+
+        # Protocol state kept up to date by the reader task
+        self.question = None            # last Question event
+        self.scoreboard = {}            # username -> (rank, score)
+        self.total_players = 0
+        self.my_rank = None             # last MyRank event
+        self.deadline = None            # monotonic time the current question closes, if limited
+        self.session = None             # token for resume(), sent by the server
+
+    async def connect(self, timeout=10.0):
+        # Open the connection and complete the handshake. Raises
+        # JoinRejected if the server refuses the player, OSError if it
+        # cannot be reached.
+        await self.open(self.username + (f"@{self.room}" if self.room else "") + "\n", timeout)
+
+    async def resume(self, timeout=10.0):
+        # Reconnect with the session token and take the player's place back.
+        # Raises JoinRejected if the server no longer knows the session
+        # (e.g. the game is over).
+        if self.session is None:
+            raise ConnectionError("no session to resume")
+        if self.connected:
+            await self.close()
+        await self.open(f"RESUME:{self.session}\n", timeout)
+
+    async def open(self, hello, timeout):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.connected = True
+        self.welcomed = asyncio.get_running_loop().create_future()
+
+        if self.caps:
+            hello += f"CAPS:{','.join(self.caps)}\n"
+        self.writer.write(hello.encode())
+        self.reader_task = asyncio.ensure_future(self.read_loop())
+
+        try:
+            await asyncio.wait_for(asyncio.shield(self.welcomed), timeout)
+        except BaseException:
+            self.welcomed.cancel()
+            await self.close()
+            raise
+
+    async def submit_answer(self, choice):
+        choice = choice.strip().upper()
+        if choice not in CHOICES:
+            raise ValueError(f"answer must be one of {', '.join(CHOICES)}")
+        if not self.connected:
+            raise ConnectionError("not connected")
+        self.writer.write(f"ANSWER:{choice}\n".encode())
+        await self.writer.drain()
+
+    async def next_event(self):
+        return await self.queue.get()
+
+    async def events(self):
+        # Yield events until (and including) Disconnected
+        while True:
+            event = await self.queue.get()
+            yield event
+            if isinstance(event, Disconnected):
+                return
+
+    async def close(self):
+        if self.reader_task is not None and self.reader_task is not asyncio.current_task():
+            self.reader_task.cancel()
+            try:
+                await self.reader_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.disconnected("closed by client")
+
+    def disconnected(self, reason):
+        if not self.connected:
+            return
+        self.connected = False
+        if self.welcomed is not None and not self.welcomed.done():
+            self.welcomed.set_exception(ConnectionError(reason))
+        self.queue.put_nowait(Disconnected(reason, time.monotonic()))
+
+    async def read_loop(self):
+        decoder = Decoder(MAX_LINE_BYTES)
+        reason = "server closed the connection"
+        try:
+            while True:
+                data = await self.reader.read(RECV_SIZE)
+                if not data:
+                    break
+                now = time.monotonic()
+                for message in decoder.feed(data):
+                    self.handle_message(message, now)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            reason = f"connection error: {e}"
+        self.disconnected(reason)
+
+    def handle_message(self, message, now):
+        kind = message.kind
+        fields = message.fields
+        event = None
+
+        if kind in ("scoreboard", "scoretop", "scoredelta"):
+            self.scoreboard, self.total_players = apply_scoreboard(self.scoreboard, message)
+            event = Scoreboard(self.scoreboard, self.total_players, now)
+        elif kind == "myrank":
+            event = self.my_rank = MyRank(*fields, now)
+        elif kind == "question":
+            event = self.question = Question(*fields, now)
+            self.deadline = None
+        elif kind == "timeleft":
+            self.deadline = now + fields[0]
+            event = TimeLeft(fields[0], self.deadline, now)
+        elif kind == "result":
+            self.deadline = None
+            event = Result(fields[0], fields[1], now)
+        elif kind == "gameover":
+            self.question = None
+            self.deadline = None
+            event = GameOver(now)
+        elif kind == "left":
+            event = PlayerLeft(fields[0], now)
+        elif kind == "welcome":
+            if not self.welcomed.done():
+                self.welcomed.set_result(None)
+            return
+        elif kind == "ping":
+            # Heartbeat; answered without an event, echoing its stamp
+            self.writer.write(f"PONG:{fields[0]}\n".encode())
+            return
+        elif kind == "session":
+            self.session = fields[0]
+            return
+        elif kind == "resumed":
+            score, answered, seconds, question = fields
+            if question:
+                question = self.question = Question(*question, now)
+                self.deadline = now + seconds if seconds else None
+            event = Resumed(score, answered, question or None, now)
+            if not self.welcomed.done():
+                self.welcomed.set_result(None)
+        elif kind in ("notice", "error") and (
+            message.text() in REJECTIONS or message.text().startswith("The name ")
+        ):
+            if not self.welcomed.done():
+                self.welcomed.set_exception(JoinRejected(message.text()))
+            return
+        elif kind == "error":
+            event = ServerError(fields[0], now)
+        elif kind == "notice":
+            event = Notice(fields[0], now)
+
+        if event is not None:
+            self.queue.put_nowait(event)